@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+
+# Vectorized simulation of many independent platooning scenarios at once.
+
+import math
+import sys
+import time
+import numpy as np
+
+import path
+import translator
+import fleetpid
+
+
+class BatchSimulator:
+    """Simulation of M independent scenarios with a platoon of N trucks each,
+    where truck 0 is the leader and every other truck follows the truck in
+    front of it. The states of all M*N trucks are kept in (M, N) arrays and
+    each step advances all of them with one set of numpy operations, so
+    thousands of scenarios can be simulated together.
+
+    The trucks follow the reference path with the FrenetPID control law, see
+    fleetpid.FleetFrenetPID, and the followers control the time gap to the
+    truck in front with the velocity PID of controller_platooning.Controller.
+    The trucks move as the kinematic bicycle model of
+    simulator.SimulatedTruck. The speed pwms are translated to speeds with the
+    Translator tables, while the wheel angle is the one that gives the angular
+    velocity omega, limited to the sharpest turns in the Translator tables.
+
+    The path gains k_p, k_i and k_d can be scalars or arrays of shape (M, N),
+    the velocity gains k_pv, k_iv, k_dv and e_ref scalars or arrays of shape
+    (M,). x, y and yaw are (M, N) arrays of the start positions. If noise is
+    given, gaussian noise with that standard deviation is added to the
+    positions the controllers see. If sum_max is given the accumulated errors
+    of all controllers are limited to +-sum_max to prevent windup. """
+    def __init__(self, pt, x, y, yaw, dt = 0.05, v = 0.89,
+        k_p = 0.5, k_i = -0.02, k_d = 3,
+        k_pv = 10, k_iv = 1, k_dv = 5, e_ref = 0.5,
+        distance_offset = 0.4, pwm_min = 1400, pwm_max = 1460, vlim = 0.5,
+        sum_max = None, noise = 0, seed = 0):
+
+        self.x = np.array(x, dtype = float)         # Positions.
+        self.y = np.array(y, dtype = float)
+        self.yaw = np.array(yaw, dtype = float)     # Angles of trucks.
+        self.M, self.N = self.x.shape               # Scenarios and trucks.
+        self.v = np.zeros((self.M, self.N))         # Speeds.
+        self.alpha = np.zeros((self.M, self.N))     # Wheel angles.
+
+        self.pt = pt                # Reference path.
+        self.dt = dt                # Time step.
+        self.time = 0               # Simulated time.
+        self.l = 0.27               # Length between wheel pairs.
+
+        # Path following controllers of all trucks.
+        self.fleet = fleetpid.FleetFrenetPID(pt, self.M*self.N,
+            freq = 1./dt, sum_max = sum_max)
+        self.fleet.k_p = (np.zeros((self.M, self.N)) + k_p).ravel()
+        self.fleet.k_i = (np.zeros((self.M, self.N)) + k_i).ravel()
+        self.fleet.k_d = (np.zeros((self.M, self.N)) + k_d).ravel()
+
+        # Velocity PID parameters, one per scenario.
+        self.k_pv = np.zeros(self.M) + k_pv
+        self.k_iv = np.zeros(self.M) + k_iv
+        self.k_dv = np.zeros(self.M) + k_dv
+        self.e_ref = np.zeros(self.M) + e_ref
+
+        self.distance_offset = distance_offset
+        self.pwm_min = pwm_min
+        self.pwm_max = pwm_max
+        self.vlim = vlim
+        self.sum_max = sum_max      # Limit of the accumulated errors.
+
+        # Velocity PID states of the followers.
+        self._old_e_rel = np.zeros((self.M, self.N - 1))
+        self._sum_e = np.zeros((self.M, self.N - 1))
+
+        self.translator = translator.Translator()
+        self._lead_pwm = int(self.translator.get_speed(v))
+
+        # Wheel angles of the sharpest measured turns.
+        self.alpha_min = self.translator.alphas[0][1]
+        self.alpha_max = self.translator.alphas[-1][1]
+
+        # Speed measurements by increasing pwm for the inverse translation.
+        speeds = sorted(self.translator.speeds)
+        self._speed_pwms = np.array([s[0] for s in speeds], dtype = float)
+        self._speed_values = np.array([s[1] for s in speeds], dtype = float)
+
+        self.noise = noise
+        self._rand = np.random.RandomState(seed)
+
+        # Sums of the squared errors and the number of samples, for the RMS.
+        self._sum_ey2 = np.zeros((self.M, self.N))
+        self._sum_gap2 = np.zeros((self.M, self.N - 1))
+        self._gap_count = np.zeros((self.M, self.N - 1))
+        self.steps = 0
+
+
+    def step(self):
+        """Calculates the control inputs of all trucks and moves them forward
+        one time step. """
+        x = self.x
+        y = self.y
+        if self.noise > 0:
+            x = x + self._rand.normal(0, self.noise, x.shape)
+            y = y + self._rand.normal(0, self.noise, y.shape)
+
+        # Path following.
+        proj = self.pt.project_batch(np.column_stack((x.ravel(), y.ravel())))
+        omega = self.fleet.get_omega(x.ravel(), y.ravel(), self.yaw.ravel(),
+            self.v.ravel(), proj).reshape(self.M, self.N)
+
+        ey = proj.ey.reshape(self.M, self.N)
+        self._sum_ey2 += ey**2
+
+        # Speed control of the leaders and the followers.
+        indices = proj.index.reshape(self.M, self.N)
+        pwm = np.zeros((self.M, self.N))
+        pwm[:, 0] = self._bound_pwm(self._lead_pwm)
+
+        for j in range(1, self.N):
+            active = self.v[:, j - 1] >= self.vlim
+            distance = self.pt.get_distance_from_indices_batch(
+                indices[:, j - 1], indices[:, j])
+
+            u = self._get_velocity(j - 1, distance, self.v[:, j], active)
+            pwm[:, j] = np.where(active,
+                                 self._bound_pwm(pwm[:, j - 1] - u), 1500)
+
+        # Move the trucks with the new inputs.
+        self.v = self._speed_from_pwm(pwm)
+        self.alpha = self._alpha_from_omega(omega, self.v)
+
+        beta = np.arctan(np.tan(self.alpha)/2)
+        self.x = self.x + self.v*np.cos(self.yaw + beta)*self.dt
+        self.y = self.y + self.v*np.sin(self.yaw + beta)*self.dt
+        self.yaw = np.mod(self.yaw +
+            self.v*np.cos(beta)*np.tan(self.alpha)/self.l*self.dt, 2*math.pi)
+
+        self.time = self.time + self.dt
+        self.steps += 1
+
+
+    def run(self, duration):
+        """Runs the simulation for the time duration. """
+        for i in range(int(round(duration/self.dt))):
+            self.step()
+
+
+    def _get_velocity(self, k, distance, vel, active):
+        """Used internally. Returns the speed pwm offsets of the followers
+        k + 1 of all scenarios given the distances to the trucks in front,
+        as controller_platooning.Controller._get_velocity(). Only the
+        scenarios where active is True are updated. """
+        e_dist = distance - self.distance_offset
+        e_time = np.where(vel != 0, e_dist/np.where(vel != 0, vel, 1), e_dist)
+
+        e_rel = self.e_ref - e_time
+        e_p = e_rel - self._old_e_rel[:, k]
+
+        self._old_e_rel[:, k] = np.where(active, e_rel, self._old_e_rel[:, k])
+        sum_e = self._sum_e[:, k] + e_rel
+        if self.sum_max is not None:
+            sum_e = np.clip(sum_e, - self.sum_max, self.sum_max)
+        self._sum_e[:, k] = np.where(active, sum_e, self._sum_e[:, k])
+
+        self._sum_gap2[:, k] += np.where(active, e_rel**2, 0)
+        self._gap_count[:, k] += active
+
+        # PID controller.
+        u = - self.k_pv*e_rel - self.k_dv*e_p - self.k_iv*self._sum_e[:, k]
+        u = u - 10*self.k_pv*np.where(e_rel > 0, e_rel, 0)
+
+        return u
+
+
+    def _bound_pwm(self, pwm):
+        """Used internally. Returns the pwms within the minimum and maximum
+        values. """
+        return np.clip(pwm, self.pwm_min, self.pwm_max)
+
+
+    def _speed_from_pwm(self, pwm):
+        """Used internally. Returns the speeds that the speed pwms give, see
+        Translator.get_speed_from_pwm(). """
+        return np.interp(pwm, self._speed_pwms, self._speed_values)
+
+
+    def _alpha_from_omega(self, omega, vel):
+        """Used internally. Returns the wheel angles that give the angular
+        velocities omega at the speeds vel, from the turning radius of the
+        middle point as in Translator. """
+        r2 = (vel/np.where(omega != 0, omega, 1))**2 - (self.l/2)**2
+        alpha = np.arctan(self.l/np.sqrt(np.where(r2 > 0, r2, 1e-12)))
+        alpha = np.where(omega != 0, alpha*np.sign(omega), 0)
+
+        return np.clip(alpha, self.alpha_min, self.alpha_max)
+
+
+    def get_lateral_rms(self):
+        """Returns an (M, N) array of the RMS of the y errors of each truck
+        so far. """
+        return np.sqrt(self._sum_ey2/max(1, self.steps))
+
+
+    def get_gap_rms(self):
+        """Returns an (M, N - 1) array of the RMS of the time gap errors of
+        the followers so far, counted while they are driving. """
+        return np.sqrt(self._sum_gap2/np.maximum(1, self._gap_count))
+
+
+def main(args):
+    """Simulates M platoon scenarios with random start positions, noise and
+    gains and prints the throughput. """
+    M = 1000
+    if len(args) > 1:
+        M = int(args[1])
+    N = 2
+    duration = 60
+
+    # Data for reference path.
+    x_radius = 1.7
+    y_radius = 1.2
+    center = [0.3, -1.3]
+
+    pt = path.EllipsePath()
+    pt.gen_circle_path([x_radius, y_radius], 400, center)
+
+    # Leaders at angle 0 on the ellipse and followers behind, with random
+    # offsets.
+    rand = np.random.RandomState(0)
+    theta = np.zeros((M, N))
+    theta[:, 1] = - rand.uniform(0.4, 0.8, M)
+    x = center[0] + x_radius*np.cos(theta) + rand.normal(0, 0.1, (M, N))
+    y = center[1] + y_radius*np.sin(theta) + rand.normal(0, 0.1, (M, N))
+    yaw = np.arctan2(y_radius*np.cos(theta), - x_radius*np.sin(theta))
+
+    sim = BatchSimulator(pt, x, y, yaw, noise = 0.005,
+        k_p = rand.uniform(0.25, 1, (M, 1)),
+        k_d = rand.uniform(1.5, 6, (M, 1)),
+        k_pv = rand.uniform(5, 20, M), k_dv = rand.uniform(2.5, 10, M))
+
+    start = time.time()
+    sim.run(duration)
+    elapsed = time.time() - start
+
+    print('Simulated {} scenarios of {:.0f} s in {:.2f} s, {:.0f} scenarios '\
+        'per minute.'.format(M, sim.time, elapsed, M*60/elapsed))
+
+    lateral = sim.get_lateral_rms()
+    gap = sim.get_gap_rms()
+    print('Lateral error RMS median {:.3f} m, max {:.3f} m.'.format(
+        np.median(lateral), np.max(lateral)))
+    print('Time gap error RMS median {:.3f} s, max {:.3f} s.'.format(
+        np.median(gap), np.max(gap)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
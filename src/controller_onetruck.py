@@ -8,6 +8,7 @@ import time
 from platoon.msg import truckmocap
 from platoon.msg import truckcontrol
 import path
+import pathcache
 import translator
 import frenetpid
 
@@ -16,10 +17,11 @@ class Controller():
     send commands to the truck. """
     def __init__(self, node_name, topic_type, topic_name,
         truck_topic_type, truck_topic_name,
-        v = 0, k_p = 0, k_i = 0, k_d = 0, truck_id = 2):
+        v = 0, k_p = 0, k_i = 0, k_d = 0, truck_id = 2, sum_max = None,
+        publisher = None, verbose = True):
 
         # List of strings used by the GUI to see which values it can adjust.
-        self.adjustables = ['k_p', 'k_i', 'k_d', 'v']
+        self.adjustables = ['k_p', 'k_i', 'k_d', 'v', 'sum_max']
 
         # Velocity of the truck and PID parameters.
         self.v = v
@@ -42,23 +44,35 @@ class Controller():
         self.topic_type = topic_type
 
         self.running = False    # Controlling if controller is running or not.
-
-        # Setup subscriber node.
-        rospy.init_node(self.node_name, anonymous = True)
-        rospy.Subscriber(self.topic_name, self.topic_type, self._callback)
-        self.pub = rospy.Publisher(truck_topic_name, truck_topic_type,
-            queue_size = 1)
+        self.verbose = verbose  # Print information while running.
+
+        # Setup subscriber node. If a publisher is given, e.g. a simulator, it
+        # is used instead and no ROS node is started.
+        if publisher is None:
+            rospy.init_node(self.node_name, anonymous = True)
+            rospy.Subscriber(self.topic_name, self.topic_type, self._callback)
+            self.pub = rospy.Publisher(truck_topic_name, truck_topic_type,
+                queue_size = 1)
+        else:
+            self.pub = publisher
 
         # Create reference path object, translator, and sender.
-        self.pt = path.Path()
+        self.pt = path.EllipsePath()
         self.translator = translator.Translator()
 
-        # Create frenet controller.
-        self.frenet = frenetpid.FrenetPID(self.pt, k_p, k_i, k_d)
+        # Previously generated reference paths.
+        self.path_cache = pathcache.PathCache()
+
+        # Create frenet controller. sum_max limits the accumulated errors to
+        # prevent windup, None for no limit.
+        self.frenet = frenetpid.FrenetPID(self.pt, k_p, k_i, k_d,
+                                          sum_max = sum_max)
 
         self.v_pwm = self.translator.get_speed(self.v) # PWM velocity.
 
-        print('\nController initialized. Truck {}.\n'.format(self.truck_id))
+        if self.verbose:
+            print('\nController initialized. Truck {}.\n'.format(
+                self.truck_id))
 
 
     def _callback(self, data):
@@ -76,15 +90,15 @@ class Controller():
 
         timestamp = data.timestamp
 
-        self._control(x, y, yaw, vel)
+        self._control(x, y, yaw, vel, timestamp)
 
 
-    def _control(self, x, y, yaw, vel):
+    def _control(self, x, y, yaw, vel, timestamp = None):
         """Perform control actions from received data. Sends new values to
-        truck. """
+        truck. timestamp is the time of the data in seconds, if known. """
         if self.running:
 
-            omega = self.frenet.get_omega(x, y, yaw, vel)
+            omega = self.frenet.get_omega(x, y, yaw, vel, timestamp)
 
             angle = int(self.translator.get_angle(omega, vel))
             self.v_pwm = self.translator.get_speed(self.v) # pwm value.
@@ -104,7 +118,8 @@ class Controller():
 
         if self.running:
             self.running = False
-            print('Controller stopped.\n')
+            if self.verbose:
+                print('Controller stopped.\n')
 
 
     def start(self):
@@ -114,7 +129,8 @@ class Controller():
             return
         if not self.running:
             self.running = True
-            print('Controller started.')
+            if self.verbose:
+                print('Controller started.')
 
 
     def set_adjustables(self, values):
@@ -126,11 +142,13 @@ class Controller():
             k_i = float(values[1])
             k_d = float(values[2])
             v = float(values[3])
+            sum_max = frenetpid.parse_sum_max(values[4])
 
         except:
             print('\nInvalid control parameters entered.')
             return
 
+        self.frenet.sum_max = sum_max
         self.frenet.set_pid(k_p, k_i, k_d)
         self.v = v
         self.v_pwm = self.translator.get_speed(self.v)
@@ -146,11 +164,13 @@ class Controller():
         parameters. """
         k_p, k_i, k_d = self.frenet.get_pid()
 
-        return self.adjustables, [k_p, k_i, k_d, self.v]
+        return self.adjustables, [k_p, k_i, k_d, self.v, self.frenet.sum_max]
 
 
     def set_reference_path(self, radius, center = [0, 0], pts = 400):
-        """Sets a new reference ellipse path. """
+        """Sets a new reference ellipse path. The path is built completely
+        before it replaces the old one, so the running controller never sees
+        a partly built path. """
         if isinstance(radius, list):
             if len(radius) > 1:
                 self.xr = radius[0]
@@ -164,7 +184,20 @@ class Controller():
 
         self.xc = center[0]
         self.yc = center[1]
-        self.pt.gen_circle_path([self.xr, self.yr], pts, [self.xc, self.yc])
+
+        self._swap_path([self.xr, self.yr], pts, [self.xc, self.yc])
+
+
+    def _swap_path(self, radius, pts, center):
+        """Builds a reference path and swaps it in. The path from the cache is
+        frozen. A new Frenet PID controller for the path is built first and
+        then replaces the old one with a single assignment, so no locking is
+        needed. It continues with the gains, settings and errors of the old
+        one, see FrenetPID.with_path(). """
+        pt = self.path_cache.get_ellipse(radius, pts, center)
+
+        self.frenet = self.frenet.with_path(pt)
+        self.pt = pt
 
 
     def run(self):
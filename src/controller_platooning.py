@@ -8,8 +8,10 @@ import time
 from platoon.msg import truckmocap
 from platoon.msg import truckcontrol
 import path
+import pathcache
 import translator
 import frenetpid
+import velocitypid
 
 class Controller():
     """Class for subscribing to topic mocap data, calculate control input and
@@ -21,33 +23,29 @@ class Controller():
         k_p2 = 0, k_i2 = 0, k_d2 = 0,
         k_pv = 0, k_iv = 0, k_dv = 0,
         e_ref = 0.5, distance_offset = 0.4, pwm_min = 1400, pwm_max = 1460,
-        follower = 2, vlim = 0.5):
+        follower = 2, vlim = 0.5, sum_max = None, publisher = None,
+        verbose = True):
 
         # List of strings used by the GUI to see which values it can adjust.
         self.adjustables = ['v_lead',
             'k_p1', 'k_i1', 'k_d1',
             'k_p2', 'k_i2', 'k_d2',
             'k_pv', 'k_iv', 'k_dv',
-            'e_ref']
+            'e_ref', 'sum_max']
 
         self.follower = follower    # The truck (1 or 2) that is follower.
 
-        # Velocity controller PID parameters.
-        self.k_pv = k_pv
-        self.k_iv = k_iv
-        self.k_dv = k_dv
-
-        self.sum_e = 0
+        # Velocity controller of the follower. sum_max limits the accumulated
+        # errors of the velocity and path controllers to prevent windup, None
+        # for no limit.
+        self.velocity = velocitypid.VelocityPID(k_pv, k_iv, k_dv, e_ref,
+            distance_offset, sum_max = sum_max)
 
         self.v_lead = v             # The desired speed of the leader truck.
 
-        self.e_ref = e_ref          #
-        self.distance_offset = distance_offset # Compensate for truck lengths.
         self.pwm_min = pwm_min      # Minimum safe pwm.
         self.pwm_max = pwm_max      # 1500 max to prevent backwards driving.
 
-        self.old_e_rel = 0          # Used for derivative of control error.
-
         self.vlim = vlim            # Min lead speed for which follower acts.
 
         # Radii and center for reference path ellipse.
@@ -61,24 +59,40 @@ class Controller():
         self.stop_angle2 = 1500
 
         self.running = False    # Controlling if controller is running or not.
-
-        # Setup subscriber node.
-        rospy.init_node(node_name, anonymous = True)
-        rospy.Subscriber(mocap_topic_name, mocap_topic_type, self._callback)
-        self.pub = rospy.Publisher(truck_topic_name, truck_topic_type,
-            queue_size = 1)
+        self.verbose = verbose  # Print information while running.
+
+        # Setup subscriber node. If a publisher is given, e.g. a simulator, it
+        # is used instead and no ROS node is started.
+        if publisher is None:
+            rospy.init_node(node_name, anonymous = True)
+            rospy.Subscriber(mocap_topic_name, mocap_topic_type,
+                self._callback)
+            self.pub = rospy.Publisher(truck_topic_name, truck_topic_type,
+                queue_size = 1)
+        else:
+            self.pub = publisher
 
         # Create reference path object, translator, and sender.
-        self.pt = path.Path()
+        self.pt = path.EllipsePath()
         self.translator = translator.Translator()
 
-        # Create Frenet PID controllers for path following for both trucks.
-        self.frenet1 = frenetpid.FrenetPID(self.pt, k_p1, k_i1, k_d1)
-        self.frenet2 = frenetpid.FrenetPID(self.pt, k_p2, k_i2, k_d2)
+        # Previously generated reference paths.
+        self.path_cache = pathcache.PathCache()
+
+        # Frenet PID controllers for path following for both trucks and
+        # closest point trackers of the trucks used for the distance between
+        # them. Kept in one tuple that the control loop reads once per frame,
+        # so that a new reference path replaces all of them at once.
+        self._followers = (
+            frenetpid.FrenetPID(self.pt, k_p1, k_i1, k_d1,
+                                sum_max = sum_max),
+            frenetpid.FrenetPID(self.pt, k_p2, k_i2, k_d2,
+                                sum_max = sum_max),
+            self.pt.tracker(), self.pt.tracker())
 
-        print('\nController vel initialized. Truck {} is follower. \n'.format(
-            self.follower
-        ))
+        if self.verbose:
+            print('\nController vel initialized. Truck {} is follower. \n'
+                .format(self.follower))
 
 
     def _callback(self, data):
@@ -95,19 +109,22 @@ class Controller():
 
         timestamp = data.timestamp
 
-        self._control(x1, y1, yaw1, vel1, x2, y2, yaw2, vel2)
+        self._control(x1, y1, yaw1, vel1, x2, y2, yaw2, vel2, timestamp)
 
 
-    def _control(self, x1, y1, yaw1, vel1, x2, y2, yaw2, vel2):
+    def _control(self, x1, y1, yaw1, vel1, x2, y2, yaw2, vel2,
+        timestamp = None):
         """Perform control actions from received data. Sends new values to
-        truck. """
+        truck. timestamp is the time of the data in seconds, if known. """
         if not self.running:
             return
 
-        omega1 = self.frenet1.get_omega(x1, y1, yaw1, vel1)
+        frenet1, frenet2, tracker1, tracker2 = self._followers
+
+        omega1 = frenet1.get_omega(x1, y1, yaw1, vel1, timestamp)
         angle1 = int(self.translator.get_angle(omega1, vel1))
 
-        omega2 = self.frenet2.get_omega(x2, y2, yaw2, vel2)
+        omega2 = frenet2.get_omega(x2, y2, yaw2, vel2, timestamp)
         angle2 = int(self.translator.get_angle(omega2, vel2))
 
         v_lead_pwm = int(self.translator.get_speed(self.v_lead))
@@ -119,7 +136,8 @@ class Controller():
             if vel1 < self.vlim:
                 v2_pwm = 1500
             else:
-                v2_pwm = v1_pwm - self._get_velocity(x1, y1, vel1, x2, y2, vel2)
+                v2_pwm = v1_pwm - self._get_velocity(x1, y1, vel1, x2, y2, vel2,
+                    tracker1, tracker2, timestamp)
                 v2_pwm = self._bound_pwm(v2_pwm)
 
         else:
@@ -129,11 +147,13 @@ class Controller():
             if vel2 < self.vlim:
                 v1_pwm = 1500
             else:
-                v1_pwm = v2_pwm - self._get_velocity(x2, y2, vel2, x1, y1, vel1)
+                v1_pwm = v2_pwm - self._get_velocity(x2, y2, vel2, x1, y1, vel1,
+                    tracker2, tracker1, timestamp)
                 v1_pwm = self._bound_pwm(v1_pwm)
 
 
-        print('pwm1: {:.0f}, pwm2: {:.0f}'.format(v1_pwm, v2_pwm))
+        if self.verbose:
+            print('pwm1: {:.0f}, pwm2: {:.0f}'.format(v1_pwm, v2_pwm))
 
         self.pub.publish(1, v1_pwm, angle1)
         self.pub.publish(2, v2_pwm, angle2)
@@ -153,34 +173,24 @@ class Controller():
         return pwm
 
 
-    def _get_velocity(self, x1, y1, vel1, x2, y2, vel2):
-        e_dist = self.pt.get_distance([x1, y1], [x2, y2])
-        try:
-            e_time = (e_dist - self.distance_offset) / vel2
-        except:
-            e_time = e_dist - self.distance_offset
-
-        e_rel = self.e_ref - e_time
+    def _get_velocity(self, x1, y1, vel1, x2, y2, vel2, tracker1, tracker2,
+        timestamp = None):
+        """Returns the speed pwm offset for the follower truck 2 given the
+        leader truck 1 from the velocity controller. The trackers are the
+        closest point trackers of the trucks, which both follow the same
+        path. """
+        index1, _ = tracker1.get_closest([x1, y1])
+        index2, _ = tracker2.get_closest([x2, y2])
+        # As a float, so that a zero speed raises ZeroDivisionError also when
+        # the path gives numpy values.
+        e_dist = float(tracker1.path.get_distance_from_indices(index1, index2))
 
-        e_p = e_rel - self.old_e_rel
-        self.old_e_rel = e_rel
+        vel = self.velocity.get_velocity(e_dist, vel2, timestamp)
 
-        k_p = self.k_pv
-        k_i = self.k_iv
-        k_d = self.k_dv
-
-        self.sum_e = self.sum_e + e_rel     # Accumulated error.
-
-        # PID controller.
-        u = - k_p*e_rel - k_d*e_p - k_i * self.sum_e
-        if e_rel > 0:
-            u = u - 10*k_p*e_rel
-
-        vel = u
-
-        print(
-           'Ctrl e: {:5.2f},  u: {:7.2f},  v1: {:5.2f}, v2: {:5.2f},'.format(
-           e_rel, u, vel1, vel2)),
+        if self.verbose:
+            print(
+                'Ctrl e: {:5.2f},  u: {:7.2f},  v1: {:5.2f}, v2: {:5.2f},'
+                .format(self.velocity.get_error(), vel, vel1, vel2)),
 
         return vel
 
@@ -209,7 +219,8 @@ class Controller():
 
         if self.running:
             self.running = False
-            print('Controller stopped.\n')
+            if self.verbose:
+                print('Controller stopped.\n')
 
 
     def start(self):
@@ -219,7 +230,8 @@ class Controller():
             return
         if not self.running:
             self.running = True
-            print('Controller started.')
+            if self.verbose:
+                print('Controller started.')
 
 
     def set_adjustables(self, values):
@@ -241,6 +253,7 @@ class Controller():
             k_iv = float(values[8])
             k_dv = float(values[9])
             e_ref = float(values[10])
+            sum_max = frenetpid.parse_sum_max(values[11])
 
         except:
             print('\nInvalid control parameters entered.')
@@ -248,17 +261,17 @@ class Controller():
 
         self.v_lead = v_lead
 
-        self.frenet1.set_pid(k_p1, k_i1, k_d1)
+        frenet1, frenet2 = self._followers[:2]
 
-        self.frenet2.set_pid(k_p2, k_i2, k_d2)
+        frenet1.sum_max = sum_max
+        frenet1.set_pid(k_p1, k_i1, k_d1)
 
-        self.k_pv = k_pv
-        self.k_iv = k_iv
-        self.k_dv = k_dv
+        frenet2.sum_max = sum_max
+        frenet2.set_pid(k_p2, k_i2, k_d2)
 
-        self.sum_e = 0
-
-        self.e_ref = e_ref
+        self.velocity.sum_max = sum_max
+        self.velocity.set_pid(k_pv, k_iv, k_dv)
+        self.velocity.e_ref = e_ref
 
         print('\nControl parameter changes applied.')
 
@@ -268,18 +281,24 @@ class Controller():
         Returns two lists. The first list is a list of the names/descriptors
         of the adjustable parameters. The second is the current values of those
         parameters. """
-        k_p1, k_i1, k_d1 = self.frenet1.get_pid()
-        k_p2, k_i2, k_d2 = self.frenet2.get_pid()
+        frenet1, frenet2 = self._followers[:2]
+
+        k_p1, k_i1, k_d1 = frenet1.get_pid()
+        k_p2, k_i2, k_d2 = frenet2.get_pid()
+
+        k_pv, k_iv, k_dv = self.velocity.get_pid()
 
         return self.adjustables, [self.v_lead,
             k_p1, k_i1, k_d1,
             k_p2, k_i2, k_d2,
-            self.k_pv, self.k_iv, self.k_dv,
-            self.e_ref]
+            k_pv, k_iv, k_dv,
+            self.velocity.e_ref, self.velocity.sum_max]
 
 
     def set_reference_path(self, radius, center = [0, 0], pts = 400):
-        """Sets a new reference ellipse path. """
+        """Sets a new reference ellipse path. The path is built completely
+        before it replaces the old one, so the running controller never sees
+        a partly built path. """
         if isinstance(radius, list):
             if len(radius) > 1:
                 self.xr = radius[0]
@@ -293,7 +312,26 @@ class Controller():
 
         self.xc = center[0]
         self.yc = center[1]
-        self.pt.gen_circle_path([self.xr, self.yr], pts, [self.xc, self.yc])
+
+        self._swap_path([self.xr, self.yr], pts, [self.xc, self.yc])
+
+
+    def _swap_path(self, radius, pts, center):
+        """Builds a reference path and swaps it in. The path from the cache is
+        frozen. New Frenet PID controllers and trackers for the path are built
+        first and then replace the old ones with a single assignment, so the
+        control loop sees either only the old or only the new path. The new
+        controllers continue with the gains, settings and errors of the old
+        ones, see FrenetPID.with_path(). """
+        pt = self.path_cache.get_ellipse(radius, pts, center)
+        tracker1 = pt.tracker()
+        tracker2 = pt.tracker()
+
+        # Built last, so that the errors are taken as late as possible.
+        frenet1, frenet2 = self._followers[:2]
+        self._followers = (frenet1.with_path(pt), frenet2.with_path(pt),
+                           tracker1, tracker2)
+        self.pt = pt
 
 
     def run(self):
@@ -0,0 +1,154 @@
+import math
+import numpy as np
+
+class FleetFrenetPID():
+    """Path tracking for a fleet of N trucks following the same path. Works as
+    N FrenetPID controllers, but keeps the PID parameters and the state of all
+    trucks in arrays and calculates the control inputs of all trucks with one
+    set of numpy operations. The positions, yaws and velocities are given as
+    arrays with one value per truck. If sum_max is given the accumulated
+    errors are limited to +-sum_max to prevent windup, see FrenetPID. """
+    def __init__(self, path, N, k_p = 0, k_i = 0, k_d = 0, freq = 20,
+        sum_max = None):
+        self.N = N                          # Number of trucks.
+
+        # PID parameters, one per truck.
+        self.k_p = np.zeros(N) + k_p
+        self.k_i = np.zeros(N) + k_i
+        self.k_d = np.zeros(N) + k_d
+
+        self._ey = np.zeros(N)              # Current errors.
+        self._sumy = np.zeros(N)            # Accumulated errors.
+
+        self._freq = freq                   # Sampling frequency.
+        self._alpha_max = math.pi/6         # Maximum wheel angle alpha.
+        self._alpha_min = - math.pi/6
+        self._l = 0.27                      # Length between wheel pairs.
+        self._alpha = np.zeros(N)
+        self._sumy_alpha = np.zeros(N)
+        self.sum_max = sum_max              # Limit of the accumulated errors.
+
+        self._pt = path                     # Reference path.
+
+
+    def get_omega(self, x, y, yaw, vel, proj = None):
+        """Calculate the control inputs omega of all trucks. proj is the
+        projection of the positions on the path from path.project_batch() if
+        it is already calculated. """
+        if proj is None:
+            proj = self._project(x, y)
+        yaw = np.asarray(yaw, dtype = float)
+        vel = np.asarray(vel, dtype = float)
+
+        self._ey = proj.ey
+        self._sumy = self._limit_sum(self._sumy + self._ey)
+
+        cos_t = np.cos(yaw - proj.gamma)
+        sin_t = np.sin(yaw - proj.gamma)
+        denom = 1 - proj.gammap*self._ey
+
+        # y prime (derivative w.r.t. path).
+        yp = np.tan(yaw - proj.gamma)*denom*self._sign(vel*cos_t/denom)
+
+        # PID controller.
+        u = - self.k_p*self._ey - self.k_d*yp - self.k_i*self._sumy
+
+        # Feedback linearization.
+        omega = vel*cos_t/denom*(
+            u*cos_t**2/denom +
+            proj.gammap*(1 + sin_t**2) +
+            proj.gammapp*self._ey*cos_t*sin_t/denom)
+
+        return omega
+
+
+    def get_alpha(self, x, y, yaw, vel, proj = None):
+        """Calculate the control inputs alpha of all trucks. proj is the
+        projection of the positions on the path from path.project_batch() if
+        it is already calculated. """
+        if proj is None:
+            proj = self._project(x, y)
+        yaw = np.asarray(yaw, dtype = float)
+        vel = np.asarray(vel, dtype = float)
+
+        self._ey = proj.ey
+        self._sumy_alpha = self._limit_sum(self._sumy_alpha + self._ey)
+
+        cosa = np.cos(yaw - proj.gamma + self._alpha)
+        sina = np.sin(yaw - proj.gamma + self._alpha)
+        denom = 1 - proj.gammap*self._ey
+
+        # y prime (derivative w.r.t. path).
+        yp = sina/cosa*denom*self._sign(vel*cosa/denom)
+
+        # PID controller.
+        u = - self.k_p*self._ey - self.k_d*yp - self.k_i*self._sumy_alpha
+
+        # Feedback linearization.
+        alphap = vel*cosa/denom*(
+            u*cosa**2/denom +
+            proj.gammap*(1 + sina**2) +
+            proj.gammapp*self._ey*cosa*sina/denom
+        ) - vel*np.sin(self._alpha)/self._l
+
+        self._alpha = np.clip(self._alpha + alphap/self._freq,
+                              self._alpha_min, self._alpha_max)
+
+        return self._alpha
+
+
+    def _project(self, x, y):
+        """Projects the positions of all trucks on the reference path. """
+        return self._pt.project_batch(np.column_stack((
+            np.asarray(x, dtype = float), np.asarray(y, dtype = float))))
+
+
+    def _limit_sum(self, sumy):
+        """Returns the accumulated errors within +-sum_max. """
+        if self.sum_max is None:
+            return sumy
+
+        return np.clip(sumy, - self.sum_max, self.sum_max)
+
+
+    def _sign(self, x):
+        """Returns the sign of each element of x, with -1 for 0. """
+        return np.where(x > 0, 1, -1)
+
+
+    def set_pid(self, i, kp = None, ki = None, kd = None):
+        """Sets the PID parameters of truck i. """
+        if kp is not None:
+            self.k_p[i] = kp
+        if ki is not None:
+            self.k_i[i] = ki
+        if kd is not None:
+            self.k_d[i] = kd
+
+        self.reset_sum(i)
+
+
+    def get_pid(self, i):
+        """Returns the PID parameters of truck i. """
+        return self.k_p[i], self.k_i[i], self.k_d[i]
+
+
+    def reset_sum(self, i = None):
+        """Resets the sums for I part in PID controller of truck i, or of all
+        trucks if i is None. """
+        if i is None:
+            self._sumy[:] = 0
+            self._sumy_alpha[:] = 0
+        else:
+            self._sumy[i] = 0
+            self._sumy_alpha[i] = 0
+
+
+    def update_path(self, path):
+        """Updates the reference path. """
+        self._pt = path
+
+
+    def get_y_error(self):
+        """Returns the latest y errors. """
+        return self._ey
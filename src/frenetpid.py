@@ -1,95 +1,305 @@
 import math
+import collections
+
+# Result of FrenetPID.get_control(). ey is the y error, heading the angle
+# between the truck and the path and index the closest index on the path.
+ControlOutput = collections.namedtuple('ControlOutput',
+    ['omega', 'alpha', 'ey', 'heading', 'index'])
+
+class FrenetState(object):
+    """State of a FrenetPID controller: the latest y error, the accumulated
+    errors of the omega and alpha controllers, the wheel angle alpha, the
+    latest closest index on the path, which is only used as a starting point
+    for the next closest point search, and the timestamps of the latest
+    samples of the omega and alpha controllers. Small enough to be copied,
+    pickled and restored cheaply. """
+    __slots__ = ['ey', 'sumy', 'sumy_alpha', 'alpha', 'index', 'time',
+                 'time_alpha']
+
+    def __init__(self, ey = 0, sumy = 0, sumy_alpha = 0, alpha = 0,
+        index = None, time = None, time_alpha = None):
+        self.ey = ey                    # y error (distance from path).
+        self.sumy = sumy                # Accumulated error for omega.
+        self.sumy_alpha = sumy_alpha    # Accumulated error for alpha.
+        self.alpha = alpha              # Wheel angle.
+        self.index = index              # Latest closest index.
+        self.time = time                # Timestamp of latest omega sample.
+        self.time_alpha = time_alpha    # Timestamp of latest alpha sample.
+
+
+    def copy(self):
+        """Returns a copy of the state. """
+        return FrenetState(self.ey, self.sumy, self.sumy_alpha, self.alpha,
+                           self.index, self.time, self.time_alpha)
+
+
+    def __getstate__(self):
+        return (self.ey, self.sumy, self.sumy_alpha, self.alpha, self.index,
+                self.time, self.time_alpha)
+
+
+    def __setstate__(self, values):
+        (self.ey, self.sumy, self.sumy_alpha, self.alpha, self.index,
+         self.time, self.time_alpha) = values
+
+
+    def __repr__(self):
+        return ('FrenetState(ey = {}, sumy = {}, sumy_alpha = {}, alpha = {}, '
+                'index = {}, time = {}, time_alpha = {})'.format(
+                    self.ey, self.sumy, self.sumy_alpha, self.alpha,
+                    self.index, self.time, self.time_alpha))
+
 
 class FrenetPID():
-    def __init__(self, path, k_p = 0, k_i = 0, k_d = 0, freq = 20):
+    """Path tracking for one truck. The control inputs can be given the
+    timestamp of the measurement, in which case the errors are integrated
+    over the measured time since the previous sample instead of over one
+    sampling period 1/freq. The integrals are normalized by the sampling
+    period, so the gains are the same as when sampling at exactly freq. If
+    sum_max is given the accumulated errors are limited to +-sum_max, in
+    meters times sampling periods, to prevent windup. There is no limit by
+    default, since a suitable limit depends on the gains. """
+    def __init__(self, path, k_p = 0, k_i = 0, k_d = 0, freq = 20,
+        continuous = False, sum_max = None):
         # PID parameters.
         self.k_p = k_p
         self.k_i = k_i
         self.k_d = k_d
 
-        self._ey = 0                    # Current error.
-        self._sumy = 0                  # Accumulated error.
+        # Errors and wheel angle, replaced by a new state on every update.
+        self._state = FrenetState()
 
         self._freq = freq                # Sampling frequency.
         self._alpha_max = math.pi/6      # Maximum wheel angle alpha.
         self._alpha_min = - math.pi/6
         self._l = 0.27                   # Length between wheel pairs.
-        self._alpha = 0
-        self._sumy_alpha = 0
 
-        # Reference path.
-        self._pt = path
+        self.sum_max = sum_max           # Limit of the accumulated errors.
+        self._periods_max = 5            # Longest time between samples
+                                         # integrated, in sampling periods.
+
+        # Closest point tracking on the reference path. The tracker keeps the
+        # path, so that the path can be changed with a single assignment.
+        self._tracker = path.tracker()
+
+        # Project on the path segments instead of on the closest path point.
+        self.continuous = continuous
+
+        # Object with a project(xy) method, such as a pathfield.PathField, used
+        # instead of the path tracker when set.
+        self._projector = None
+
+
+    def get_omega(self, x, y, yaw, vel, timestamp = None):
+        """Calculate the control input omega. timestamp is the time of the
+        measurement in seconds, if known. """
+
+        proj = self._project(x, y)              # Projection on path.
+
+        state = self._state
+        periods = self._periods(state.time, timestamp)
+        state = FrenetState(proj.ey,
+                            self._limit_sum(state.sumy + proj.ey*periods),
+                            state.sumy_alpha, state.alpha, proj.index,
+                            timestamp, state.time_alpha)
+        self._state = state
+
+        return self._omega(proj, yaw, vel, 1 - proj.gammap*state.ey, state)
+
+
+    def get_alpha(self, x, y, yaw, vel, timestamp = None):
+        """Calculate the control input alpha. timestamp is the time of the
+        measurement in seconds, if known. """
+
+        proj = self._project(x, y)              # Projection on path.
+
+        state = self._state
+        periods = self._periods(state.time_alpha, timestamp)
+        state = FrenetState(proj.ey, state.sumy,
+                            self._limit_sum(state.sumy_alpha + proj.ey*periods),
+                            state.alpha, proj.index, state.time, timestamp)
+        state.alpha = self._integrate_alpha(proj, yaw, vel,
+            1 - proj.gammap*state.ey, state, periods)
+        self._state = state
+
+        return state.alpha
+
+
+    def get_control(self, x, y, yaw, vel, timestamp = None):
+        """Calculate both control inputs omega and alpha. The projection on
+        the path and the values shared by the two control laws are only
+        calculated once. Gives the same values as calling get_omega() and
+        then get_alpha(). timestamp is the time of the measurement in
+        seconds, if known. Returns a ControlOutput. """
+        state = self._state
+        periods = self._periods(state.time, timestamp)
+
+        state, output = self._step(state, self._project(x, y), yaw, vel,
+                                   periods)
+        state.time = timestamp
+        state.time_alpha = timestamp
+        self._state = state
+
+        return output
+
+
+    def step(self, state, pose, vel, dt):
+        """Calculate both control inputs from the FrenetState state instead
+        of the state of the controller, which is not changed. pose is x, y
+        and yaw and dt the time since the previous step, which must be
+        positive and is integrated as it is given. Returns the new FrenetState
+        and a ControlOutput. Used for rollouts, simulation and restoring a
+        controller, see get_state() and set_state(). """
+        if dt <= 0:
+            raise ValueError('dt must be positive, got {}'.format(dt))
+
+        x, y, yaw = pose
+        proj = self._project_from(x, y, state.index)
+
+        new, output = self._step(state, proj, yaw, vel, dt*self._freq)
+        if state.time is not None:
+            new.time = state.time + dt
+        if state.time_alpha is not None:
+            new.time_alpha = state.time_alpha + dt
+
+        return new, output
+
+
+    def _step(self, state, proj, yaw, vel, periods):
+        """Used internally. Returns the new state and the control inputs from
+        the state and the projection on the path, periods sampling periods
+        after the state. """
+        ey = proj.ey                            # y error (distance from path)
+
+        # Accumulated errors.
+        new = FrenetState(ey,
+                          self._limit_sum(state.sumy + ey*periods),
+                          self._limit_sum(state.sumy_alpha + ey*periods),
+                          state.alpha, proj.index,
+                          state.time, state.time_alpha)
 
+        denom = 1 - proj.gammap*ey
 
-    def get_omega(self, x, y, yaw, vel):
-        """Calculate the control input omega. """
+        omega = self._omega(proj, yaw, vel, denom, new)
+        new.alpha = self._integrate_alpha(proj, yaw, vel, denom, new, periods)
 
-        index, closest = self._pt.get_closest([x, y]) # Closest point on path.
+        # Heading error between -pi and pi.
+        heading = (yaw - proj.gamma + math.pi) % (2*math.pi) - math.pi
 
-        self._ey = self._pt.get_ey([x, y])     # y error (distance from path)
+        return new, ControlOutput(omega, new.alpha, ey, heading, proj.index)
 
-        self._sumy = self._sumy + self._ey      # Accumulated error.
 
-        gamma = self._pt.get_gamma(index)
-        gamma_p = self._pt.get_gammap(index)
-        gamma_pp = self._pt.get_gammapp(index)
+    def _periods(self, last, timestamp):
+        """Used internally. Returns the time from the sample at time last to
+        the sample at timestamp in sampling periods. Gives one period if
+        either time is unknown or the time does not increase, and at most
+        _periods_max periods, e.g. after the controller has been paused. """
+        if last is None or timestamp is None or timestamp <= last:
+            return 1
+
+        return min((timestamp - last)*self._freq, self._periods_max)
+
+
+    def _limit_sum(self, sumy):
+        """Used internally. Returns the accumulated error within +-sum_max. """
+        if self.sum_max is None:
+            return sumy
+
+        return min(max(sumy, - self.sum_max), self.sum_max)
+
+
+    def _omega(self, proj, yaw, vel, denom, state):
+        """Used internally to calculate omega from the projection on the path
+        and the errors in state. denom is 1 - gamma_p*ey. """
+        gamma = proj.gamma
+        gamma_p = proj.gammap
+        gamma_pp = proj.gammapp
 
         cos_t = math.cos(yaw - gamma)     # cos(theta)
         sin_t = math.sin(yaw - gamma)     # sin(theta)
 
         # y prime (derivative w.r.t. path).
-        yp = math.tan(yaw - gamma)*(1 - gamma_p*self._ey)*self._sign(
-            vel*cos_t/(1 - gamma_p*self._ey))
+        yp = math.tan(yaw - gamma)*denom*self._sign(vel*cos_t/denom)
 
         # PID controller.
-        u = - self.k_p*self._ey - self.k_d*yp - self.k_i * self._sumy
+        u = - self.k_p*state.ey - self.k_d*yp - self.k_i * state.sumy
 
         # Feedback linearization.
-        omega = vel*cos_t/(1 - gamma_p*self._ey) * (
-                        u*cos_t**2/(1 - gamma_p*self._ey) +
+        omega = vel*cos_t/denom * (
+                        u*cos_t**2/denom +
                         gamma_p*(1 + sin_t**2) +
-                        gamma_pp*self._ey*cos_t*sin_t/(1 - gamma_p*self._ey))
+                        gamma_pp*state.ey*cos_t*sin_t/denom)
 
         return omega
 
 
-    def get_alpha(self, x, y, yaw, vel):
-        """Calculate the control input alpha. """
-
-        index, closest = self._pt.get_closest([x, y]) # Closest point on path.
-
-        self._ey = self._pt.get_ey([x, y])     # y error (distance from path)
-
-        self._sumy_alpha = self._sumy_alpha + self._ey      # Accumulated error.
+    def _integrate_alpha(self, proj, yaw, vel, denom, state, periods):
+        """Used internally. Returns the wheel angle in state integrated over
+        periods sampling periods from the projection on the path and the
+        errors in state. denom is 1 - gamma_p*ey. """
+        gamma = proj.gamma
+        gamma_p = proj.gammap
+        gamma_pp = proj.gammapp
 
-        gamma = self._pt.get_gamma(index)
-        gamma_p = self._pt.get_gammap(index)
-        gamma_pp = self._pt.get_gammapp(index)
-
-        cosa = math.cos(yaw - gamma + self._alpha)
-        sina = math.sin(yaw - gamma + self._alpha)
+        cosa = math.cos(yaw - gamma + state.alpha)
+        sina = math.sin(yaw - gamma + state.alpha)
 
         # y prime (derivative w.r.t. path).
-        yp = sina/cosa*(1 - gamma_p*self._ey)*self._sign(
-            vel*cosa/(1 - gamma_p*self._ey))
+        yp = sina/cosa*denom*self._sign(vel*cosa/denom)
 
         # PID controller.
-        u = - self.k_p*self._ey - self.k_d*yp - self.k_i * self._sumy_alpha
+        u = - self.k_p*state.ey - self.k_d*yp - self.k_i * state.sumy_alpha
 
         # Feedback linearization.
-        alphap = vel*cosa/(1 - gamma_p*self._ey)*(
-            u*cosa**2/(1 - gamma_p*self._ey) +
+        alphap = vel*cosa/denom*(
+            u*cosa**2/denom +
             gamma_p*(1 + sina**2) +
-            gamma_pp*self._ey*cosa*sina/(1 - gamma_p*self._ey)
-        ) - vel*math.sin(self._alpha)/self._l
+            gamma_pp*state.ey*cosa*sina/denom
+        ) - vel*math.sin(state.alpha)/self._l
+
+        alpha = state.alpha + alphap*periods/self._freq
+        if alpha < self._alpha_min:
+            alpha = self._alpha_min
+        if alpha > self._alpha_max:
+            alpha = self._alpha_max
+
+        return alpha
 
-        self._alpha = self._alpha + alphap/self._freq
-        if self._alpha < self._alpha_min:
-            self._alpha = self._alpha_min
-        if self._alpha > self._alpha_max:
-            self._alpha = self._alpha_max
 
-        return self._alpha
+    def _project(self, x, y):
+        """Projects the position on the reference path. The path may be
+        swapped by another thread, so the projector and tracker are only
+        read once. """
+        projector = self._projector
+        if projector is not None:
+            return projector.project([x, y])
+
+        tracker = self._tracker
+        if self.continuous:
+            return tracker.project_segment([x, y])
+        else:
+            return tracker.project([x, y])
+
+
+    def _project_from(self, x, y, index):
+        """Used internally. Projects the position on the reference path,
+        starting the closest point search at index unless it is None, without
+        changing the path tracker. """
+        projector = self._projector
+        if projector is not None:
+            return projector.project([x, y])
+
+        tracker = self._tracker
+        if index is None:
+            if self.continuous:
+                return tracker.path.project_segment([x, y])
+            else:
+                return tracker.path.project([x, y])
+
+        if self.continuous:
+            return tracker.path.project_segment([x, y], index, tracker.window)
+        else:
+            return tracker.path.project([x, y], index, tracker.window)
 
 
     def _sign(self, x):
@@ -119,15 +329,101 @@ class FrenetPID():
 
     def reset_sum(self):
         """Resets the sum for I part in PID controller. """
-        self._sumy = 0
-        self._sumy_alpha = 0
+        state = self._state.copy()
+        state.sumy = 0
+        state.sumy_alpha = 0
+        self._state = state
+
+
+    def get_state(self):
+        """Returns a copy of the state of the controller as a FrenetState. """
+        state = self._state.copy()
+        state.index = self._tracker.index
+
+        return state
 
 
-    def update_path(self, path):
-        """Updates the reference path. """
-        self._pt = path
+    def set_state(self, state):
+        """Restores a state returned by get_state() or step(). """
+        self._state = state.copy()
+        if state.index is not None:
+            self._tracker.set_index(state.index)
+
+
+    def with_path(self, path):
+        """Returns a new FrenetPID for the reference path with the gains,
+        settings and state of this controller, for a running controller to
+        switch paths with a single assignment. A projector is replaced by the
+        one its with_path() method gives for the new path. The state is copied
+        last, so that the new controller misses as few updates of this one as
+        possible. """
+        frenet = FrenetPID(path, self.k_p, self.k_i, self.k_d, self._freq,
+                           self.continuous, self.sum_max)
+        frenet._alpha_max = self._alpha_max
+        frenet._alpha_min = self._alpha_min
+        frenet._l = self._l
+        frenet._periods_max = self._periods_max
+        frenet._tracker = path.tracker(self._tracker.window)
+
+        projector = self._projector
+        if projector is not None:
+            frenet._projector = projector.with_path(path)
+
+        state = self._state.copy()
+        state.index = None              # Index on the old path.
+        frenet._state = state
+
+        return frenet
+
+
+    def update_path(self, path, index = None):
+        """Updates the reference path. The path should not be changed
+        afterwards while the controller is running, see Path.freeze(). If
+        index is given the closest point search on the new path starts there
+        instead of searching the whole path. """
+        tracker = path.tracker()
+        if index is not None:
+            tracker.set_index(index)
+
+        self._projector = None
+        self._tracker = tracker
+
+
+    def get_path(self):
+        """Returns the reference path. """
+        return self._tracker.path
+
+
+    def get_index(self):
+        """Returns the latest closest index on the reference path, or None if
+        there is none. """
+        return self._tracker.index
+
+
+    def set_projector(self, projector):
+        """Sets an object with a project(xy) method, such as a
+        pathfield.PathField for the reference path, to use for projecting on
+        the path. None uses the path itself. The projector should also have a
+        with_path(path) method that returns a projector for another path, see
+        with_path(). """
+        self._projector = projector
 
 
     def get_y_error(self):
         """Returns the latest y error. """
-        return self._ey
+        return self._state.ey
+
+
+def parse_sum_max(value):
+    """Returns a limit of the accumulated errors entered as text, e.g. in a
+    controller GUI, as a float, or None for no limit if the text is empty or
+    None. Raises a ValueError for a negative limit. """
+    if value is None or str(value).strip() in ['', 'None']:
+        return None
+
+    sum_max = float(value)
+    if sum_max < 0:
+        raise ValueError('sum_max must not be negative, got {}'.format(
+            sum_max))
+
+    return sum_max
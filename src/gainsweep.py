@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+
+# Tuning of the platooning controller gains by running many closed-loop
+# simulations in parallel.
+
+import os
+import sys
+import math
+import json
+import hashlib
+import itertools
+import collections
+import multiprocessing
+import numpy as np
+
+import pathcache
+import frenetpid
+import simulator
+import velocitypid
+
+# Gains that can be tuned. The path following gains k_p1, k_i1 and k_d1 are
+# used by the FrenetPID controllers of both trucks.
+PARAMETERS = ['k_p1', 'k_i1', 'k_d1', 'k_pv', 'k_iv', 'k_dv', 'e_ref']
+
+# Values of the gains that are not part of a sweep, as in
+# controller_platooning.main().
+DEFAULTS = {'k_p1': 0.5, 'k_i1': -0.02, 'k_d1': 3,
+            'k_pv': 10, 'k_iv': 1, 'k_dv': 5, 'e_ref': 0.5}
+
+# Simulated scenario. The trucks start on the reference path with the
+# follower the distance gap behind the leader along the path.
+SCENARIO = {'x_radius': 1.7, 'y_radius': 1.2, 'center': [0.3, -1.3],
+            'points': 400, 'v': 0.89, 'distance_offset': 0.4, 'gap': 0.8,
+            'duration': 60, 'dt': 0.05}
+
+# Reference paths of the simulations, kept by each worker of the pool.
+_paths = pathcache.PathCache()
+
+# Result of one simulation. lateral is the RMS of the y errors of both trucks
+# in meters and gap the RMS of the time gap error in seconds.
+SweepResult = collections.namedtuple('SweepResult',
+    ['params', 'lateral', 'gap', 'score'])
+
+
+class GainSweep:
+    """Searches for the gains of the platooning controller that give the
+    lowest score in a simulated scenario. Each set of gains is simulated with
+    simulator.Simulator in its own worker of a process pool. The score is the
+    RMS of the lateral errors plus gap_weight times the RMS of the time gap
+    error. The simulations need no ROS. The results of successful
+    simulations are kept in a cache keyed by a hash of the gains and the
+    scenario, which is saved to cache_file if given, so that gains that
+    already have been simulated are skipped when searching again. Failed
+    simulations get an infinite score and are simulated again the next time
+    they are asked for. """
+    def __init__(self, scenario = {}, processes = None, cache_file = None,
+        gap_weight = 0.1):
+        self.scenario = dict(SCENARIO)      # Simulated scenario.
+        self.scenario.update(scenario)
+        self.processes = processes          # Number of workers, None for one
+                                            # per CPU.
+        self.cache_file = cache_file
+        self.gap_weight = gap_weight        # Weight of the gap error.
+
+        self.results = {}                   # Results keyed by hash.
+        self._other = {}                    # Cached results of other
+                                            # scenarios, kept when saving.
+
+        if self.cache_file is not None and os.path.exists(self.cache_file):
+            self._load()
+
+
+    def grid(self, values):
+        """Simulates every combination of the gain values. values maps gain
+        names to lists of values. Returns the results sorted by score. """
+        names = sorted(values)
+        params = [dict(zip(names, combination))
+                  for combination in itertools.product(
+                      *[values[name] for name in names])]
+
+        return self.evaluate(params)
+
+
+    def random(self, bounds, n, seed = 0):
+        """Simulates n sets of gains drawn uniformly within the bounds. bounds
+        maps gain names to pairs of lower and upper bounds. Returns the
+        results sorted by score. """
+        rand = np.random.RandomState(seed)
+        names = sorted(bounds)
+        params = [dict((name, float(rand.uniform(*bounds[name])))
+                       for name in names) for i in range(n)]
+
+        return self.evaluate(params)
+
+
+    def local(self, start, steps, iterations = 10):
+        """Searches from the gains in start by changing one gain at a time
+        with the step in steps, which maps gain names to step sizes. All
+        changes are simulated in parallel and the best one is kept, and the
+        steps are halved when no change is better. Returns the best
+        result. """
+        steps = dict(steps)
+        best = self.evaluate([start])[0]
+
+        for i in range(iterations):
+            params = []
+            for name in sorted(steps):
+                for sign in [1, -1]:
+                    p = dict(best.params)
+                    p[name] = p.get(name, DEFAULTS[name]) + sign*steps[name]
+                    params.append(p)
+
+            result = self.evaluate(params)[0]
+            if result.score < best.score:
+                best = result
+            else:
+                for name in steps:
+                    steps[name] = steps[name]/2.0
+
+            print('Iteration {}: score {:.4f}.'.format(i + 1, best.score))
+
+        return best
+
+
+    def evaluate(self, params):
+        """Simulates the list of gain sets in params that are not in the cache.
+        Returns the results of all of them sorted by score. Only the results
+        of successful simulations are added to the cache. """
+        keys = [self._key(p) for p in params]
+        results = {}
+
+        tasks = []
+        for key, p in zip(keys, params):
+            if key not in self.results and key not in [t[0] for t in tasks]:
+                tasks.append((key, p))
+
+        if tasks:
+            args = [(p, self.scenario) for key, p in tasks]
+            if self.processes == 1:
+                errors = [_simulate(a) for a in args]
+            else:
+                pool = multiprocessing.Pool(self.processes)
+                try:
+                    errors = pool.map(_simulate, args, chunksize = 1)
+                finally:
+                    pool.close()
+                    pool.join()
+
+            for (key, p), (lateral, gap) in zip(tasks, errors):
+                results[key] = SweepResult(p, lateral, gap,
+                                           lateral + self.gap_weight*gap)
+                if not math.isinf(results[key].score):
+                    self.results[key] = results[key]
+
+            self._save()
+
+        results.update(self.results)
+
+        return sorted([results[key] for key in set(keys)],
+                      key = lambda r: r.score)
+
+
+    def ranked(self):
+        """Returns all results in the cache sorted by score. """
+        return sorted(self.results.values(), key = lambda r: r.score)
+
+
+    def write_table(self, filename, results = None):
+        """Writes a table of the results, or of all results in the cache if
+        None, ranked by score. """
+        if results is None:
+            results = self.ranked()
+
+        header = ['rank', 'score', 'lateral', 'gap'] + PARAMETERS
+        try:
+            with open(filename, 'w') as f:
+                f.write(''.join('{:>10}'.format(h) for h in header) + '\n')
+                for rank, r in enumerate(results):
+                    row = [rank + 1, r.score, r.lateral, r.gap] + [
+                        r.params.get(name, DEFAULTS[name])
+                        for name in PARAMETERS]
+                    f.write('{:>10}'.format(row[0]) + ''.join(
+                        '{:>10.4f}'.format(v) for v in row[1:]) + '\n')
+        except Exception as e:
+            print('\nError when writing sweep results: {}'.format(e))
+
+
+    def _key(self, params):
+        """Used internally. Returns the hash of the gains and scenario. """
+        values = [float(params.get(name, DEFAULTS[name]))
+                  for name in PARAMETERS]
+        return hashlib.sha1(json.dumps([values, self.scenario],
+                                       sort_keys = True)).hexdigest()
+
+
+    def _load(self):
+        """Used internally to load the cached results. """
+        try:
+            with open(self.cache_file) as f:
+                for key, entry in json.load(f).items():
+                    params, scenario, lateral, gap = entry
+                    if math.isinf(lateral) or math.isinf(gap):
+                        continue        # Failed, from an older version.
+                    if scenario == self.scenario:
+                        self.results[key] = SweepResult(params, lateral, gap,
+                            lateral + self.gap_weight*gap)
+                    else:
+                        self._other[key] = entry
+        except Exception as e:
+            print('\nError when loading sweep cache: {}'.format(e))
+
+
+    def _save(self):
+        """Used internally to save the cached results if there is a cache
+        file. """
+        if self.cache_file is None:
+            return
+
+        cache = dict(self._other)
+        for key, r in self.results.items():
+            cache[key] = [r.params, self.scenario, r.lateral, r.gap]
+
+        try:
+            with open(self.cache_file, 'w') as f:
+                json.dump(cache, f)
+        except Exception as e:
+            print('\nError when saving sweep cache: {}'.format(e))
+
+
+def _simulate(args):
+    """Runs one simulation of the platooning controller with the gains and
+    scenario in args, with the control of controller_platooning but without
+    ROS, see Simulator.run_platoon_pid(). Returns the RMS of the lateral
+    errors and of the time gap error, which are infinite if the simulation
+    fails. A missing module is not a failure of the gains and is raised.
+    Used by the workers of GainSweep. """
+    params, scenario = args
+    p = dict(DEFAULTS)
+    p.update(params)
+
+    try:
+        xr = scenario['x_radius']
+        yr = scenario['y_radius']
+        xc, yc = scenario['center']
+
+        # Leader at angle 0 on the ellipse and follower gap behind.
+        theta = - scenario['gap']/math.sqrt((xr**2 + yr**2)/2)
+        trucks = [simulator.SimulatedTruck(xc + xr, yc, math.pi/2),
+                  simulator.SimulatedTruck(
+                      xc + xr*math.cos(theta), yc + yr*math.sin(theta),
+                      math.atan2(yr*math.cos(theta), - xr*math.sin(theta)))]
+        sim = simulator.Simulator(trucks, scenario['dt'])
+
+        pt = _paths.get_ellipse([xr, yr], scenario['points'], [xc, yc])
+        frenets = [frenetpid.FrenetPID(pt, p['k_p1'], p['k_i1'], p['k_d1'])
+                   for truck in trucks]
+        velocity = velocitypid.VelocityPID(p['k_pv'], p['k_iv'], p['k_dv'],
+            p['e_ref'], scenario['distance_offset'])
+        vlim = 0.5                  # As in controller_platooning.
+
+        sim.run_platoon_pid(frenets, velocity, scenario['v'],
+                            scenario['duration'], vlim)
+
+        history = sim.get_history()
+        leader = pt.frenet_transform(history[:, 1:3])
+        follower = pt.frenet_transform(history[:, 5:7])
+
+        lateral = math.sqrt(np.mean(np.concatenate(
+            (leader.ey, follower.ey))**2))
+
+        # Time gap error while the follower is driving.
+        vel2 = history[:, 8]
+        moving = (vel2 > 0) & (history[:, 4] >= vlim)
+        distance = np.mod(leader.s - follower.s, pt.length)
+        e_time = (distance[moving] - scenario['distance_offset'])/vel2[moving]
+        gap = math.sqrt(np.mean((p['e_ref'] - e_time)**2))
+
+        if math.isnan(lateral) or math.isnan(gap):
+            return float('inf'), float('inf')
+
+        return lateral, gap
+
+    except ImportError:
+        raise
+
+    except Exception as e:
+        print('\nError when simulating gains {}: {}'.format(params, e))
+        return float('inf'), float('inf')
+
+
+def main(args):
+    """Searches for gains with grid search, random search or the local
+    search. """
+    if len(args) < 2 or args[1] not in ['grid', 'random', 'local']:
+        print('Usage: gainsweep.py grid|random|local [tablefile]')
+        return
+
+    table_file = 'gainsweep.txt'
+    if len(args) > 2:
+        table_file = args[2]
+
+    sweep = GainSweep(cache_file = 'gainsweep_cache.json')
+
+    if args[1] == 'grid':
+        sweep.grid({'k_p1': [0.25, 0.5, 1], 'k_d1': [1.5, 3, 6],
+                    'k_pv': [5, 10, 20], 'k_dv': [2.5, 5, 10]})
+    elif args[1] == 'random':
+        sweep.random({'k_p1': [0.1, 2], 'k_i1': [-0.1, 0], 'k_d1': [0.5, 8],
+                      'k_pv': [1, 30], 'k_iv': [0, 3], 'k_dv': [0, 15],
+                      'e_ref': [0.3, 1]}, 200)
+    else:
+        sweep.local(DEFAULTS, {'k_p1': 0.2, 'k_i1': 0.01, 'k_d1': 1,
+                               'k_pv': 4, 'k_iv': 0.4, 'k_dv': 2})
+
+    sweep.write_table(table_file)
+
+    for r in sweep.ranked()[:5]:
+        print('Score {:.4f}, lateral {:.4f} m, gap {:.4f} s: {}'.format(
+            r.score, r.lateral, r.gap, r.params))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
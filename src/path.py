@@ -4,16 +4,68 @@
 
 import Tkinter as tk
 import os
+import sys
 import math
+import collections
+import bisect
+import struct
+import zlib
+import numpy as np
+
+# Header of the binary path format: magic, version, checksum of the data after
+# the header, number of points, number of grid cells, path length, grid cell
+# size, ellipse radii and center, and ellipse angle parameter of the first
+# point and its increment per index. The header is followed by the arrays of
+# the points, gammas, arc lengths and grid cells, and last the knots of a
+# splinepath.SplinePath, whose number is given by the remaining size.
+BINARY_MAGIC = 'PLTNPATH'
+BINARY_VERSION = 1
+BINARY_HEADER = struct.Struct('<8sIIIIdddddddd')
+
+# Maximum number of elements of the distance matrix in batched queries.
+BATCH_ELEMENTS = 1000000
+
+# Maximum number of points of the line drawn by Path.plot(), the largest path
+# that gets a dot for each point, and the time in milliseconds between checks
+# for changes of the plotted path.
+PLOT_MAX_POINTS = 5000
+PLOT_DOT_POINTS = 200
+PLOT_REFRESH_MS = 500
+
+# Result of projecting a point on a path. ey is negative if the point is to the
+# left of the path.
+Projection = collections.namedtuple('Projection',
+    ['index', 'closest', 'ey', 'left', 'gamma', 'gammap', 'gammapp'])
+
+# Result of transforming a trajectory to path coordinates, with one value per
+# sample in each field. s is the arc length along the path and heading the
+# angle between the heading of the trajectory and the path.
+FrenetTrajectory = collections.namedtuple('FrenetTrajectory',
+    ['index', 's', 'ey', 'heading'])
+
+# Result of projecting a point on the segments of a path. The closest point is
+# at fraction t along the segment from index to index + 1, and at arc length s
+# from the first point of the path.
+SegmentProjection = collections.namedtuple('SegmentProjection',
+    ['index', 't', 's', 'closest', 'ey', 'left', 'gamma', 'gammap', 'gammapp'])
 
 class Path:
     """Class for a path. Path is described by a series of coordinate pairs."""
-    def __init__(self):
+    def __init__(self, use_index = True):
         self.path = []
         self.gamma = []
         self.gammap = []
         self.gammapp = []
+        self.arclength = [] # Distance along the path from the first point.
+        self.length = 0     # Length of the closed path.
         self._lp = True     # Used for graphical application.
+        self._plot_root = None  # Window of the graphical application.
+        self.frozen = False     # If the path can not be changed.
+
+        self.use_index = use_index  # Use a spatial index for closest point.
+        self._index = None
+        self.revision = 0           # Increased every time the path changes.
+        self._array_cache = None    # Path as arrays, used for batch queries.
 
         self.xr = 0
         self.yr = 0
@@ -40,6 +92,7 @@ class Path:
 
     def load(self, filename):
         """Loads path from file. Assumes lines to be on the format x,y"""
+        self._check_frozen()
         self.path = []
         try:
             __location__ = os.path.realpath(os.path.join(os.getcwd(),
@@ -65,10 +118,54 @@ class Path:
             pass
 
 
+    def save_binary(self, filename):
+        """Saves the path together with gamma, gamma prime, gamma prime prime,
+        the arc lengths, the spatial index and the knots of a spline path to a
+        binary file that can be loaded with ArrayPath.load_binary(). """
+        try:
+            __location__ = os.path.realpath(os.path.join(os.getcwd(),
+                                            os.path.dirname(__file__)))
+
+            N = len(self.path)
+            arrays = [np.asarray(self.path, dtype = float).reshape(N, 2),
+                      np.asarray(self.gamma, dtype = float),
+                      np.asarray(self.gammap, dtype = float),
+                      np.asarray(self.gammapp, dtype = float),
+                      np.asarray(self.arclength, dtype = float)]
+
+            if self._index is not None:
+                cell_size = self._index.cell_size
+                cells = self._index.to_arrays()
+            else:
+                cell_size = 0
+                cells = [np.zeros(0, dtype = np.int64) for i in range(3)] + [
+                    np.zeros(1, dtype = np.int64)]
+            arrays.extend(cells)
+            arrays.append(np.asarray(getattr(self, 'knots', []),
+                                     dtype = float).reshape(-1, 2))
+
+            data = ''.join(
+                np.ascontiguousarray(a).tostring() for a in arrays)
+
+            header = BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION,
+                zlib.crc32(data) & 0xffffffff, N, len(cells[0]), self.length,
+                cell_size, self.xr, self.yr, self.xc, self.yc,
+                getattr(self, '_theta0', 0), getattr(self, '_dtheta', 0))
+
+            fl = open(os.path.join(__location__, filename), 'wb')
+            fl.write(header)
+            fl.write(data)
+            fl.close()
+            print('Saved path as {}'.format(filename))
+
+        except Exception as e:
+            print('\nError when saving path to file: {}'.format(e))
+
+
     def gen_circle_path(self, radius, points = 300, center = [0, 0]):
         """Generates a circle path with specified radius and number of
         points."""
-        newpath = []
+        self._check_frozen()
         if isinstance(radius, list):
             if len(radius) > 1:
                 x_mag = radius[0]
@@ -80,12 +177,7 @@ class Path:
             x_mag = radius
             y_mag = radius
 
-        for i in range(points):
-            x = center[0] + x_mag*math.cos(2*math.pi*i/points)
-            y = center[1] + y_mag*math.sin(2*math.pi*i/points)
-            newpath.append([x, y])
-
-        self.path = newpath
+        self.path = self._circle_points(x_mag, y_mag, center, points)
         self._calc_gammas()
 
         self.xr = x_mag
@@ -96,8 +188,20 @@ class Path:
         return x_mag, y_mag, center[0], center[1]
 
 
+    def _circle_points(self, x_mag, y_mag, center, points):
+        """Used internally to calculate the points of an ellipse. """
+        newpath = []
+        for i in range(points):
+            x = center[0] + x_mag*math.cos(2*math.pi*i/points)
+            y = center[1] + y_mag*math.sin(2*math.pi*i/points)
+            newpath.append([x, y])
+
+        return newpath
+
+
     def reverse(self):
         """Reverses the path. Recalculates gamma values."""
+        self._check_frozen()
         self.path.reverse()
         self._calc_gammas()
 
@@ -105,6 +209,7 @@ class Path:
     def interpolate(self):
         """Interpolates the path. Returns a denser list that has added one
         set of intermediate points to the original path."""
+        self._check_frozen()
         N = len(self.path)
         interlist = [[0, 0] for i in range(N)]
         for i in range(N - 1):
@@ -124,6 +229,35 @@ class Path:
         self._calc_gammas()
 
 
+    def resample(self, tolerance = 0.001, max_spacing = 0.1):
+        """Redistributes the points along the path so that the distance
+        between the path and the straight line between two neighbouring points
+        is at most tolerance, and the distance between the points at most
+        max_spacing. Tight curves get dense points and straight parts sparse
+        points. The new points lie on the old path. Returns the number of
+        points before and after. """
+        self._check_frozen()
+        N = len(self.path)
+        if N < 3:
+            return N, N
+
+        points = self._arrays()[0]
+        s, spacing = _adaptive_spacing(points, self._arrays()[1], tolerance,
+                                       max_spacing)
+        s_new = _adaptive_arclengths(s, spacing)
+
+        # Interpolate the new points on the closed polyline.
+        closed = np.vstack((points, points[:1]))
+        self.path = np.column_stack((np.interp(s_new, s, closed[:, 0]),
+                                     np.interp(s_new, s, closed[:, 1])))
+        if not isinstance(self, ArrayPath):
+            self.path = self.path.tolist()
+        self._calc_gammas()
+
+        print('Resampled path from {} to {} points.'.format(N, len(s_new)))
+        return N, len(s_new)
+
+
     def plot(self, realh = 5, realw = 5):
         """Plots the path in a Tkinter window. Arguments are the width and
         height of the real path area in meters."""
@@ -177,6 +311,30 @@ class Path:
 
         root.protocol("WM_DELETE_WINDOW", self._quitm)  # Window close action.
 
+        self._plot_root = root
+        self._draw_plot(canv, realh, realw, h, w)
+
+        # Redraw the path when it changes while the window is open.
+        root.after(PLOT_REFRESH_MS, self._refresh_plot, canv,
+                   realh, realw, h, w, self.revision)
+
+        root.mainloop()
+
+        self._lp = False
+        self._plot_root = None
+        root.destroy()
+
+
+    def _draw_plot(self, canv, realh, realw, h, w):
+        """Used internally to draw the path as a single line. Points that fall
+        on the same pixel as the previous point are skipped, and for large
+        paths only every few points are drawn. Each point is marked with a
+        dot if the path is small. """
+        canv.delete('path')
+        N = len(self.path)
+        if N == 0:
+            return
+
         try:
             # Print arrow in the direction of the path at the start of the path.
             l = 100.0   # Length of arrow.
@@ -188,38 +346,57 @@ class Path:
             xy0[1] = int(xy0[1] - norm[1]*d + tang[1]*l/2)
             xyf = [int(xy0[0] + tang[0]*l), int(xy0[1] - tang[1]*l)]
             canv.create_line(xy0[0], xy0[1], xyf[0], xyf[1],
-                            width = 2, arrow = 'last')
-
-            # Print lines between points and mark each point with a dot.
-            for i in range(len(self.path)):
-                xy1 = self._pixelv(i - 1, realh, realw, h, w)
-                xy2 = self._pixelv(i, realh, realw, h, w)
-                canv.create_line(xy1[0], xy1[1], xy2[0], xy2[1],
-                                    fill = 'blue', width = 2)
-                canv.create_oval(xy2[0] - 3, xy2[1] - 3,
-                                        xy2[0] + 3, xy2[1] + 3, fill = 'green')
+                            width = 2, arrow = 'last', tag = 'path')
+
+            # Pixel coordinates of the closed path.
+            points = self._arrays()[0]
+            pixels = np.column_stack((
+                (w/realw*points[:, 0] + w/2).astype(int),
+                (- h/realh*points[:, 1] + h/2).astype(int)))
+
+            if N > PLOT_MAX_POINTS:
+                pixels = pixels[::int(math.ceil(float(N)/PLOT_MAX_POINTS))]
+
+            keep = np.concatenate(([True],
+                                   np.any(np.diff(pixels, axis = 0) != 0,
+                                          axis = 1)))
+            line = np.vstack((pixels[keep], pixels[:1]))
+
+            if len(line) > 1:
+                canv.create_line(*line.ravel().tolist(), fill = 'blue',
+                                 width = 2, tag = 'path')
+
+            # Mark each point with a dot.
+            if N <= PLOT_DOT_POINTS:
+                for x, y in pixels.tolist():
+                    canv.create_oval(x - 3, y - 3, x + 3, y + 3,
+                                     fill = 'green', tag = 'path')
         except Exception as e:
             print(e)
 
-        while self._lp:
-            try:
-                if 'normal' == root.state():
-                    root.update()
-            except:
-                pass
 
-        root.destroy()
+    def _refresh_plot(self, canv, realh, realw, h, w, revision):
+        """Used internally to redraw the plot if the path has changed. """
+        if not self._lp:
+            return
+
+        if revision != self.revision:
+            revision = self.revision
+            self._draw_plot(canv, realh, realw, h, w)
+
+        canv.after(PLOT_REFRESH_MS, self._refresh_plot, canv,
+                   realh, realw, h, w, revision)
 
 
     def _print_click_info(self, event, arg):
         """Used internally to print the coordinates clicked on."""
         x = float((event.x - arg[1]/2)*arg[3]/arg[1])
         y = float((arg[0]/2 - event.y)*arg[2]/arg[0])
-        index, closest = self.get_closest([x, y])
+        proj = self.project([x, y])
         print('({:07.4f}, {:07.4f}), {}error: {:07.4f}, gamma: {:05.4f}'.format(
                 x, y,
-                'left,  ' if self.is_left([x, y]) else 'right, ',
-                self.get_ey([x, y]), self.get_gamma(index)))
+                'left,  ' if proj.left else 'right, ',
+                proj.ey, proj.gamma))
 
 
     def _pixelv(self, index, hreal, wreal, hpixel, wpixel):
@@ -237,6 +414,8 @@ class Path:
     def _quitm(self):
         """Used internally for quitting graphical application."""
         self._lp = False
+        if self._plot_root is not None:
+            self._plot_root.quit()
 
 
     def split(self):
@@ -270,16 +449,51 @@ class Path:
         """Return the closest x and y of the path to the given coordinates,
         as well as the index of the path list it is found on."""
         try:
-            closest = min(self.path,
-                        key = lambda a: (a[0] - xy[0])**2 + (a[1] - xy[1])**2)
-            index = self.path.index(closest)
-            return index, closest
+            if self._index is not None:
+                index = self._index.nearest(xy)
+            else:
+                index = min(range(len(self.path)),
+                            key = lambda i: (self.path[i][0] - xy[0])**2 +
+                                            (self.path[i][1] - xy[1])**2)
+
+            return index, self.path[index]
 
         except Exception as e:
             print('\nError when retrieving closest point on path: {}'.format(e))
             return 0, [0, 0]
 
 
+    def get_closest_window(self, xy, hint, window = 50):
+        """Returns the closest point like get_closest(), but only searches the
+        indices within window of the index hint. If the closest point found
+        lies on the edge of the window the true closest point might be outside
+        of it, and a search over the whole path is done instead. """
+        N = len(self.path)
+        if 2*window + 1 >= N:
+            return self.get_closest(xy)
+
+        best_offset = 0
+        best_d = None
+        for offset in range(-window, window + 1):
+            a = self.path[(hint + offset) % N]
+            d = (a[0] - xy[0])**2 + (a[1] - xy[1])**2
+            if best_d is None or d < best_d:
+                best_offset = offset
+                best_d = d
+
+        if abs(best_offset) == window:
+            return self.get_closest(xy)
+
+        index = (hint + best_offset) % N
+        return index, self.path[index]
+
+
+    def tracker(self, window = 50):
+        """Returns a new tracker that keeps track of the closest point between
+        calls. """
+        return PathTracker(self, window)
+
+
     def get_tangent(self, index):
         """Returns a unit vector approximating the tangent direction at the
         given index. The tangent points in the direction of the path. """
@@ -316,27 +530,97 @@ class Path:
 
     def is_left(self, xy):
         """Returns True if point (x, y) is to the left of the path. """
-        index, closest = self.get_closest(xy)
+        return self.project(xy).left
+
+
+    def get_ey(self, xy):
+        """Returns the y error of the given point (x, y). The error is negative
+        if the point is to the left of the path. """
+        return self.project(xy).ey
+
+
+    def project(self, xy, hint = None, window = 50):
+        """Projects the point (x, y) on the path with a single closest point
+        search. Returns a Projection containing the closest index and point,
+        the y error, whether the point is to the left of the path, and gamma,
+        gamma prime and gamma prime prime at the closest index. If hint is
+        given only a window around that index is searched, see
+        get_closest_window(). """
+        if hint is None:
+            index, closest = self.get_closest(xy)
+        else:
+            index, closest = self.get_closest_window(xy, hint, window)
+
+        dx = xy[0] - closest[0]
+        dy = xy[1] - closest[1]
 
         n = self.get_normal(index)
+        left = n[0]*dx + n[1]*dy < 0
 
-        val = n[0]*(xy[0] - closest[0]) + n[1]*(xy[1] - closest[1])
+        ey = math.sqrt(dx**2 + dy**2)
+        if left:
+            ey = -ey
+
+        return Projection(index, closest, ey, left, self.get_gamma(index),
+                          self.get_gammap(index), self.get_gammapp(index))
 
-        if val >= 0:
-            return False
+
+    def project_segment(self, xy, hint = None, window = 50):
+        """Projects the point (x, y) on the line segments of the path instead
+        of on the closest point. Returns a SegmentProjection where gamma, gamma
+        prime and gamma prime prime are linearly interpolated between the
+        segment end points, so that the values change continuously along the
+        path also for sparse paths. If hint is given only a window around that
+        index is searched, see get_closest_window(). """
+        if hint is None:
+            index, _ = self.get_closest(xy)
         else:
-            return True
+            index, _ = self.get_closest_window(xy, hint, window)
 
+        # The closest point lies on one of the segments next to the closest
+        # point of the path.
+        N = len(self.path)
+        best = None
+        for i in [(index - 1) % N, index]:
+            x1, y1 = self.get_xy(i)
+            x2, y2 = self.get_xy(i + 1)
+            dx = x2 - x1
+            dy = y2 - y1
+            l2 = dx**2 + dy**2
+
+            if l2 > 0:
+                t = ((xy[0] - x1)*dx + (xy[1] - y1)*dy)/l2
+                t = min(max(t, 0), 1)
+            else:
+                t = 0
 
-    def get_ey(self, xy):
-        """Returns the y error of the given point (x, y). The error is positive
-        if the point is to the left of the path. """
-        index, closest = self.get_closest(xy)
-        ey = math.sqrt((xy[0] - closest[0])**2 + (xy[1] - closest[1])**2)
-        if self.is_left(xy):
+            px = x1 + t*dx
+            py = y1 + t*dy
+            d2 = (xy[0] - px)**2 + (xy[1] - py)**2
+
+            if best is None or d2 < best[0]:
+                best = [d2, i, t, px, py, dx, dy]
+
+        d2, i, t, px, py, dx, dy = best
+
+        left = dx*(xy[1] - py) - dy*(xy[0] - px) > 0
+        ey = math.sqrt(d2)
+        if left:
             ey = -ey
 
-        return ey
+        s = (self.arclength[i] + t*self._segment((i + 1) % N)) % self.length
+
+        # Interpolate gamma the short way around the circle.
+        gamma1 = self.get_gamma(i)
+        gamma_diff = (self.get_gamma(i + 1) - gamma1 + math.pi) % (
+            2*math.pi) - math.pi
+        gamma = (gamma1 + t*gamma_diff) % (2*math.pi)
+
+        gammap = (1 - t)*self.get_gammap(i) + t*self.get_gammap(i + 1)
+        gammapp = (1 - t)*self.get_gammapp(i) + t*self.get_gammapp(i + 1)
+
+        return SegmentProjection(i, t, s, [px, py], ey, left,
+                                 gamma, gammap, gammapp)
 
 
     def get_gamma(self, index):
@@ -369,95 +653,458 @@ class Path:
             return 0
 
 
+    def get_closest_batch(self, xy):
+        """Batched version of get_closest(). xy is an (M, 2) array of
+        coordinates. Returns an array of the M closest indices and an (M, 2)
+        array of the closest points. """
+        points = self._arrays()[0]
+        xy = np.asarray(xy, dtype = float).reshape(-1, 2)
+        indices = np.zeros(len(xy), dtype = int)
+
+        # Compare against all points, a chunk of coordinates at a time to
+        # limit the memory used for the distances.
+        chunk = max(1, BATCH_ELEMENTS//max(1, len(points)))
+        for start in range(0, len(xy), chunk):
+            q = xy[start:start + chunk]
+            d = (points[:, 0] - q[:, 0:1])**2 + (points[:, 1] - q[:, 1:2])**2
+            indices[start:start + chunk] = np.argmin(d, axis = 1)
+
+        return indices, points[indices]
+
+
+    def get_ey_batch(self, xy):
+        """Batched version of get_ey(). Returns an array of y errors. """
+        return self.project_batch(xy).ey
+
+
+    def get_gamma_batch(self, indices):
+        """Returns an array of gamma at the given indices."""
+        gamma = self._arrays()[1]
+        return gamma[np.asarray(indices) % len(gamma)]
+
+
+    def get_gammap_batch(self, indices):
+        """Returns an array of gamma prime at the given indices."""
+        gammap = self._arrays()[2]
+        return gammap[np.asarray(indices) % len(gammap)]
+
+
+    def get_gammapp_batch(self, indices):
+        """Returns an array of gamma prime prime at the given indices."""
+        gammapp = self._arrays()[3]
+        return gammapp[np.asarray(indices) % len(gammapp)]
+
+
+    def project_batch(self, xy):
+        """Batched version of project(). xy is an (M, 2) array of coordinates.
+        Returns a Projection where each field is an array with one value per
+        coordinate pair. """
+        points, gamma, gammap, gammapp = self._arrays()
+        xy = np.asarray(xy, dtype = float).reshape(-1, 2)
+        indices, closest = self.get_closest_batch(xy)
+
+        # Tangent directions as in get_tangent(), left if the point is on the
+        # other side of the right pointing normal.
+        N = len(points)
+        tangent = points[(indices + 1) % N] - points[indices - 1]
+        diff = xy - closest
+        left = tangent[:, 1]*diff[:, 0] - tangent[:, 0]*diff[:, 1] < 0
+
+        ey = np.sqrt(np.sum(diff**2, axis = 1))
+        ey[left] = - ey[left]
+
+        return Projection(indices, closest, ey, left, gamma[indices],
+                          gammap[indices], gammapp[indices])
+
+
+    def frenet_transform(self, trajectory):
+        """Transforms a whole trajectory to path coordinates. trajectory is a
+        (T, 2) array of x and y or a (T, 3) array of x, y and yaw. Each sample
+        is projected on the path segments next to its closest point. Returns
+        a FrenetTrajectory with arrays of the closest indices, the arc
+        lengths, the y errors and the heading errors yaw - gamma between -pi
+        and pi, which is None if there is no yaw. The arc length is unwrapped
+        across laps, so that it keeps increasing when driving several laps
+        along the path. """
+        points, gamma = self._arrays()[:2]
+        traj = np.asarray(trajectory, dtype = float)
+        traj = traj.reshape(len(traj), -1)
+        xy = traj[:, :2]
+
+        N = len(points)
+        indices, _ = self.get_closest_batch(xy)
+        arclength = np.asarray(self.arclength, dtype = float)
+        seg = np.append(np.diff(arclength), self.length - arclength[-1])
+
+        # Project on the segments before and after the closest points and keep
+        # the closer one, the one before if they are equally close.
+        best = None
+        for k in [(indices - 1) % N, indices]:
+            start = points[k]
+            d = points[(k + 1) % N] - start
+            l2 = np.sum(d**2, axis = 1)
+            t = np.sum((xy - start)*d, axis = 1)/np.where(l2 > 0, l2, 1)
+            t = np.clip(t, 0, 1)
+            foot = start + t[:, None]*d
+            d2 = np.sum((xy - foot)**2, axis = 1)
+
+            if best is None:
+                best = [k, t, foot, d, d2]
+            else:
+                closer = d2 < best[4]
+                for old, new in zip(best, [k, t, foot, d, d2]):
+                    old[closer] = new[closer]
+
+        k, t, foot, d, d2 = best
+
+        diff = xy - foot
+        ey = np.sqrt(d2)
+        left = d[:, 0]*diff[:, 1] - d[:, 1]*diff[:, 0] > 0
+        ey[left] = - ey[left]
+
+        # Arc length, with a lap added or removed when passing the start.
+        s = np.mod(arclength[k] + t*seg[k], self.length)
+        step = np.diff(s)
+        laps = np.concatenate(([0], np.cumsum(
+            (step < -self.length/2).astype(int) -
+            (step > self.length/2).astype(int))))
+        s = s + laps*self.length
+
+        heading = None
+        if traj.shape[1] > 2:
+            # Interpolate gamma the short way around the circle.
+            gamma_diff = np.mod(gamma[(k + 1) % N] - gamma[k] + math.pi,
+                                2*math.pi) - math.pi
+            heading = np.mod(traj[:, 2] - gamma[k] - t*gamma_diff + math.pi,
+                             2*math.pi) - math.pi
+
+        return FrenetTrajectory(k, s, ey, heading)
+
+
+    def freeze(self):
+        """Makes the path immutable and returns it. Methods that change the
+        path raise a RuntimeError afterwards, so a frozen path can be shared
+        between threads and swapped in with a single assignment without any
+        locking. """
+        self.path = tuple(tuple(xy) for xy in self.path)
+        self.gamma = tuple(self.gamma)
+        self.gammap = tuple(self.gammap)
+        self.gammapp = tuple(self.gammapp)
+        self.arclength = tuple(self.arclength)
+        self.frozen = True
+        self._arrays()      # Fill the cache now instead of in a query.
+
+        return self
+
+
+    def _check_frozen(self):
+        """Used internally to refuse changes to a frozen path. """
+        if self.frozen:
+            raise RuntimeError('The path is frozen and can not be changed.')
+
+
+    def append_point(self, xy):
+        """Appends the point xy to the end of the path. Only the values of the
+        points around it are recalculated, see insert_point(). """
+        self.insert_point(len(self.path), xy)
+
+
+    def insert_point(self, index, xy):
+        """Inserts the point xy before the point at index. Gamma, gamma prime
+        and gamma prime prime are only recalculated for the points whose
+        values depend on the new point, the arc lengths after it are shifted
+        and the spatial index is updated in place. """
+        self._check_frozen()
+        N = len(self.path)
+        if not 0 <= index <= N:
+            print('\nError when inserting point: index {} out of range'.format(
+                index))
+            return
+
+        self._insert_values(index, [float(xy[0]), float(xy[1])])
+        if self._index is not None:
+            self._index.insert(index, xy)
+        self._points_edited(index, index, index + 1)
+
+
+    def move_point(self, index, xy):
+        """Moves the point at index to xy, see insert_point(). """
+        self._check_frozen()
+        N = len(self.path)
+        if not -N <= index < N:
+            print('\nError when moving point: index {} out of range'.format(
+                index))
+            return
+
+        index = index % N
+        self._set_point(index, [float(xy[0]), float(xy[1])])
+        if self._index is not None:
+            self._index.move(index, xy)
+        self._points_edited(index, index, index + 1)
+
+
+    def delete_point(self, index):
+        """Deletes the point at index, see insert_point(). """
+        self._check_frozen()
+        N = len(self.path)
+        if not -N <= index < N:
+            print('\nError when deleting point: index {} out of range'.format(
+                index))
+            return
+
+        index = index % N
+        self._delete_values(index)
+        if self._index is not None:
+            self._index.remove(index)
+
+        # The points before and after the deleted point are now neighbours.
+        self._points_edited(index - 1, index, index)
+
+
+    def _insert_values(self, index, xy):
+        """Used internally to insert a point and placeholder values. """
+        self.path.insert(index, xy)
+        for values in [self.gamma, self.gammap, self.gammapp, self.arclength]:
+            values.insert(index, 0)
+
+
+    def _set_point(self, index, xy):
+        """Used internally to change the coordinates of a point. """
+        self.path[index] = xy
+
+
+    def _delete_values(self, index):
+        """Used internally to delete a point and its values. """
+        for values in [self.path, self.gamma, self.gammap, self.gammapp,
+                       self.arclength]:
+            del values[index]
+
+
+    def _points_edited(self, first, last, end):
+        """Used internally after editing points. The points from index first
+        to last have changed and the arc lengths up to index end have to be
+        recalculated. gamma depends on the neighbouring points, gamma prime on
+        the neighbouring gammas and gamma prime prime on the neighbouring gamma
+        primes, so up to three points on each side are affected. """
+        N = len(self.path)
+
+        if N < 3:
+            # Too few points for the path angles, only keep the points.
+            self._clear_gammas()
+            self._calc_arclength()
+            self._build_index()
+            self.revision += 1
+            return
+
+        if N < 9:
+            self._calc_gammas()
+            return
+
+        for k, update in enumerate([self._update_gamma, self._update_gammap,
+                                    self._update_gammapp]):
+            update([i % N for i in range(first - 1 - k, last + 2 + k)])
+
+        self._update_arclength(max(first, 0), min(end, N - 1))
+
+        if self._index is None:
+            self._build_index()
+        self.revision += 1
+
+
+    def _clear_gammas(self):
+        """Used internally to set gamma, gamma prime and gamma prime prime to
+        zero at all points. """
+        N = len(self.path)
+        self.gamma = [0 for i in range(N)]
+        self.gammap = [0 for i in range(N)]
+        self.gammapp = [0 for i in range(N)]
+
+
+    def _update_gamma(self, indices):
+        """Used internally to recalculate gamma at the given indices. """
+        for i in indices:
+            self.gamma[i] = self._gamma_at(i)
+
+
+    def _update_gammap(self, indices):
+        """Used internally to recalculate gamma prime at the given indices. """
+        for i in indices:
+            self.gammap[i] = self._gammap_at(i)
+
+
+    def _update_gammapp(self, indices):
+        """Used internally to recalculate gamma prime prime at the given
+        indices. """
+        for i in indices:
+            self.gammapp[i] = self._gammapp_at(i)
+
+
+    def _update_arclength(self, start, end):
+        """Used internally to recalculate the arc lengths from index start to
+        end. The arc lengths after end are shifted by the change at end. """
+        old = self.arclength[end]
+
+        self.arclength[0] = 0
+        for i in range(max(start, 1), end + 1):
+            self.arclength[i] = self.arclength[i - 1] + self._distance(i - 1, i)
+
+        delta = self.arclength[end] - old
+        for i in range(end + 1, len(self.arclength)):
+            self.arclength[i] += delta
+
+        self.length = self.arclength[-1] + self._distance(-1, 0)
+
+
+    def _distance(self, i1, i2):
+        """Used internally. Returns the distance between two points. """
+        return math.sqrt((self.path[i2][0] - self.path[i1][0])**2 +
+                         (self.path[i2][1] - self.path[i1][1])**2)
+
+
+    def _arrays(self):
+        """Used internally. Returns the points as an (N, 2) array and gamma,
+        gamma prime and gamma prime prime as arrays. The arrays are cached
+        until the path changes. """
+        if self._array_cache is None or (
+            self._array_cache[0] != self.revision):
+            self._array_cache = [self.revision,
+                np.asarray(self.path, dtype = float).reshape(-1, 2),
+                np.asarray(self.gamma, dtype = float),
+                np.asarray(self.gammap, dtype = float),
+                np.asarray(self.gammapp, dtype = float)]
+
+        return self._array_cache[1:]
+
+
     def _calc_gammas(self):
         """Used internally to calculate gammas."""
         self._calc_gamma()
         self._calc_gammap()
         self._calc_gammapp()
+        self._calc_arclength()
+        self._build_index()
+        self.revision += 1
 
 
-    def _calc_gamma(self):
-        """Used internally to calculate gamma values and save them."""
-        self.gamma = [0 for i in range(len(self.path))]
+    def _calc_arclength(self):
+        """Used internally to calculate the cumulative arc length at each
+        point and the length of the closed path. """
+        self.arclength = [0 for i in range(len(self.path))]
+        self.length = 0
 
         for i in range(len(self.path)):
             x1 = self.path[i - 1][0]
             y1 = self.path[i - 1][1]
-            if i == len(self.path) - 1: # At end of list, grab first of list.
-                x2 = self.path[0][0]
-                y2 = self.path[0][1]
+            x2 = self.path[i][0]
+            y2 = self.path[i][1]
+            d = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
+
+            if i > 0:
+                self.arclength[i] = self.arclength[i - 1] + d
             else:
-                x2 = self.path[i + 1][0]
-                y2 = self.path[i + 1][1]
+                closing = d     # Segment from the last point to the first.
 
-            try:
-                angle = math.atan((y2 - y1)/(x2 - x1))
+        if len(self.path) > 0:
+            self.length = self.arclength[-1] + closing
 
-                if x2 < x1:     # Calculate 3rd and 4th quadrant correctly.
-                    angle = angle + math.pi
-                elif y2 < y1:   # Make angles in range 0 to 2 pi.
-                    angle = angle + 2*math.pi
 
-                self.gamma[i] = angle
+    def _build_index(self):
+        """Used internally to build the spatial index for closest point
+        queries. """
+        if self.use_index and len(self.path) > 0:
+            self._index = GridIndex(self.path)
+        else:
+            self._index = None
 
-            except ZeroDivisionError:   # Angle is pi/2 or 3pi/2
-                if y2 > y1:
-                    self.gamma[i] = math.pi/2
-                else:
-                    self.gamma[i] = 3*math.pi/2
 
+    def _calc_gamma(self):
+        """Used internally to calculate gamma values and save them."""
+        self.gamma = [self._gamma_at(i) for i in range(len(self.path))]
 
-    def _calc_gammap(self):
-        """Used internally to calculate gamma prime."""
-        self.gammap = [0 for i in range(len(self.path))]
 
-        for i in range(len(self.gamma)):
-            x1 = self.path[i - 1][0]
-            y1 = self.path[i - 1][1]
-            x2 = self.path[i][0]
-            y2 = self.path[i][1]
-            if i == len(self.path) - 1: # At end of list, grab first of list.
-                x3 = self.path[0][0]
-                y3 = self.path[0][1]
-                gammap3 = self.gamma[0]
+    def _gamma_at(self, i):
+        """Used internally to calculate the gamma value at index i."""
+        x1 = self.path[i - 1][0]
+        y1 = self.path[i - 1][1]
+        if i == len(self.path) - 1: # At end of list, grab first of list.
+            x2 = self.path[0][0]
+            y2 = self.path[0][1]
+        else:
+            x2 = self.path[i + 1][0]
+            y2 = self.path[i + 1][1]
+
+        try:
+            angle = math.atan((y2 - y1)/(x2 - x1))
+
+            if x2 < x1:     # Calculate 3rd and 4th quadrant correctly.
+                angle = angle + math.pi
+            elif y2 < y1:   # Make angles in range 0 to 2 pi.
+                angle = angle + 2*math.pi
+
+            return angle
+
+        except ZeroDivisionError:   # Angle is pi/2 or 3pi/2
+            if y2 > y1:
+                return math.pi/2
             else:
-                x3 = self.path[i + 1][0]
-                y3 = self.path[i + 1][1]
-                gammap3 = self.gamma[i + 1]
+                return 3*math.pi/2
 
-            gamma_diff = gammap3 - self.gamma[i - 1]    # Make sure difference
-            while gamma_diff > 2*math.pi:               # is between 0 and 2 pi.
-                gamma_diff = gamma_diff - 2*math.pi
-            while gamma_diff < 0:
-                gamma_diff = gamma_diff + 2*math.pi
 
-            self.gammap[i] = gamma_diff / (
-                            math.sqrt((x3 - x2)**2 + (y3 - y2)**2) + math.sqrt(
-                            (x2 - x1)**2 + (y2 - y1)**2))
+    def _calc_gammap(self):
+        """Used internally to calculate gamma prime."""
+        self.gammap = [self._gammap_at(i) for i in range(len(self.gamma))]
+
+
+    def _gammap_at(self, i):
+        """Used internally to calculate gamma prime at index i."""
+        x1 = self.path[i - 1][0]
+        y1 = self.path[i - 1][1]
+        x2 = self.path[i][0]
+        y2 = self.path[i][1]
+        if i == len(self.path) - 1: # At end of list, grab first of list.
+            x3 = self.path[0][0]
+            y3 = self.path[0][1]
+            gammap3 = self.gamma[0]
+        else:
+            x3 = self.path[i + 1][0]
+            y3 = self.path[i + 1][1]
+            gammap3 = self.gamma[i + 1]
+
+        gamma_diff = gammap3 - self.gamma[i - 1]    # Make sure difference
+        while gamma_diff > 2*math.pi:               # is between 0 and 2 pi.
+            gamma_diff = gamma_diff - 2*math.pi
+        while gamma_diff < 0:
+            gamma_diff = gamma_diff + 2*math.pi
+
+        return gamma_diff / (
+                        math.sqrt((x3 - x2)**2 + (y3 - y2)**2) + math.sqrt(
+                        (x2 - x1)**2 + (y2 - y1)**2))
 
 
     def _calc_gammapp(self):
         """Used internally to calculate gamma prime prime."""
-        self.gammapp = [0 for i in range(len(self.path))]
+        self.gammapp = [self._gammapp_at(i) for i in range(len(self.gamma))]
 
-        for i in range(len(self.gamma)):
-            x1 = self.path[i - 1][0]
-            y1 = self.path[i - 1][1]
-            x2 = self.path[i][0]
-            y2 = self.path[i][1]
-            if i == len(self.path) - 1:
-                x3 = self.path[0][0]
-                y3 = self.path[0][1]
-                gammap3 = self.gammap[0]
 
-            else:
-                x3 = self.path[i + 1][0]
-                y3 = self.path[i + 1][1]
-                gammap3 = self.gammap[i + 1]
+    def _gammapp_at(self, i):
+        """Used internally to calculate gamma prime prime at index i."""
+        x1 = self.path[i - 1][0]
+        y1 = self.path[i - 1][1]
+        x2 = self.path[i][0]
+        y2 = self.path[i][1]
+        if i == len(self.path) - 1:
+            x3 = self.path[0][0]
+            y3 = self.path[0][1]
+            gammap3 = self.gammap[0]
 
-            self.gammapp[i] = (gammap3 - self.gammap[i - 1]) / (
-                        math.sqrt((x3 - x2)**2 + (y3 - y2)**2) + math.sqrt(
-                        (x2 - x1)**2 + (y2 - y1)**2))
+        else:
+            x3 = self.path[i + 1][0]
+            y3 = self.path[i + 1][1]
+            gammap3 = self.gammap[i + 1]
+
+        return (gammap3 - self.gammap[i - 1]) / (
+                    math.sqrt((x3 - x2)**2 + (y3 - y2)**2) + math.sqrt(
+                    (x2 - x1)**2 + (y2 - y1)**2))
 
 
     def get_distance(self, xy1, xy2):
@@ -472,23 +1119,1094 @@ class Path:
 
     def get_distance_from_indices(self, i1, i2):
         """Returns the distance along the path between the two indices. The
-        distance is calculate from i1 back along the path to i2. """
-        dist_sum = 0
-
-        i = i1
-        i_lower = i2 if i2 < i1 else i2 - len(self.path)
+        distance is calculate from i1 back along the path to i2. The segment
+        leading up to i2 is included in the distance. """
+        N = len(self.path)
+        if N == 0:
+            return 0
 
-        while i >= i_lower:
-            xy_l = self.get_xy(i - 1)
-            xy_u = self.get_xy(i)
-            dist_sum += math.sqrt(
-                (xy_u[0] - xy_l[0])**2 + (xy_u[1] - xy_l[1])**2)
+        i1 = i1 % N
+        i2 = i2 % N
 
-            i -= 1
+        dist_sum = self.arclength[i1] - self.arclength[i2] + self._segment(i2)
+        if i2 >= i1:
+            dist_sum += self.length     # Passing the start of the path.
 
         return dist_sum
 
 
+    def get_distance_from_indices_batch(self, i1, i2):
+        """Batched version of get_distance_from_indices(). i1 and i2 are
+        arrays of indices. Returns an array of the distances. """
+        arclength = np.asarray(self.arclength, dtype = float)
+        N = len(arclength)
+        if N == 0:
+            return np.zeros(len(i1))
+
+        i1 = np.asarray(i1) % N
+        i2 = np.asarray(i2) % N
+
+        segment = arclength[i2] - arclength[i2 - 1] + self.length*(i2 == 0)
+
+        return (arclength[i1] - arclength[i2] + segment +
+                self.length*(i2 >= i1))
+
+
+    def _segment(self, i):
+        """Used internally. Returns the length of the segment from index
+        i - 1 to index i. """
+        if i == 0:
+            return self.length - self.arclength[-1]
+        else:
+            return self.arclength[i] - self.arclength[i - 1]
+
+
+    def point_at_arclength(self, s):
+        """Returns the point [x, y] at distance s along the path from the
+        first point. s wraps around the closed path. """
+        try:
+            s = s % self.length
+            index = bisect.bisect_right(self.arclength, s) - 1
+
+            return self._interpolate_segment(index, s - self.arclength[index])
+
+        except Exception as e:
+            print('\nError when retrieving point at arc length: {}'.format(e))
+            return [0, 0]
+
+
+    def _interpolate_segment(self, index, ds):
+        """Used internally. Returns the point at distance ds from the point at
+        index towards the next point. """
+        xy1 = self.get_xy(index)
+        xy2 = self.get_xy(index + 1)
+        seg = self._segment((index + 1) % len(self.path))
+
+        if seg == 0:
+            return xy1
+
+        t = ds/seg
+        return [xy1[0] + t*(xy2[0] - xy1[0]), xy1[1] + t*(xy2[1] - xy1[1])]
+
+
+class ArrayPath(Path):
+    """Path where the coordinates are kept in an (N, 2) numpy array and the
+    gamma values in numpy arrays. The gamma values are calculated with
+    vectorized operations, which makes generating and reversing large paths
+    fast. The accessors of Path work the same on an ArrayPath. """
+    def __init__(self, use_index = True):
+        Path.__init__(self, use_index)
+        self.path = np.zeros((0, 2))
+        self.gamma = np.zeros(0)
+        self.gammap = np.zeros(0)
+        self.gammapp = np.zeros(0)
+        self.arclength = np.zeros(0)
+
+
+    def load_binary(self, filename, verify = True):
+        """Loads a path saved with save_binary(). The file is memory-mapped,
+        so the arrays are read-only and processes loading the same file share
+        the memory. If verify is True the checksum of the file is checked,
+        which reads the whole file. """
+        self._check_frozen()
+        try:
+            __location__ = os.path.realpath(os.path.join(os.getcwd(),
+                                            os.path.dirname(__file__)))
+            mm = np.memmap(os.path.join(__location__, filename),
+                           dtype = np.uint8, mode = 'r')
+
+            header = BINARY_HEADER.unpack(mm[:BINARY_HEADER.size].tostring())
+            (magic, version, checksum, N, ncells, length, cell_size,
+                xr, yr, xc, yc, theta0, dtheta) = header
+
+            if magic != BINARY_MAGIC:
+                raise ValueError('{} is not a binary path file'.format(
+                    filename))
+            if version != BINARY_VERSION:
+                raise ValueError('unsupported binary path version {}'.format(
+                    version))
+            if verify and zlib.crc32(mm[BINARY_HEADER.size:]) & (
+                0xffffffff) != checksum:
+                raise ValueError('checksum mismatch in {}'.format(filename))
+
+            # Views into the memory map for each of the stored arrays. The
+            # indices of the grid cells are only stored if there is a grid.
+            norder = N if ncells > 0 else 0
+            views = []
+            offset = BINARY_HEADER.size
+            for dtype, shape in [(np.float64, (N, 2)), (np.float64, N),
+                                 (np.float64, N), (np.float64, N),
+                                 (np.float64, N), (np.int64, ncells),
+                                 (np.int64, ncells), (np.int64, ncells + 1),
+                                 (np.int64, norder)]:
+                nbytes = int(np.prod(shape))*8
+                views.append(mm[offset:offset + nbytes].view(dtype).reshape(
+                    shape))
+                offset += nbytes
+
+            # Knots of a spline path in the rest of the file.
+            if (len(mm) - offset) % 16 != 0:
+                raise ValueError('wrong size of {}'.format(filename))
+            knots = mm[offset:].view(np.float64).reshape(-1, 2)
+
+        except Exception as e:
+            print('\nError when loading path from file: {}'.format(e))
+            return
+
+        self.path, self.gamma, self.gammap, self.gammapp, self.arclength = (
+            views[:5])
+        self.length = length
+        self.xr = xr
+        self.yr = yr
+        self.xc = xc
+        self.yc = yc
+        self._load_binary_params(theta0, dtheta, knots)
+
+        if ncells > 0 and self.use_index:
+            self._index = GridIndex(self.path, cell_size, views[5:])
+        else:
+            self._build_index()
+
+        self.revision += 1
+
+
+    def _load_binary_params(self, theta0, dtheta, knots):
+        """Used internally to restore subclass specific values stored in a
+        binary path file. """
+        pass
+
+
+    def _circle_points(self, x_mag, y_mag, center, points):
+        """Used internally to calculate the points of an ellipse. """
+        t = 2*math.pi*np.arange(points)/points
+        return np.column_stack((center[0] + x_mag*np.cos(t),
+                                center[1] + y_mag*np.sin(t)))
+
+
+    def reverse(self):
+        """Reverses the path. Recalculates gamma values."""
+        self._check_frozen()
+        self.path = self.path[::-1]
+        self._calc_gammas()
+
+
+    def interpolate(self):
+        """Interpolates the path. Adds one point between each pair of points
+        of the original path."""
+        self._check_frozen()
+        newpath = np.empty((2*len(self.path), 2))
+        newpath[0::2] = self.path
+        newpath[1::2] = (self.path + np.roll(self.path, -1, axis = 0))/2
+
+        self.path = newpath
+        self._calc_gammas()
+
+
+    def split(self):
+        """Returns two lists, one containing x and one containing y."""
+        return self.path[:, 0].tolist(), self.path[:, 1].tolist()
+
+
+    def get_closest(self, xy):
+        """Return the closest x and y of the path to the given coordinates,
+        as well as the index of the path list it is found on."""
+        if self._index is not None:
+            return Path.get_closest(self, xy)
+
+        try:
+            d = (self.path[:, 0] - xy[0])**2 + (self.path[:, 1] - xy[1])**2
+            index = int(np.argmin(d))
+            return index, self.path[index]
+
+        except Exception as e:
+            print('\nError when retrieving closest point on path: {}'.format(e))
+            return 0, [0, 0]
+
+
+    def get_closest_window(self, xy, hint, window = 50):
+        """Returns the closest point searching only a window around the index
+        hint, see Path.get_closest_window(). """
+        N = len(self.path)
+        if 2*window + 1 >= N:
+            return self.get_closest(xy)
+
+        offsets = np.arange(-window, window + 1)
+        indices = (hint + offsets) % N
+        d = (self.path[indices, 0] - xy[0])**2 + (
+            self.path[indices, 1] - xy[1])**2
+        best = int(np.argmin(d))
+
+        if abs(offsets[best]) == window:
+            return self.get_closest(xy)
+
+        index = int(indices[best])
+        return index, self.path[index]
+
+
+    def freeze(self):
+        """Makes the path immutable and returns it, see Path.freeze(). The
+        arrays are made read-only. """
+        for values in [self.path, self.gamma, self.gammap, self.gammapp,
+                       self.arclength]:
+            values.setflags(write = False)
+        self.frozen = True
+
+        return self
+
+
+    def _insert_values(self, index, xy):
+        """Used internally to insert a point and placeholder values. """
+        self.path = np.insert(self.path.reshape(-1, 2), index, xy, axis = 0)
+        self.gamma = np.insert(self.gamma, index, 0)
+        self.gammap = np.insert(self.gammap, index, 0)
+        self.gammapp = np.insert(self.gammapp, index, 0)
+        self.arclength = np.insert(self.arclength, index, 0)
+
+
+    def _set_point(self, index, xy):
+        """Used internally to change the coordinates of a point. Arrays loaded
+        with load_binary() are read-only and are copied first. """
+        if not self.path.flags.writeable:
+            self.path = np.array(self.path)
+            self.gamma = np.array(self.gamma)
+            self.gammap = np.array(self.gammap)
+            self.gammapp = np.array(self.gammapp)
+            self.arclength = np.array(self.arclength)
+
+        self.path[index] = xy
+
+
+    def _delete_values(self, index):
+        """Used internally to delete a point and its values. """
+        self.path = np.delete(self.path, index, axis = 0)
+        self.gamma = np.delete(self.gamma, index)
+        self.gammap = np.delete(self.gammap, index)
+        self.gammapp = np.delete(self.gammapp, index)
+        self.arclength = np.delete(self.arclength, index)
+
+
+    def _clear_gammas(self):
+        """Used internally to set gamma, gamma prime and gamma prime prime to
+        zero at all points. """
+        N = len(self.path)
+        self.gamma = np.zeros(N)
+        self.gammap = np.zeros(N)
+        self.gammapp = np.zeros(N)
+
+
+    def _update_gamma(self, indices):
+        """Used internally to recalculate gamma at the given indices. """
+        i = np.asarray(indices)
+        N = len(self.path)
+        d = self.path[(i + 1) % N] - self.path[i - 1]
+        gamma = np.mod(np.arctan2(d[:, 1], d[:, 0]), 2*math.pi)
+        gamma[(d[:, 0] == 0) & (d[:, 1] == 0)] = 3*math.pi/2
+        self.gamma[i] = gamma
+
+
+    def _update_gammap(self, indices):
+        """Used internally to recalculate gamma prime at the given indices. """
+        i = np.asarray(indices)
+        N = len(self.path)
+        gamma_diff = np.mod(self.gamma[(i + 1) % N] - self.gamma[i - 1],
+                            2*math.pi)
+        self.gammap[i] = gamma_diff/self._neighbour_distances(i)
+
+
+    def _update_gammapp(self, indices):
+        """Used internally to recalculate gamma prime prime at the given
+        indices. """
+        i = np.asarray(indices)
+        N = len(self.path)
+        gammap_diff = self.gammap[(i + 1) % N] - self.gammap[i - 1]
+        self.gammapp[i] = gammap_diff/self._neighbour_distances(i)
+
+
+    def _update_arclength(self, start, end):
+        """Used internally to recalculate the arc lengths from index start to
+        end. The arc lengths after end are shifted by the change at end. """
+        old = self.arclength[end]
+
+        self.arclength[0] = 0
+        start = max(start, 1)
+        if start <= end:
+            i = np.arange(start, end + 1)
+            seg = np.sqrt(np.sum((self.path[i] - self.path[i - 1])**2,
+                                 axis = 1))
+            self.arclength[start:end + 1] = self.arclength[start - 1] + (
+                np.cumsum(seg))
+
+        self.arclength[end + 1:] += self.arclength[end] - old
+        self.length = float(self.arclength[-1] + self._distance(-1, 0))
+
+
+    def _calc_gammas(self):
+        """Used internally to calculate gammas."""
+        self.path = np.ascontiguousarray(self.path, dtype = float)
+        self.path = self.path.reshape(-1, 2)
+        Path._calc_gammas(self)
+
+
+    def _calc_gamma(self):
+        """Used internally to calculate gamma values and save them."""
+        d = np.roll(self.path, -1, axis = 0) - np.roll(self.path, 1, axis = 0)
+        self.gamma = np.mod(np.arctan2(d[:, 1], d[:, 0]), 2*math.pi)
+
+        # Same value as Path gives for coinciding neighbours.
+        self.gamma[(d[:, 0] == 0) & (d[:, 1] == 0)] = 3*math.pi/2
+
+
+    def _calc_gammap(self):
+        """Used internally to calculate gamma prime."""
+        gamma_diff = np.mod(np.roll(self.gamma, -1) - np.roll(self.gamma, 1),
+                            2*math.pi)
+        self.gammap = gamma_diff/self._neighbour_distances()
+
+
+    def _calc_gammapp(self):
+        """Used internally to calculate gamma prime prime."""
+        gammap_diff = np.roll(self.gammap, -1) - np.roll(self.gammap, 1)
+        self.gammapp = gammap_diff/self._neighbour_distances()
+
+
+    def _calc_arclength(self):
+        """Used internally to calculate the cumulative arc length at each
+        point and the length of the closed path. """
+        seg = np.sqrt(np.sum(
+            (self.path - np.roll(self.path, 1, axis = 0))**2, axis = 1))
+
+        self.arclength = np.zeros(len(self.path))
+        self.arclength[1:] = np.cumsum(seg[1:])
+        self.length = float(np.sum(seg))
+
+
+    def point_at_arclength(self, s):
+        """Returns the point [x, y] at distance s along the path from the
+        first point. s wraps around the closed path. """
+        try:
+            s = s % self.length
+            index = int(np.searchsorted(self.arclength, s, side = 'right')) - 1
+
+            return self._interpolate_segment(index, s - self.arclength[index])
+
+        except Exception as e:
+            print('\nError when retrieving point at arc length: {}'.format(e))
+            return [0, 0]
+
+
+    def _arrays(self):
+        """Used internally. Returns the points and gamma arrays. """
+        return self.path, self.gamma, self.gammap, self.gammapp
+
+
+    def _neighbour_distances(self, indices = None):
+        """Used internally. Returns for each point, or for the points at the
+        given indices, the distance to the previous point plus the distance
+        to the next point. """
+        if indices is not None:
+            i = np.asarray(indices)
+            N = len(self.path)
+            return np.sqrt(np.sum(
+                (self.path[i] - self.path[i - 1])**2, axis = 1)) + np.sqrt(
+                np.sum((self.path[(i + 1) % N] - self.path[i])**2, axis = 1))
+
+        seg = np.sqrt(np.sum(
+            (self.path - np.roll(self.path, 1, axis = 0))**2, axis = 1))
+        return seg + np.roll(seg, -1)
+
+
+class EllipsePath(ArrayPath):
+    """Path for an ellipse generated with gen_circle_path(). The closest point,
+    gamma, gamma prime and gamma prime prime are calculated analytically from
+    the radii and center of the ellipse instead of from the path points, so
+    that queries take constant time and do not depend on the number of
+    points. The path points are still kept so that the path can be plotted
+    and used like any other path. If a path is loaded from file the generic
+    calculations of ArrayPath are used. """
+    def __init__(self, use_index = True):
+        ArrayPath.__init__(self, use_index)
+        self.max_iterations = 30    # Max iterations for closest point.
+
+        self._analytic = False      # If the path is a generated ellipse.
+
+        # The angle parameter of the point at index i is theta0 + i*dtheta.
+        self._theta0 = 0
+        self._dtheta = 0
+
+
+    def gen_circle_path(self, radius, points = 300, center = [0, 0]):
+        """Generates a circle path with specified radius and number of
+        points."""
+        values = ArrayPath.gen_circle_path(self, radius, points, center)
+
+        self._analytic = self.xr > 0 and self.yr > 0 and points > 0
+        self._theta0 = 0
+        if points > 0:
+            self._dtheta = 2*math.pi/points
+
+        return values
+
+
+    def load(self, filename):
+        """Loads path from file. Assumes lines to be on the format x,y"""
+        ArrayPath.load(self, filename)
+        self._analytic = False
+
+
+    def _load_binary_params(self, theta0, dtheta, knots):
+        """Used internally to restore the ellipse angle parameters stored in a
+        binary path file. """
+        self._theta0 = theta0
+        self._dtheta = dtheta
+        self._analytic = self.xr > 0 and self.yr > 0 and dtheta != 0
+
+
+    def reverse(self):
+        """Reverses the path. Recalculates gamma values."""
+        self._check_frozen()
+        if self._analytic:
+            self._theta0 = self._theta0 + (len(self.path) - 1)*self._dtheta
+            self._dtheta = -self._dtheta
+
+        ArrayPath.reverse(self)
+
+
+    def interpolate(self):
+        """Interpolates the path. Adds one point on the ellipse between each
+        pair of points of the original path."""
+        self._check_frozen()
+        if not self._analytic:
+            ArrayPath.interpolate(self)
+            return
+
+        self._dtheta = self._dtheta/2
+        theta = self._theta0 + self._dtheta*np.arange(2*len(self.path))
+        self.path = np.column_stack((self.xc + self.xr*np.cos(theta),
+                                     self.yc + self.yr*np.sin(theta)))
+        self._calc_gammas()
+
+
+    def resample(self, tolerance = 0.001, max_spacing = 0.1):
+        """Redistributes the points along the path, see Path.resample(). The
+        points are no longer evenly spaced in the ellipse angle, so the
+        generic calculations of ArrayPath are used afterwards. """
+        self._check_frozen()
+        self._analytic = False
+        return ArrayPath.resample(self, tolerance, max_spacing)
+
+
+    def _points_edited(self, first, last, end):
+        """Used internally after editing points. The path is no longer an
+        ellipse, so the generic calculations of ArrayPath are used. """
+        self._analytic = False
+        ArrayPath._points_edited(self, first, last, end)
+
+
+    def get_closest(self, xy):
+        """Return the closest x and y of the ellipse to the given coordinates,
+        as well as the index of the path point closest to it."""
+        if not self._analytic:
+            return ArrayPath.get_closest(self, xy)
+
+        theta = self._closest_theta(xy)
+        index = int(round(self._theta_index(theta))) % len(self.path)
+
+        return index, self._theta_point(theta)
+
+
+    def get_closest_window(self, xy, hint, window = 50):
+        """Returns the closest point. For a generated ellipse the closest point
+        is calculated directly and hint is not used. """
+        if not self._analytic:
+            return ArrayPath.get_closest_window(self, xy, hint, window)
+
+        return self.get_closest(xy)
+
+
+    def project(self, xy, hint = None, window = 50):
+        """Projects the point (x, y) on the ellipse, see Path.project(). gamma,
+        gamma prime and gamma prime prime are calculated at the closest point
+        on the ellipse. """
+        if not self._analytic:
+            return ArrayPath.project(self, xy, hint, window)
+
+        theta = self._closest_theta(xy)
+        index = int(round(self._theta_index(theta))) % len(self.path)
+        closest = self._theta_point(theta)
+        ey, left, gamma, gammap, gammapp = self._frenet_values(xy, theta)
+
+        return Projection(index, closest, ey, left, gamma, gammap, gammapp)
+
+
+    def project_segment(self, xy, hint = None, window = 50):
+        """Projects the point (x, y) on the ellipse, see
+        Path.project_segment(). The values are calculated at the closest point
+        on the ellipse. index and t give the position of that point between the
+        path points. """
+        if not self._analytic:
+            return ArrayPath.project_segment(self, xy, hint, window)
+
+        N = len(self.path)
+        theta = self._closest_theta(xy)
+        u = self._theta_index(theta) % N
+        index = int(math.floor(u)) % N
+        t = u - math.floor(u)
+        s = (self.arclength[index] + t*self._segment((index + 1) % N)) % (
+            self.length)
+        closest = self._theta_point(theta)
+        ey, left, gamma, gammap, gammapp = self._frenet_values(xy, theta)
+
+        return SegmentProjection(index, t, s, closest, ey, left,
+                                 gamma, gammap, gammapp)
+
+
+    def get_closest_batch(self, xy):
+        """Batched version of get_closest(). For a generated ellipse the
+        closest points are calculated analytically. """
+        if not self._analytic:
+            return ArrayPath.get_closest_batch(self, xy)
+
+        xy = np.asarray(xy, dtype = float).reshape(-1, 2)
+        theta = self._closest_theta_batch(xy)
+        indices = np.round(self._theta_index(theta)).astype(int) % len(
+            self.path)
+
+        return indices, self._theta_point_batch(theta)
+
+
+    def project_batch(self, xy):
+        """Batched version of project(). For a generated ellipse the values
+        are calculated analytically. """
+        if not self._analytic:
+            return ArrayPath.project_batch(self, xy)
+
+        xy = np.asarray(xy, dtype = float).reshape(-1, 2)
+        theta = self._closest_theta_batch(xy)
+        indices = np.round(self._theta_index(theta)).astype(int) % len(
+            self.path)
+        ey, left, gamma, gammap, gammapp = self._frenet_values_batch(
+            xy, theta)
+
+        return Projection(indices, self._theta_point_batch(theta), ey, left,
+                          gamma, gammap, gammapp)
+
+
+    def _closest_theta_batch(self, xy):
+        """Used internally. Vectorized version of _closest_theta() for an
+        (M, 2) array of coordinates. """
+        a = self.xr
+        b = self.yr
+        px = np.abs(xy[:, 0] - self.xc)
+        py = np.abs(xy[:, 1] - self.yc)
+
+        lo = np.zeros(len(xy))
+        hi = np.ones(len(xy))*math.pi/2
+        theta = np.arctan2(a*py, b*px)
+
+        # Points on the axes are solved in closed form.
+        axis = (px == 0) | (py == 0)
+        theta[axis] = self._axis_theta_batch(px[axis], py[axis])
+
+        for i in range(self.max_iterations):
+            s = np.sin(theta)
+            c = np.cos(theta)
+            df = (b**2 - a**2)*s*c + a*px*s - b*py*c
+            ddf = (b**2 - a**2)*(c**2 - s**2) + a*px*c + b*py*s
+
+            lo = np.where(df < 0, theta, lo)
+            hi = np.where(df < 0, hi, theta)
+
+            with np.errstate(divide = 'ignore', invalid = 'ignore'):
+                newton = theta - df/ddf
+                use_newton = (ddf > 0) & (lo <= newton) & (newton <= hi)
+            new_theta = np.where(use_newton, newton, (lo + hi)/2)
+            new_theta[axis] = theta[axis]
+
+            converged = np.all(np.abs(new_theta - theta) < 1e-12)
+            theta = new_theta
+            if converged:
+                break
+
+        theta = np.where(xy[:, 0] - self.xc < 0, math.pi - theta, theta)
+        theta = np.where(xy[:, 1] - self.yc < 0, - theta, theta)
+
+        return theta
+
+
+    def _axis_theta_batch(self, px, py):
+        """Used internally. Vectorized version of _axis_theta(). """
+        a = self.xr
+        b = self.yr
+        theta = np.where(py == 0, 0., math.pi/2)
+
+        if a > b:
+            inside = (py == 0) & (a*px < a**2 - b**2)
+            theta[inside] = np.arccos(a*px[inside]/(a**2 - b**2))
+        elif b > a:
+            inside = (px == 0) & (b*py < b**2 - a**2)
+            theta[inside] = np.arcsin(b*py[inside]/(b**2 - a**2))
+
+        return theta
+
+
+    def _theta_point_batch(self, theta):
+        """Used internally. Returns an (M, 2) array of the points on the
+        ellipse at the angle parameters theta. """
+        return np.column_stack((self.xc + self.xr*np.cos(theta),
+                                self.yc + self.yr*np.sin(theta)))
+
+
+    def _closest_theta(self, xy):
+        """Used internally. Returns the angle parameter of the point on the
+        ellipse closest to xy. The point is mirrored into the first quadrant,
+        where the derivative of the squared distance has a single sign change,
+        and the root is found with Newton's method safeguarded by
+        bisection. """
+        a = self.xr
+        b = self.yr
+        px = abs(xy[0] - self.xc)
+        py = abs(xy[1] - self.yc)
+
+        # On the axes the derivative is zero at the end of the quadrant, so
+        # the bracket below does not hold.
+        if px == 0 or py == 0:
+            theta = self._axis_theta(px, py)
+            iterations = 0
+        else:
+            theta = math.atan2(a*py, b*px)
+            iterations = self.max_iterations
+
+        # Derivative of half the squared distance is <= 0 at lo and >= 0 at hi.
+        lo = 0
+        hi = math.pi/2
+
+        for i in range(iterations):
+            s = math.sin(theta)
+            c = math.cos(theta)
+            df = (b**2 - a**2)*s*c + a*px*s - b*py*c
+            ddf = (b**2 - a**2)*(c**2 - s**2) + a*px*c + b*py*s
+
+            if df < 0:
+                lo = theta
+            else:
+                hi = theta
+
+            # The Newton step may end on the bound that was just moved to
+            # theta when it is below the precision of theta.
+            if ddf > 0 and lo <= theta - df/ddf <= hi:
+                step = df/ddf
+            else:
+                step = theta - (lo + hi)/2
+
+            theta = theta - step
+
+            if abs(step) < 1e-12:
+                break
+
+        # Mirror back to the quadrant of xy.
+        if xy[0] - self.xc < 0:
+            theta = math.pi - theta
+        if xy[1] - self.yc < 0:
+            theta = - theta
+
+        return theta
+
+
+    def _axis_theta(self, px, py):
+        """Used internally. Returns the angle parameter of the point on the
+        ellipse closest to the point px, py in the first quadrant when it is
+        on one of the axes. Inside the evolute of the ellipse, i.e. between
+        the centres of curvature of the two vertices on the major axis, the
+        closest point is not a vertex but has cos(theta) = a*px/(a^2 - b^2),
+        or sin(theta) = b*py/(b^2 - a^2) if the major axis is along y. """
+        a = self.xr
+        b = self.yr
+
+        if py == 0 and a*px < a**2 - b**2:
+            return math.acos(a*px/(a**2 - b**2))
+        if px == 0 and b*py < b**2 - a**2:
+            return math.asin(b*py/(b**2 - a**2))
+
+        if py == 0:
+            return 0
+        else:
+            return math.pi/2
+
+
+    def _theta_index(self, theta):
+        """Used internally. Returns the fractional path index of the angle
+        parameter theta. """
+        return ((theta - self._theta0)/self._dtheta) % len(self.path)
+
+
+    def _theta_point(self, theta):
+        """Used internally. Returns the point on the ellipse at angle parameter
+        theta. """
+        return [self.xc + self.xr*math.cos(theta),
+                self.yc + self.yr*math.sin(theta)]
+
+
+    def _frenet_values(self, xy, theta):
+        """Used internally. Returns the y error, if xy is to the left of the
+        path, and gamma, gamma prime and gamma prime prime at the point on the
+        ellipse at angle parameter theta. """
+        a = self.xr
+        b = self.yr
+        s = math.sin(theta)
+        c = math.cos(theta)
+        direction = 1 if self._dtheta > 0 else -1
+
+        # Tangent in the direction of the path.
+        tx = - direction*a*s
+        ty = direction*b*c
+
+        dx = xy[0] - (self.xc + a*c)
+        dy = xy[1] - (self.yc + b*s)
+        left = tx*dy - ty*dx > 0
+        ey = math.sqrt(dx**2 + dy**2)
+        if left:
+            ey = -ey
+
+        gamma = math.atan2(ty, tx) % (2*math.pi)
+
+        # Curvature and its derivative with respect to arc length. The
+        # derivative is the same in both directions of travel.
+        q = a**2*s**2 + b**2*c**2
+        gammap = direction*a*b/q**1.5
+        gammapp = -3*a*b*(a**2 - b**2)*s*c/q**3
+
+        return ey, left, gamma, gammap, gammapp
+
+
+    def _frenet_values_batch(self, xy, theta):
+        """Used internally. Vectorized version of _frenet_values() for an
+        (M, 2) array of coordinates. """
+        a = self.xr
+        b = self.yr
+        s = np.sin(theta)
+        c = np.cos(theta)
+        direction = 1 if self._dtheta > 0 else -1
+
+        tx = - direction*a*s
+        ty = direction*b*c
+
+        dx = xy[:, 0] - (self.xc + a*c)
+        dy = xy[:, 1] - (self.yc + b*s)
+        left = tx*dy - ty*dx > 0
+        ey = np.sqrt(dx**2 + dy**2)
+        ey[left] = - ey[left]
+
+        gamma = np.mod(np.arctan2(ty, tx), 2*math.pi)
+
+        q = a**2*s**2 + b**2*c**2
+        gammap = direction*a*b/q**1.5
+        gammapp = -3*a*b*(a**2 - b**2)*s*c/q**3
+
+        return ey, left, gamma, gammap, gammapp
+
+
+class PathTracker:
+    """Keeps track of the closest point on a path for one moving object. The
+    previous closest index is used as a starting point for the next search, so
+    that only a window around it needs to be searched. """
+    def __init__(self, path, window = 50):
+        self.path = path
+        self.window = window
+        self.index = None           # Latest closest index.
+        self._revision = None       # Path revision that index refers to.
+
+
+    def get_closest(self, xy):
+        """Returns the closest index and point of the path to xy. """
+        if self.index is None or self._revision != self.path.revision:
+            index, closest = self.path.get_closest(xy)
+        else:
+            index, closest = self.path.get_closest_window(
+                xy, self.index, self.window)
+
+        self.index = index
+        self._revision = self.path.revision
+
+        return index, closest
+
+
+    def project(self, xy):
+        """Projects xy on the path, see Path.project(). """
+        if self.index is None or self._revision != self.path.revision:
+            proj = self.path.project(xy)
+        else:
+            proj = self.path.project(xy, self.index, self.window)
+
+        self.index = proj.index
+        self._revision = self.path.revision
+
+        return proj
+
+
+    def project_segment(self, xy):
+        """Projects xy on the segments of the path, see
+        Path.project_segment(). """
+        if self.index is None or self._revision != self.path.revision:
+            proj = self.path.project_segment(xy)
+        else:
+            proj = self.path.project_segment(xy, self.index, self.window)
+
+        self.index = proj.index
+        self._revision = self.path.revision
+
+        return proj
+
+
+    def reset(self):
+        """Forgets the previous closest index. The next search will be done
+        over the whole path. """
+        self.index = None
+
+
+    def set_index(self, index):
+        """Sets the previous closest index, so that the next search is done
+        around it. Used when switching from another path. """
+        self.index = index % len(self.path.path)
+        self._revision = self.path.revision
+
+
+class GridIndex:
+    """Uniform bucket grid over the points of a path. Finds the closest point
+    by only looking at the grid cells around the given coordinates instead of
+    comparing against every point of the path. """
+    def __init__(self, points, cell_size = None, cells = None):
+        """cells can be given as the arrays returned by to_arrays() to restore
+        a saved grid with the given cell size. """
+        points = np.asarray(points, dtype = float).reshape(-1, 2)
+
+        # Coordinates are kept in lists since they are faster to index one
+        # at a time than numpy arrays.
+        self.xs = points[:, 0].tolist()
+        self.ys = points[:, 1].tolist()
+        self.cells = {}         # Maps cell (ix, iy) to a list of indices.
+
+        if cell_size is None:
+            cell_size = self._default_cell_size(points)
+        self.cell_size = float(cell_size)
+
+        # Bounds of the occupied cells.
+        self.ixmin = 0
+        self.ixmax = -1
+        self.iymin = 0
+        self.iymax = -1
+
+        if cells is None:
+            self._add_array(points)
+        else:
+            self._add_cells(*cells)
+
+
+    def _default_cell_size(self, points):
+        """Returns a cell size based on the bounding box of the points, or on
+        the mean distance between points if that is larger. """
+        n = len(points)
+        if n < 2:
+            return 1.0
+
+        area = np.prod(points.max(axis = 0) - points.min(axis = 0))
+        total = np.sum(np.sqrt(np.sum(np.diff(points, axis = 0)**2, axis = 1)))
+
+        size = max(math.sqrt(area/n), 2*total/(n - 1))
+        if size == 0:
+            return 1.0
+
+        return float(size)
+
+
+    def _add_array(self, points):
+        """Used internally to add all points of an (N, 2) array at once. """
+        if len(points) == 0:
+            return
+
+        ix = np.floor(points[:, 0]/self.cell_size).astype(int)
+        iy = np.floor(points[:, 1]/self.cell_size).astype(int)
+
+        self.ixmin = int(ix.min())
+        self.ixmax = int(ix.max())
+        self.iymin = int(iy.min())
+        self.iymax = int(iy.max())
+
+        # Sort the indices by cell. The sort is stable so that the indices are
+        # in increasing order within each cell.
+        keys = (ix - self.ixmin)*(self.iymax - self.iymin + 1) + (
+            iy - self.iymin)
+        order = np.argsort(keys, kind = 'mergesort')
+        keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        ends = np.append(starts[1:], len(order))
+
+        order = order.tolist()
+        for start, end, cx, cy in zip(starts.tolist(), ends.tolist(),
+                                      ix[order][starts].tolist(),
+                                      iy[order][starts].tolist()):
+            self.cells[(cx, cy)] = order[start:end]
+
+
+    def _add_cells(self, ix, iy, starts, order):
+        """Used internally to restore the cells from arrays returned by
+        to_arrays(). """
+        if len(ix) == 0:
+            return
+
+        self.ixmin = int(np.min(ix))
+        self.ixmax = int(np.max(ix))
+        self.iymin = int(np.min(iy))
+        self.iymax = int(np.max(iy))
+
+        order = np.asarray(order).tolist()
+        starts = np.asarray(starts).tolist()
+        for k, cell in enumerate(zip(np.asarray(ix).tolist(),
+                                     np.asarray(iy).tolist())):
+            self.cells[cell] = order[starts[k]:starts[k + 1]]
+
+
+    def to_arrays(self):
+        """Returns the cells as four int64 arrays: the x and y cell numbers
+        of each cell, the start of the indices of each cell in the last array
+        followed by the total number of indices, and the indices of all cells
+        after each other. """
+        cells = sorted(self.cells)
+        ix = np.array([c[0] for c in cells], dtype = np.int64)
+        iy = np.array([c[1] for c in cells], dtype = np.int64)
+        counts = [len(self.cells[c]) for c in cells]
+        starts = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        order = np.array([i for c in cells for i in self.cells[c]],
+                         dtype = np.int64)
+
+        return [ix, iy, starts, order]
+
+
+    def insert(self, index, xy):
+        """Inserts the point xy at index. The indices of the points after it
+        are increased by one. """
+        if index < len(self.xs):
+            self._shift(index, 1)
+
+        self.xs.insert(index, float(xy[0]))
+        self.ys.insert(index, float(xy[1]))
+        self._add(index)
+
+
+    def move(self, index, xy):
+        """Moves the point at index to xy. """
+        self._remove(index)
+        self.xs[index] = float(xy[0])
+        self.ys[index] = float(xy[1])
+        self._add(index)
+
+
+    def remove(self, index):
+        """Removes the point at index. The indices of the points after it are
+        decreased by one. """
+        self._remove(index)
+        del self.xs[index]
+        del self.ys[index]
+
+        if index < len(self.xs):
+            self._shift(index + 1, -1)
+
+
+    def _add(self, index):
+        """Used internally to add the point at index to its cell. """
+        ix, iy = self._cell([self.xs[index], self.ys[index]])
+        self.cells.setdefault((ix, iy), []).append(index)
+
+        if self.ixmax < self.ixmin:
+            self.ixmin = self.ixmax = ix
+            self.iymin = self.iymax = iy
+        else:
+            self.ixmin = min(self.ixmin, ix)
+            self.ixmax = max(self.ixmax, ix)
+            self.iymin = min(self.iymin, iy)
+            self.iymax = max(self.iymax, iy)
+
+
+    def _remove(self, index):
+        """Used internally to remove the point at index from its cell. The
+        bounds of the occupied cells are kept. """
+        cell = self._cell([self.xs[index], self.ys[index]])
+        self.cells[cell].remove(index)
+        if len(self.cells[cell]) == 0:
+            del self.cells[cell]
+
+
+    def _shift(self, start, delta):
+        """Used internally to add delta to all indices from start and up. """
+        for indices in self.cells.values():
+            indices[:] = [i + delta if i >= start else i for i in indices]
+
+
+    def _cell(self, xy):
+        """Returns the cell that the coordinates xy fall in. """
+        return (int(math.floor(xy[0]/self.cell_size)),
+                int(math.floor(xy[1]/self.cell_size)))
+
+
+    def nearest(self, xy):
+        """Returns the index of the point closest to xy. Ties are resolved in
+        favour of the lowest index, same as a linear search would. Returns
+        None if the grid is empty. """
+        if self.ixmax < self.ixmin:
+            return None
+
+        ix, iy = self._cell(xy)
+
+        # Rings closer than the occupied cells are empty, and rings further out
+        # than the occupied cells do not need to be searched.
+        r = max(0, self.ixmin - ix, ix - self.ixmax,
+                self.iymin - iy, iy - self.iymax)
+        r_max = max(ix - self.ixmin, self.ixmax - ix,
+                    iy - self.iymin, self.iymax - iy)
+
+        best_index = None
+        best_d = 0
+
+        while r <= r_max:
+            for cell in self._ring(ix, iy, r):
+                for i in self.cells.get(cell, ()):
+                    d = (self.xs[i] - xy[0])**2 + (self.ys[i] - xy[1])**2
+                    if best_index is None or d < best_d or (
+                        d == best_d and i < best_index):
+                        best_index = i
+                        best_d = d
+
+            # Points in ring r + 1 are at least r cell sizes away.
+            if best_index is not None and best_d < (r*self.cell_size)**2:
+                break
+
+            r += 1
+
+        return best_index
+
+
+    def _ring(self, ix, iy, r):
+        """Returns the occupied-area cells at Chebyshev distance r from cell
+        (ix, iy). """
+        if r == 0:
+            return [(ix, iy)]
+
+        cells = []
+        x_lo = max(ix - r, self.ixmin)
+        x_hi = min(ix + r, self.ixmax)
+        y_lo = max(iy - r + 1, self.iymin)
+        y_hi = min(iy + r - 1, self.iymax)
+
+        for y in (iy - r, iy + r):
+            if self.iymin <= y <= self.iymax:
+                for x in range(x_lo, x_hi + 1):
+                    cells.append((x, y))
+
+        for x in (ix - r, ix + r):
+            if self.ixmin <= x <= self.ixmax:
+                for y in range(y_lo, y_hi + 1):
+                    cells.append((x, y))
+
+        return cells
 
 
 class NewPath:
@@ -498,7 +2216,7 @@ class NewPath:
 
         self.root = tk.Tk()
 
-        self.newpath = []
+        self.newpath = Path()   # Gamma values are updated for each new point.
         self.graphicpath = []
         self.height = float(height)      # Height of area in meters.
         self.width = float(width)
@@ -582,7 +2300,7 @@ class NewPath:
                                             os.path.dirname(__file__)))
             fl = open(os.path.join(__location__, self.filename), 'w');
 
-            for xy in self.newpath:
+            for xy in self.newpath.path:
                 fl.write('{},{}\n'.format(xy[0], xy[1]))
 
             fl.close()
@@ -600,10 +2318,11 @@ class NewPath:
 
             xy = self.transform([event.x, event.y])
 
-            print('{:07.4f}, {:07.4f}'.format(xy[0], xy[1]))
-
             self.draw(event.x, event.y)
-            self.newpath.append(xy)
+            self.newpath.append_point(xy)
+
+            print('{:07.4f}, {:07.4f}, length: {:.2f}'.format(
+                xy[0], xy[1], self.newpath.length))
             self.graphicpath.append([event.x, event.y])
 
 
@@ -628,5 +2347,74 @@ class NewPath:
 
     def printp(self):
         """Prints the path in the terminal."""
-        for xy in self.newpath:
+        for xy in self.newpath.path:
             print('{:07.4f}, {:07.4f}'.format(xy[0], xy[1]))
+
+
+def _adaptive_spacing(points, gamma, tolerance, max_spacing):
+    """Used internally. Returns the arc length at each point of the closed path
+    with the length of the path appended, and the allowed distance between
+    points at each of them. A chord of length c on a curve with curvature k is
+    at most c^2*k/8 from the curve. """
+    seg = np.sqrt(np.sum((points - np.roll(points, 1, axis = 0))**2, axis = 1))
+    s = np.concatenate(([0], np.cumsum(np.roll(seg, -1))))
+
+    # Curvature from the change of gamma over the neighbouring segments.
+    gamma = np.asarray(gamma, dtype = float)
+    gamma_diff = np.mod(np.roll(gamma, -1) - np.roll(gamma, 1) + math.pi,
+                        2*math.pi) - math.pi
+    curvature = np.abs(gamma_diff)/np.maximum(seg + np.roll(seg, -1), 1e-12)
+
+    spacing = np.full(len(points), float(max_spacing))
+    curved = curvature > 0
+    spacing[curved] = np.minimum(spacing[curved],
+                                 np.sqrt(8*tolerance/curvature[curved]))
+
+    return s, np.append(spacing, spacing[0])
+
+
+def _adaptive_arclengths(s, spacing):
+    """Used internally. Returns the arc lengths of new points placed with
+    at most the allowed spacing between them. s and spacing are given at the
+    points of the closed path, with the first point repeated at the end. """
+    # Number of new points needed along each segment, using the smallest
+    # allowed spacing at its ends.
+    density = 1/np.minimum(spacing[:-1], spacing[1:])
+    count = np.concatenate(([0], np.cumsum(np.diff(s)*density)))
+
+    N = max(3, int(math.ceil(count[-1])))
+    return np.interp(count[-1]*np.arange(N)/N, count, s)
+
+
+def convert_path_file(textfile, binaryfile):
+    """Converts a path file on the format x,y to the binary path format. """
+    pt = ArrayPath()
+    pt.load(textfile)
+    pt.save_binary(binaryfile)
+
+
+def is_binary_path_file(filename):
+    """Returns True if the file is in the binary path format. """
+    try:
+        __location__ = os.path.realpath(os.path.join(os.getcwd(),
+                                        os.path.dirname(__file__)))
+        fl = open(os.path.join(__location__, filename), 'rb')
+        magic = fl.read(len(BINARY_MAGIC))
+        fl.close()
+        return magic == BINARY_MAGIC
+
+    except Exception:
+        return False
+
+
+def main(args):
+    """Converts a text path file to a binary path file. """
+    if len(args) < 3:
+        print('Usage: path.py textfile binaryfile')
+        return
+
+    convert_path_file(args[1], args[2])
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+# Class for caching generated paths so that they are only calculated once.
+
+import os
+import zlib
+import collections
+import threading
+
+import path
+
+
+class PathCache:
+    """Least recently used cache of generated ellipse paths, keyed by the class
+    of the path and the radii, number of points and center it was generated
+    with. Holds at most size paths in memory. If directory is given the paths
+    are also saved there in the binary path format and loaded from there when
+    they are not in memory, so that they survive restarts.
+
+    The cached paths are frozen, see Path.freeze(), since they are shared
+    between everyone asking for the same parameters. The cache can be used
+    from several threads. """
+    def __init__(self, size = 8, directory = None):
+        self.size = size            # Maximum number of paths in memory.
+        self.directory = None       # Directory for the saved paths.
+
+        if directory is not None:
+            __location__ = os.path.realpath(os.path.join(os.getcwd(),
+                                            os.path.dirname(__file__)))
+            self.directory = os.path.join(__location__, directory)
+
+        self.hits = 0               # Number of paths found in memory.
+        self.misses = 0
+
+        self._paths = collections.OrderedDict()   # Oldest use first.
+        self._lock = threading.Lock()
+
+
+    def get_ellipse(self, radius, points = 300, center = [0, 0],
+        path_class = path.EllipsePath):
+        """Returns an ellipse path with the given radius, number of points and
+        center, see Path.gen_circle_path(). The path is only generated if it
+        is not in the cache. """
+        if isinstance(radius, list):
+            if len(radius) > 1:
+                x_mag = radius[0]
+                y_mag = radius[1]
+            else:
+                x_mag = radius[0]
+                y_mag = radius[0]
+        else:
+            x_mag = radius
+            y_mag = radius
+
+        key = (path_class.__name__, float(x_mag), float(y_mag), int(points),
+               float(center[0]), float(center[1]))
+
+        with self._lock:
+            if key in self._paths:
+                self.hits += 1
+                pt = self._paths.pop(key)   # Reinserted last as the newest.
+            else:
+                self.misses += 1
+                pt = self._load(key, path_class)
+
+                if pt is None:
+                    pt = path_class()
+                    pt.gen_circle_path([x_mag, y_mag], points, center)
+                    self._save(key, pt)
+
+                pt.freeze()
+
+            self._paths[key] = pt
+
+            while len(self._paths) > self.size:
+                self._paths.popitem(last = False)
+
+        return pt
+
+
+    def clear(self):
+        """Removes all paths from memory. Saved paths are kept. """
+        with self._lock:
+            self._paths.clear()
+
+
+    def _filename(self, key):
+        """Used internally. Returns the file a path is saved in. """
+        return os.path.join(self.directory, 'path_{}_{:08x}.bin'.format(
+            key[0], zlib.crc32(repr(key)) & 0xffffffff))
+
+
+    def _load(self, key, path_class):
+        """Used internally. Returns the saved path for key, or None. """
+        if self.directory is None or not hasattr(path_class, 'load_binary'):
+            return None
+
+        filename = self._filename(key)
+        if not os.path.exists(filename):
+            return None
+
+        pt = path_class()
+        pt.load_binary(filename)
+        if len(pt.path) != key[3]:
+            return None
+
+        return pt
+
+
+    def _save(self, key, pt):
+        """Used internally to save a path if there is a directory. """
+        if self.directory is None:
+            return
+
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+        except Exception as e:
+            print('\nError when creating path cache directory: {}'.format(e))
+            return
+
+        pt.save_binary(self._filename(key))
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+
+# Class for a precomputed raster of the closest path index and y error over the
+# area that the trucks drive in.
+
+import os
+import math
+import zlib
+import numpy as np
+
+import path
+
+
+class PathField:
+    """Raster over a rectangular area that stores the closest path index and
+    the signed y error at each grid node. Projecting a point on the path is
+    then a constant time lookup with no search. The y error is bilinearly
+    interpolated between the four surrounding grid nodes and the index is
+    taken from the nearest grid node. Points outside of the area are projected
+    on the path directly. """
+    def __init__(self, pt, width = 6, height = 6, resolution = 0.02,
+        center = [0, 0], build = True):
+        self.pt = pt                        # The path.
+        self.width = float(width)           # Width of the area in meters.
+        self.height = float(height)
+        self.resolution = float(resolution) # Distance between grid nodes.
+        self.xmin = center[0] - self.width/2
+        self.ymin = center[1] - self.height/2
+
+        self.nx = int(math.ceil(self.width/self.resolution)) + 1
+        self.ny = int(math.ceil(self.height/self.resolution)) + 1
+
+        self.indices = np.zeros((self.ny, self.nx), dtype = int)
+        self.ey = np.zeros((self.ny, self.nx))
+
+        if build:
+            self.build()
+
+
+    def build(self):
+        """Calculates the closest index and y error at all grid nodes. """
+        x = self.xmin + self.resolution*np.arange(self.nx)
+        y = self.ymin + self.resolution*np.arange(self.ny)
+        xx, yy = np.meshgrid(x, y)
+
+        proj = self.pt.project_batch(np.column_stack((xx.ravel(), yy.ravel())))
+
+        self.indices = proj.index.reshape(self.ny, self.nx)
+        self.ey = proj.ey.reshape(self.ny, self.nx)
+
+
+    def with_path(self, pt):
+        """Returns a raster over the same area and with the same resolution
+        for the path pt, or this raster if pt is its path. """
+        if pt is self.pt:
+            return self
+
+        return PathField(pt, self.width, self.height, self.resolution,
+                         [self.xmin + self.width/2, self.ymin + self.height/2])
+
+
+    def project(self, xy):
+        """Projects the point (x, y) on the path using the raster. Returns a
+        path.Projection. """
+        u = (xy[0] - self.xmin)/self.resolution
+        v = (xy[1] - self.ymin)/self.resolution
+
+        if not (0 <= u < self.nx - 1 and 0 <= v < self.ny - 1):
+            return self.pt.project(xy)
+
+        i = int(u)
+        j = int(v)
+        fu = u - i
+        fv = v - j
+
+        ey = (self.ey[j, i]*(1 - fu)*(1 - fv) +
+              self.ey[j, i + 1]*fu*(1 - fv) +
+              self.ey[j + 1, i]*(1 - fu)*fv +
+              self.ey[j + 1, i + 1]*fu*fv)
+
+        index = int(self.indices[j + int(round(fv)), i + int(round(fu))])
+        gamma = self.pt.get_gamma(index)
+
+        # The closest point is ey along the normal pointing to the left.
+        closest = [xy[0] - ey*math.sin(gamma), xy[1] + ey*math.cos(gamma)]
+
+        return path.Projection(index, closest, ey, ey < 0, gamma,
+                               self.pt.get_gammap(index),
+                               self.pt.get_gammapp(index))
+
+
+    def save(self, filename):
+        """Saves the raster to a .npz file together with a checksum of the
+        path it was calculated for. """
+        np.savez(filename, indices = self.indices, ey = self.ey,
+                 params = np.array([self.width, self.height, self.resolution,
+                                    self.xmin, self.ymin]),
+                 checksum = np.array([path_checksum(self.pt)]))
+
+
+    def load(self, filename):
+        """Loads a raster saved with save(). Returns False if the file does
+        not exist or does not match the path and the area of this raster. """
+        try:
+            data = np.load(filename)
+            params = [self.width, self.height, self.resolution,
+                      self.xmin, self.ymin]
+
+            if int(data['checksum'][0]) != path_checksum(self.pt) or (
+                not np.allclose(data['params'], params)):
+                return False
+
+            self.indices = data['indices']
+            self.ey = data['ey']
+            return True
+
+        except Exception:
+            return False
+
+
+def path_checksum(pt):
+    """Returns a checksum of the points of a path. """
+    points = np.ascontiguousarray(pt.path, dtype = float)
+    return zlib.crc32(points.tostring()) & 0xffffffff
+
+
+def cached_field(pt, filename, width = 6, height = 6, resolution = 0.02,
+    center = [0, 0]):
+    """Returns a PathField for the path pt that was loaded from filename. The
+    raster is cached in a file next to the path file and is only calculated if
+    there is no cached raster for the same path and area. """
+    __location__ = os.path.realpath(os.path.join(os.getcwd(),
+                                    os.path.dirname(__file__)))
+    cachefile = os.path.join(__location__, filename + '.field.npz')
+
+    field = PathField(pt, width, height, resolution, center, build = False)
+
+    if not field.load(cachefile):
+        field.build()
+        try:
+            field.save(cachefile)
+        except Exception as e:
+            print('\nError when saving path field to file: {}'.format(e))
+
+    return field
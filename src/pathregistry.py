@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+
+# Class for keeping several named reference paths and switching trucks between
+# them.
+
+import path
+
+
+class PathRegistry:
+    """Keeps several named paths, such as lanes and alternative loops, in
+    memory together with their spatial indexes. For paths that are connected
+    as neighbours the closest index on the other path is precomputed for every
+    point, so that a truck can switch path and continue the closest point
+    search from where it is without searching the whole new path.
+
+    The paths are frozen when they are added, see Path.freeze(), since they
+    are shared between everyone switching to them. """
+    def __init__(self):
+        self.paths = {}         # Maps names to paths.
+        self._names = {}        # Maps id of paths to names.
+        self._maps = {}         # Maps (from, to) names to arrays of indices.
+
+
+    def add(self, name, pt, neighbours = []):
+        """Adds the path pt with the given name and connects it to the already
+        added paths with the names in neighbours. A path with the same name is
+        replaced. """
+        if name in self.paths:
+            self.remove(name)
+
+        pt.freeze()
+        self.paths[name] = pt
+        self._names[id(pt)] = name
+
+        for other in neighbours:
+            self.connect(name, other)
+
+
+    def add_ellipse(self, name, radius, points = 400, center = [0, 0],
+        neighbours = []):
+        """Adds an ellipse path, see Path.gen_circle_path(). Returns the
+        path. """
+        pt = path.EllipsePath()
+        pt.gen_circle_path(radius, points, center)
+        self.add(name, pt, neighbours)
+
+        return pt
+
+
+    def remove(self, name):
+        """Removes the path with the given name and its connections. """
+        pt = self.paths.pop(name)
+        del self._names[id(pt)]
+
+        for key in list(self._maps):
+            if name in key:
+                del self._maps[key]
+
+
+    def connect(self, name1, name2):
+        """Precomputes the closest index on each of the two paths for every
+        point of the other path. """
+        pt1 = self.paths[name1]
+        pt2 = self.paths[name2]
+
+        self._maps[(name1, name2)] = pt2.get_closest_batch(pt1._arrays()[0])[0]
+        self._maps[(name2, name1)] = pt1.get_closest_batch(pt2._arrays()[0])[0]
+
+
+    def get(self, name):
+        """Returns the path with the given name. """
+        return self.paths[name]
+
+
+    def get_name(self, pt):
+        """Returns the name of the path pt, or None if it is not in the
+        registry. """
+        return self._names.get(id(pt))
+
+
+    def map_index(self, name1, name2, index):
+        """Returns the index on path name2 closest to the point at index on
+        path name1, or None if the paths are not connected. """
+        try:
+            return int(self._maps[(name1, name2)][index])
+        except KeyError:
+            return None
+
+
+    def switch_tracker(self, tracker, name):
+        """Returns a new tracker on the path with the given name that starts
+        its search at the index corresponding to the latest closest index of
+        tracker. """
+        new_tracker = self.paths[name].tracker(tracker.window)
+
+        index = self._carry_index(tracker.path, tracker.index, name)
+        if index is not None:
+            new_tracker.set_index(index)
+
+        return new_tracker
+
+
+    def switch_controller(self, frenet, name):
+        """Switches the FrenetPID controller frenet to the path with the given
+        name, keeping its position along the path. """
+        index = self._carry_index(frenet.get_path(), frenet.get_index(), name)
+        frenet.update_path(self.paths[name], index)
+
+
+    def _carry_index(self, pt, index, name):
+        """Used internally. Returns the index on the path name that corresponds
+        to index on the path pt, or None if there is none. """
+        if index is None:
+            return None
+
+        return self.map_index(self.get_name(pt), name, index)
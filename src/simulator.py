@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+
+# Headless closed-loop simulation of trucks driven by the controllers. Needs no
+# ROS master and runs in simulated time, much faster than real time.
+
+import math
+import sys
+import time
+import numpy as np
+
+import path
+import translator
+import frenetpid
+import velocitypid
+
+
+class SimulatedTruck:
+    """Truck moving as a kinematic bicycle model with the position in the
+    middle between the wheel pairs, which is the point whose turning radius
+    the Translator tables are measured for. The speed v and the wheel angle
+    alpha are the inputs. """
+    def __init__(self, x = 0, y = 0, yaw = 0, v = 0, l = 0.27):
+        self.x = x                  # Position.
+        self.y = y
+        self.yaw = yaw              # Angle of truck.
+        self.v = v                  # Speed.
+        self.alpha = 0              # Wheel angle.
+        self.l = l                  # Length between wheel pairs.
+
+
+    def update(self, dt):
+        """Moves the truck forward the time dt with the current inputs. """
+        # Slip angle between the truck and the velocity of the middle point.
+        beta = math.atan(math.tan(self.alpha)/2)
+
+        self.x = self.x + self.v*math.cos(self.yaw + beta)*dt
+        self.y = self.y + self.v*math.sin(self.yaw + beta)*dt
+        self.yaw = (self.yaw +
+            self.v*math.cos(beta)*math.tan(self.alpha)/self.l*dt) % (2*math.pi)
+
+
+    def get_values(self):
+        """Returns the position, orientation and speed of the truck. """
+        return self.x, self.y, self.yaw, self.v
+
+
+class Simulator:
+    """Closed-loop simulation of a list of SimulatedTrucks. The simulator
+    works as the publisher of the controllers: the speed and angle pwms sent
+    with publish() are translated back to a speed and a wheel angle with the
+    inverse of the Translator tables and used by the truck from the next
+    step. Each step moves the trucks forward the time dt, so the controllers
+    see the same sampling as on the real trucks while the simulation runs as
+    fast as the controllers can be called. The simulated time is given to the
+    controllers as the timestamp of the data, so dt can be changed between
+    steps to simulate jitter. """
+    def __init__(self, trucks, dt = 0.05):
+        self.trucks = trucks        # Simulated trucks, truck id 1 is first.
+        self.dt = dt                # Time step.
+        self.time = 0               # Simulated time.
+
+        self.translator = translator.Translator()
+
+        # Rows of the time followed by x, y, yaw and v of each truck.
+        self.history = []
+
+
+    def publish(self, truck_id, speed_pwm, angle_pwm):
+        """Sets the inputs of the truck with id truck_id from the pwms. Takes
+        the same arguments as the truck control publisher. """
+        truck = self.trucks[truck_id - 1]
+        truck.v = self.translator.get_speed_from_pwm(speed_pwm)
+        truck.alpha = self.translator.get_alpha_from_pwm(angle_pwm)
+
+
+    def step(self):
+        """Moves all trucks forward one time step and records their
+        states. """
+        row = [self.time + self.dt]
+        for truck in self.trucks:
+            truck.update(self.dt)
+            row.extend(truck.get_values())
+
+        self.time = row[0]
+        self.history.append(row)
+
+
+    def get_values(self):
+        """Returns a list with the position, orientation and speed of each
+        truck. """
+        return [truck.get_values() for truck in self.trucks]
+
+
+    def get_history(self):
+        """Returns the recorded states as an array with one row per step and
+        the columns time, x1, y1, yaw1, v1, x2, ... """
+        return np.array(self.history).reshape(len(self.history),
+                                              1 + 4*len(self.trucks))
+
+
+    def run_frenet(self, frenets, speeds, duration):
+        """Runs the simulation for the time duration with each truck driven by
+        its own FrenetPID controller in frenets at the speed in speeds. The
+        inputs go through the Translator as on the real trucks. """
+        for i in range(int(round(duration/self.dt))):
+            for j, truck in enumerate(self.trucks):
+                x, y, yaw, vel = truck.get_values()
+                omega = frenets[j].get_omega(x, y, yaw, vel, self.time)
+
+                self.publish(j + 1,
+                    self.translator.get_speed(speeds[j]),
+                    self.translator.get_angle(omega, vel))
+
+            self.step()
+
+
+    def run_platoon(self, controller, duration):
+        """Runs the simulation for the time duration with the first two trucks
+        driven by a platooning controller_platooning.Controller. The
+        controller should be created with this simulator as publisher and
+        have a reference path. """
+        if not controller.running:
+            controller.start()
+
+        for i in range(int(round(duration/self.dt))):
+            x1, y1, yaw1, vel1 = self.trucks[0].get_values()
+            x2, y2, yaw2, vel2 = self.trucks[1].get_values()
+
+            controller._control(x1, y1, yaw1, vel1, x2, y2, yaw2, vel2,
+                                self.time)
+
+            self.step()
+
+
+    def run_platoon_pid(self, frenets, velocity, v_lead, duration,
+        vlim = 0.5, pwm_min = 1400, pwm_max = 1460):
+        """Runs the simulation for the time duration with the first two trucks
+        driven as by a controller_platooning.Controller with truck 2 as
+        follower, but without the controller and ROS. frenets are the
+        FrenetPID controllers of the trucks, which follow the same path, and
+        velocity the velocitypid.VelocityPID of the follower. The leader
+        drives at the speed v_lead and the follower stands still while the
+        leader is slower than vlim. The speed pwms are kept within pwm_min and
+        pwm_max. """
+        pt = frenets[0].get_path()
+        tracker1 = pt.tracker()
+        tracker2 = pt.tracker()
+
+        v1_pwm = min(max(int(self.translator.get_speed(v_lead)), pwm_min),
+                     pwm_max)
+
+        for i in range(int(round(duration/self.dt))):
+            x1, y1, yaw1, vel1 = self.trucks[0].get_values()
+            x2, y2, yaw2, vel2 = self.trucks[1].get_values()
+
+            omega1 = frenets[0].get_omega(x1, y1, yaw1, vel1, self.time)
+            angle1 = int(self.translator.get_angle(omega1, vel1))
+
+            omega2 = frenets[1].get_omega(x2, y2, yaw2, vel2, self.time)
+            angle2 = int(self.translator.get_angle(omega2, vel2))
+
+            if vel1 < vlim:
+                v2_pwm = 1500
+            else:
+                index1, _ = tracker1.get_closest([x1, y1])
+                index2, _ = tracker2.get_closest([x2, y2])
+                e_dist = float(pt.get_distance_from_indices(index1, index2))
+
+                v2_pwm = min(max(v1_pwm - velocity.get_velocity(
+                    e_dist, vel2, self.time), pwm_min), pwm_max)
+
+            self.publish(1, v1_pwm, angle1)
+            self.publish(2, v2_pwm, angle2)
+
+            self.step()
+
+
+def main(args):
+    # Simulate the platooning controller if 'platoon' is entered as arg,
+    # otherwise one truck with a FrenetPID controller.
+    platoon = len(args) > 1 and args[1] == 'platoon'
+
+    # Data for reference path.
+    x_radius = 1.7
+    y_radius = 1.2
+    center = [0.3, -1.3]
+
+    duration = 60               # Simulated time.
+    dt = 0.05
+
+    # Trucks starting on the path, the second one a bit behind.
+    trucks = [SimulatedTruck(center[0] + x_radius, center[1], math.pi/2),
+              SimulatedTruck(center[0] + x_radius - 0.1, center[1] - 0.8,
+                             math.pi/2)]
+    sim = Simulator(trucks, dt)
+
+    start = time.time()
+
+    pt = path.EllipsePath()
+    pt.gen_circle_path([x_radius, y_radius], 400, center)
+
+    frenets = [frenetpid.FrenetPID(pt, 0.5, -0.02, 3) for truck in trucks]
+
+    if platoon:
+        # The gains of controller_platooning.main().
+        velocity = velocitypid.VelocityPID(10, 1, 5, e_ref = 0.5)
+        sim.run_platoon_pid(frenets, velocity, 0.89, duration)
+
+    else:
+        sim.run_frenet(frenets, [0.89, 0.89], duration)
+
+    elapsed = time.time() - start
+    steps = len(sim.history)
+
+    print('Simulated {:.0f} s in {:.2f} s, {:.0f} steps/s, {:.0f} times '\
+        'real time.'.format(sim.time, elapsed, steps/elapsed,
+                            sim.time/elapsed))
+
+    history = sim.get_history()
+    for i in range(len(trucks)):
+        ey = pt.frenet_transform(history[:, 1 + 4*i:3 + 4*i]).ey
+        print('Truck {}: lateral error RMS {:.3f} m, max {:.3f} m.'.format(
+            i + 1, math.sqrt(np.mean(ey**2)), np.max(np.abs(ey))))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
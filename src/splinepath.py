@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+
+# Class for a smooth closed path given by a periodic cubic spline through a
+# series of recorded points.
+
+import math
+import numpy as np
+
+import path
+
+# Number of Gauss-Legendre nodes used for the arc length of a spline segment.
+QUADRATURE_NODES = 5
+
+# Number of Newton iterations used when finding the spline parameter of an arc
+# length.
+NEWTON_ITERATIONS = 6
+
+
+class SplinePath(path.ArrayPath):
+    """Closed path given by a periodic cubic spline through a series of points,
+    parametrized by the chord lengths between the points. Gamma, gamma prime
+    and gamma prime prime are calculated in closed form from the spline
+    instead of with differences between neighbouring points, so that noisy
+    hand drawn paths give smooth values and fewer points can be used. The
+    path points are the spline sampled at equal arc length, so that the path
+    can be used like any other path. """
+    def __init__(self, use_index = True, samples = None):
+        path.ArrayPath.__init__(self, use_index)
+        self.samples = samples      # Number of path points, None for as many
+                                    # as the points fitted through.
+        self.knots = np.zeros((0, 2))   # Points the spline passes through.
+        self.spline_length = 0          # Arc length of the spline.
+
+        self._h = np.zeros(0)           # Chord lengths between the knots.
+        self._coeffs = None             # Coefficients of the segments.
+        self._s = np.zeros(0)           # Arc length at each knot.
+
+
+    def fit(self, points, samples = None):
+        """Fits a periodic cubic spline through the points and samples the path
+        from it. samples is the number of path points, the same number as the
+        points if None. Repeated points are skipped. """
+        self._check_frozen()
+        try:
+            knots = np.asarray(points, dtype = float).reshape(-1, 2)
+
+            # Remove points equal to the point before them.
+            diff = knots - np.roll(knots, 1, axis = 0)
+            knots = knots[np.any(diff != 0, axis = 1)]
+            if len(knots) < 3:
+                raise ValueError('at least 3 distinct points are needed')
+
+            self._fit_knots(knots)
+
+        except Exception as e:
+            print('\nError when fitting spline path: {}'.format(e))
+            return
+
+        if samples is None:
+            samples = self.samples
+        if samples is None:
+            samples = len(points)
+
+        self._tabulate(samples)
+
+
+    def _fit_knots(self, knots):
+        """Used internally to calculate the spline coefficients. For segment k
+        the spline is P_k + b_k*t + c_k*t^2 + d_k*t^3 for t from 0 to h_k. """
+        h = np.sqrt(np.sum((np.roll(knots, -1, axis = 0) - knots)**2, axis = 1))
+        slopes = (np.roll(knots, -1, axis = 0) - knots)/h[:, None]
+
+        # Second derivatives at the knots from the periodic spline conditions.
+        h_prev = np.roll(h, 1)
+        m = _solve_cyclic(h_prev, 2*(h_prev + h), h,
+                          6*(slopes - np.roll(slopes, 1, axis = 0)))
+        m_next = np.roll(m, -1, axis = 0)
+
+        b = slopes - h[:, None]*(2*m + m_next)/6
+        c = m/2
+        d = (m_next - m)/(6*h[:, None])
+
+        self.knots = knots
+        self._h = h
+        self._coeffs = (b, c, d)
+
+        seg = self._segment_length(np.arange(len(knots)), h)
+        self._s = np.concatenate(([0], np.cumsum(seg)[:-1]))
+        self.spline_length = float(np.sum(seg))
+
+
+    def _tabulate(self, samples):
+        """Used internally to sample the path points and gammas from the
+        spline. samples is either the number of points at equal arc length or
+        an array of the arc lengths of the points. """
+        if np.isscalar(samples):
+            s = self.spline_length*np.arange(samples)/samples
+        else:
+            s = samples
+        x, y, gamma, gammap, gammapp = self.evaluate(s)
+
+        self.path = np.column_stack((x, y))
+        self.gamma = gamma
+        self.gammap = gammap
+        self.gammapp = gammapp
+        self._calc_arclength()
+        self._build_index()
+        self.revision += 1
+
+
+    def evaluate(self, s):
+        """Returns x, y, gamma, gamma prime and gamma prime prime of the spline
+        at the arc lengths s as arrays. s wraps around the closed path. Gamma
+        prime is the signed curvature, positive when turning left, and gamma
+        prime prime its derivative with respect to arc length. """
+        k, t = self._parameter(np.asarray(s, dtype = float))
+        b, c, d = [coeff[k] for coeff in self._coeffs]
+        t = t[:, None]
+
+        r = self.knots[k] + b*t + c*t**2 + d*t**3
+        r1 = b + 2*c*t + 3*d*t**2       # Derivatives with respect to t.
+        r2 = 2*c + 6*d*t
+        r3 = 6*d
+
+        speed = np.sqrt(np.sum(r1**2, axis = 1))
+        cross12 = r1[:, 0]*r2[:, 1] - r1[:, 1]*r2[:, 0]
+        cross13 = r1[:, 0]*r3[:, 1] - r1[:, 1]*r3[:, 0]
+        dot12 = np.sum(r1*r2, axis = 1)
+
+        gamma = np.mod(np.arctan2(r1[:, 1], r1[:, 0]), 2*math.pi)
+        gammap = cross12/speed**3
+        gammapp = (cross13/speed**3 - 3*cross12*dot12/speed**5)/speed
+
+        return r[:, 0], r[:, 1], gamma, gammap, gammapp
+
+
+    def _parameter(self, s):
+        """Used internally. Returns the segments and the spline parameters t
+        within the segments of the arc lengths s. """
+        s = np.mod(s.ravel(), self.spline_length)
+        k = np.searchsorted(self._s, s, side = 'right') - 1
+        ds = s - self._s[k]
+
+        seg = np.append(self._s[1:], self.spline_length) - self._s
+        h = self._h[k]
+        t = h*ds/seg[k]     # Initial guess from the chord length.
+
+        # Newton iterations on length(t) - ds, with the speed as derivative.
+        b, c, d = [coeff[k] for coeff in self._coeffs]
+        for i in range(NEWTON_ITERATIONS):
+            r1 = b + 2*c*t[:, None] + 3*d*t[:, None]**2
+            speed = np.sqrt(np.sum(r1**2, axis = 1))
+            t = np.clip(t - (self._segment_length(k, t) - ds)/speed, 0, h)
+
+        return k, t
+
+
+    def _segment_length(self, k, t):
+        """Used internally. Returns the arc lengths of the segments k from the
+        start of the segments to the spline parameters t. """
+        nodes, weights = np.polynomial.legendre.leggauss(QUADRATURE_NODES)
+        b, c, d = [coeff[k][:, None, :] for coeff in self._coeffs]
+        u = (t[:, None]*(nodes + 1)/2)[:, :, None]
+
+        r1 = b + 2*c*u + 3*d*u**2
+        speed = np.sqrt(np.sum(r1**2, axis = 2))
+
+        return t/2*np.dot(speed, weights)
+
+
+    def _calc_gammas(self):
+        """Used internally. Fits the spline through the path points and samples
+        the path from it. """
+        self.fit(self.path, self.samples)
+
+
+    def reverse(self):
+        """Reverses the path. """
+        if self._coeffs is None:
+            path.ArrayPath.reverse(self)
+        else:
+            self.fit(self.knots[::-1], len(self.path))
+
+
+    def interpolate(self):
+        """Doubles the number of path points sampled from the spline. """
+        self._check_frozen()
+        if self._coeffs is None:
+            path.ArrayPath.interpolate(self)
+        else:
+            self._tabulate(2*len(self.path))
+
+
+    def resample(self, tolerance = 0.001, max_spacing = 0.1):
+        """Samples the path points from the spline with a spacing that depends
+        on the curvature, see path.Path.resample(). Returns the number of
+        points before and after. """
+        self._check_frozen()
+        if self._coeffs is None:
+            return path.ArrayPath.resample(self, tolerance, max_spacing)
+
+        N = len(self.path)
+
+        # Curvature of the spline at a spacing finer than any allowed one.
+        fine = max(N, int(math.ceil(self.spline_length/max_spacing))*4)
+        s = self.spline_length*np.arange(fine + 1)/fine
+        curvature = np.abs(self.evaluate(s)[3])
+
+        spacing = np.full(fine + 1, float(max_spacing))
+        curved = curvature > 0
+        spacing[curved] = np.minimum(spacing[curved],
+                                     np.sqrt(8*tolerance/curvature[curved]))
+
+        s_new = path._adaptive_arclengths(s, spacing)
+        self._tabulate(s_new)
+
+        print('Resampled path from {} to {} points.'.format(N, len(s_new)))
+        return N, len(s_new)
+
+
+    def _points_edited(self, first, last, end):
+        """Used internally after editing points. The edited points are no
+        longer on the spline, so it is dropped until the path is fitted
+        again, which happens directly for paths with few points since all
+        gammas are then recalculated, see _calc_gammas(). """
+        self.knots = np.zeros((0, 2))
+        self._coeffs = None
+        path.ArrayPath._points_edited(self, first, last, end)
+
+
+    def _load_binary_params(self, theta0, dtheta, knots):
+        """Used internally to restore the spline from the knots stored in a
+        binary path file, see load_binary(). The saved points and gammas are
+        used as they are, and calls that recalculate them, such as reverse(),
+        interpolate() and resample(), use the spline like for a fitted path.
+        Files without knots, such as those saved from other paths, are used
+        like in an ArrayPath. """
+        if len(knots) < 3:
+            self.knots = np.zeros((0, 2))
+            self._coeffs = None
+        else:
+            self._fit_knots(np.array(knots))
+
+
+def _solve_cyclic(a, b, c, d):
+    """Solves the cyclic tridiagonal system
+    a[i]*x[i - 1] + b[i]*x[i] + c[i]*x[i + 1] = d[i], where the indices wrap
+    around. d can have several columns. """
+    n = len(b)
+    corner = -b[0]
+
+    # Sherman-Morrison: solve with a tridiagonal matrix and correct for the
+    # two corner elements.
+    bb = np.array(b, dtype = float)
+    bb[0] = b[0] - corner
+    bb[-1] = b[-1] - a[0]*c[-1]/corner
+
+    u = np.zeros(n)
+    u[0] = corner
+    u[-1] = c[-1]
+
+    x = _solve_tridiagonal(a, bb, c, d)
+    z = _solve_tridiagonal(a, bb, c, u)
+
+    factor = (x[0] + a[0]*x[-1]/corner)/(1 + z[0] + a[0]*z[-1]/corner)
+    if x.ndim > 1:
+        return x - np.outer(z, factor)
+    else:
+        return x - z*factor
+
+
+def _solve_tridiagonal(a, b, c, d):
+    """Solves the tridiagonal system a[i]*x[i - 1] + b[i]*x[i] + c[i]*x[i + 1]
+    = d[i] with the Thomas algorithm. a[0] and c[-1] are not used. """
+    n = len(b)
+    cp = np.zeros(n)
+    dp = np.array(d, dtype = float)
+
+    cp[0] = c[0]/b[0]
+    dp[0] = dp[0]/b[0]
+    for i in range(1, n):
+        denom = b[i] - a[i]*cp[i - 1]
+        cp[i] = c[i]/denom
+        dp[i] = (dp[i] - a[i]*dp[i - 1])/denom
+
+    for i in range(n - 2, -1, -1):
+        dp[i] = dp[i] - cp[i]*dp[i + 1]
+
+    return dp
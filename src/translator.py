@@ -201,6 +201,60 @@ class Translator:
         return self.alpha_pwm
 
 
+    def get_speed_from_pwm(self, pwm):
+        """Returns the speed that the pwm speed gives. Inverse of get_speed(),
+        interpolates linearly in the list of measurements. """
+        if pwm >= self.speeds[0][0]:
+            return 0
+
+        # Measurements sorted by decreasing pwm, which is increasing speed.
+        for i in range(1, len(self.speeds)):
+            if pwm >= self.speeds[i][0] or i == len(self.speeds) - 1:
+                break
+
+        pwm1, v1 = self.speeds[i - 1]
+        pwm2, v2 = self.speeds[i]
+
+        return v1 + (pwm - pwm1)*(v2 - v1)/float(pwm2 - pwm1)
+
+
+    def get_alpha_from_pwm(self, pwm):
+        """Returns the wheel angle that the pwm angle gives. Inverse of
+        get_angle(): the turning radius is interpolated linearly between the
+        measured radii and the wheel angle calculated from it as in
+        _calc_alphas(). """
+        if pwm == 1500:
+            return 0
+
+        if pwm > 1500:
+            radii = self.listOfLeftKeys     # Sorted by decreasing pwm.
+            pwms = self.ldict
+            sign = 1
+        else:
+            radii = self.listOfRightKeys    # Sorted by increasing pwm.
+            pwms = self.rdict
+            sign = -1
+
+        # Pairs of pwm and radius, from straight ahead to the sharpest turn.
+        pairs = sorted([[abs(pwms[r] - 1500), r] for r in radii])
+        d = abs(pwm - 1500)
+
+        i = 1
+        while i < len(pairs) - 1 and d > pairs[i][0]:
+            i += 1
+
+        d1, r1 = pairs[i - 1]
+        d2, r2 = pairs[i]
+        r = r1 + (d - d1)*(r2 - r1)/float(d2 - d1)
+
+        if r > self.l/2:
+            alpha = math.atan(self.l/math.sqrt(r**2 - (self.l/2)**2))
+        else:
+            alpha = self.alpha_max
+
+        return sign*min(alpha, self.alpha_max)
+
+
     def getAngle(self):
         return self.alpha_pwm
 
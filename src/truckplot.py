@@ -11,6 +11,8 @@ import rospy
 import time
 import Tkinter as tk
 import path
+import pathfield
+import pathcache
 import math
 import os
 
@@ -33,7 +35,9 @@ class TruckPlot():
         self.topic_name = topic_name    # Subscriber topic name.
         self.topic_type = topic_type    # Subscriber topic type.
 
-        self.pt = path.Path()       # A fixed path to draw.
+        self.pt = path.EllipsePath()    # A fixed path to draw.
+        self.field = None               # Raster for projecting on the path.
+        self.path_cache = pathcache.PathCache() # Generated paths.
         self.recording = False
         self.timestamp = 0
         self.rec_start_time = 0
@@ -392,18 +396,34 @@ class TruckPlot():
         self.canv.delete('closest')
 
         if self.display_closest and self.display_path:
+            active = [i for i in range(len(self.trucks))
+                      if self.truck_active[i]]
+            if len(active) == 0:
+                return
 
-            for i in range(len(self.trucks)):
-                if self.truck_active[i]:
-                    self._draw_closest_point(
-                        [self.new_data[i][0], self.new_data[i][1]],
-                        self.truck_colors[i])
+            xys = [[self.new_data[i][0], self.new_data[i][1]] for i in active]
+
+            # Find the closest points of all trucks at once.
+            if self.field is not None:
+                closest = [self.field.project(xy).closest for xy in xys]
+            else:
+                _, closest = self.pt.get_closest_batch(xys)
+
+            for i, xy in zip(active, closest):
+                self._draw_cross(xy, self.truck_colors[i])
 
 
     def _draw_closest_point(self, xy, clr = 'blue'):
         """Draw the closest point on the path for coordinates xy. """
+        if self.field is not None:
+            self._draw_cross(self.field.project(xy).closest, clr)
+        else:
+            self._draw_cross(self.pt.project(xy).closest, clr)
+
+
+    def _draw_cross(self, closest, clr = 'blue'):
+        """Draw a cross marking a path point. """
         l = 10
-        _, closest = self.pt.get_closest(xy)
         xp, yp = self._real_to_pixel(closest[0], closest[1])
 
         self.canv.create_line(xp - l, yp - l, xp + l, yp + l, fill = clr,
@@ -644,9 +664,23 @@ class TruckPlot():
                 clr = 'blue', width = 2)
 
 
-    def load_path(self, filename):
-        """Loads a path from a file. """
-        self.pt.load(filename)
+    def load_path(self, filename, use_field = False):
+        """Loads a path from a file, either on the format x,y or in the binary
+        path format. If use_field is True the closest points are looked up in
+        a raster over the displayed area, which is cached next to the path
+        file. """
+        # New path object since the current one may be shared by the cache.
+        self.pt = path.EllipsePath()
+        if path.is_binary_path_file(filename):
+            self.pt.load_binary(filename)
+        else:
+            self.pt.load(filename)
+
+        if use_field:
+            self.field = pathfield.cached_field(self.pt, filename,
+                self.width, self.height)
+        else:
+            self.field = None
         self._draw_path()
 
 
@@ -671,7 +705,9 @@ class TruckPlot():
         self.xc_var.set(self.xc)
         self.yc_var.set(self.yc)
 
-        self.pt.gen_circle_path([self.xr, self.yr], points, [self.xc, self.yc])
+        self.pt = self.path_cache.get_ellipse([self.xr, self.yr], points,
+            [self.xc, self.yc])
+        self.field = None
         self.canv.delete('path')
         self._draw_path()
 
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+# Class for the speed control of a follower truck that keeps a time gap to the
+# truck in front of it.
+
+
+class VelocityPID:
+    """PID controller of the speed of a follower truck. The control error is
+    the difference between the reference time gap e_ref and the time the
+    follower needs to drive the distance to the leader, less distance_offset
+    which compensates for the truck lengths. The output is an offset of the
+    follower speed pwm from the leader speed pwm. The inputs can be given the
+    timestamp of the measurement, in which case the derivative and integral
+    of the error are taken over the measured time since the previous sample,
+    normalized by the nominal sampling period 1/freq. If sum_max is given the
+    accumulated error is limited to +-sum_max to prevent windup. """
+    def __init__(self, k_p = 0, k_i = 0, k_d = 0, e_ref = 0.5,
+        distance_offset = 0.4, freq = 20, sum_max = None):
+        # PID parameters.
+        self.k_p = k_p
+        self.k_i = k_i
+        self.k_d = k_d
+
+        self.e_ref = e_ref                      # Reference time gap.
+        self.distance_offset = distance_offset  # Compensate for truck lengths.
+
+        self.sum_e = 0                  # Accumulated error.
+        self.old_e_rel = 0              # Used for derivative of control error.
+        self.old_timestamp = None       # Time of the previous control error.
+
+        self.freq = freq                # Nominal sampling frequency.
+        self.sum_max = sum_max          # Limit of the accumulated error.
+        self._periods_max = 5           # Longest time between control errors
+                                        # used, in sampling periods.
+
+
+    def get_velocity(self, e_dist, vel, timestamp = None):
+        """Returns the speed pwm offset for the follower truck given the
+        distance e_dist along the path to the leader and the speed vel of the
+        follower. timestamp is the time of the measurement in seconds, if
+        known. """
+        try:
+            e_time = (e_dist - self.distance_offset) / vel
+        except:
+            e_time = e_dist - self.distance_offset
+
+        e_rel = self.e_ref - e_time
+
+        periods = self._periods(timestamp)
+
+        e_p = (e_rel - self.old_e_rel)/periods
+        self.old_e_rel = e_rel
+
+        # Accumulated error, limited to prevent windup if there is a limit.
+        self.sum_e = self.sum_e + e_rel*periods
+        if self.sum_max is not None:
+            self.sum_e = min(max(self.sum_e, - self.sum_max), self.sum_max)
+
+        # PID controller.
+        u = - self.k_p*e_rel - self.k_d*e_p - self.k_i * self.sum_e
+        if e_rel > 0:
+            u = u - 10*self.k_p*e_rel
+
+        return u
+
+
+    def _periods(self, timestamp):
+        """Used internally. Returns the time since the previous control error
+        in nominal sampling periods. Gives one period if the time is unknown
+        or does not increase, and at most _periods_max periods, e.g. after the
+        leader has been standing still. """
+        last = self.old_timestamp
+        self.old_timestamp = timestamp
+
+        if last is None or timestamp is None or timestamp <= last:
+            return 1
+
+        return min((timestamp - last)*self.freq, self._periods_max)
+
+
+    def set_pid(self, kp = None, ki = None, kd = None):
+        """Sets the PID parameters. """
+        if kp is not None:
+            self.k_p = kp
+        if ki is not None:
+            self.k_i = ki
+        if kd is not None:
+            self.k_d = kd
+
+        self.reset_sum()
+
+
+    def get_pid(self):
+        """Returns the PID parameters. """
+        return self.k_p, self.k_i, self.k_d
+
+
+    def reset_sum(self):
+        """Resets the sum for I part in PID controller. """
+        self.sum_e = 0
+
+
+    def get_error(self):
+        """Returns the latest control error. """
+        return self.old_e_rel
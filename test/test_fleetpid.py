@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+# Unit tests of the fleet Frenet path following controller.
+
+import os
+import sys
+import math
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import path
+import fleetpid
+import frenetpid
+
+
+class FleetFrenetPIDTest(unittest.TestCase):
+    """Tests of the fleet controller against one FrenetPID per truck. """
+    def setUp(self):
+        self.pt = path.ArrayPath()
+        self.pt.gen_circle_path([1.7, 1.2], 400, [0.3, -1.3])
+
+        self.N = 5
+        self.gains = [(0.5, 0.1, 2.0), (0.2, 0, 1.0), (1.0, 0.5, 3.0),
+                      (0, 0, 0), (0.7, 0.3, 0.5)]
+
+        # Trucks spread around the path, inside and outside of it, and some
+        # of them driving against the path direction.
+        rs = np.random.RandomState(3)
+        self.theta = np.arange(self.N)*2*math.pi/self.N
+        self.radius = 1 + rs.uniform(-0.15, 0.15, self.N)
+        self.direction = np.array([1, 1, -1, 1, -1])
+        self.vel = rs.uniform(0.5, 1.2, self.N)
+
+
+    def positions(self, i):
+        """Returns the positions, yaws and velocities of all trucks at
+        sample i. """
+        theta = self.theta + 0.04*i*self.direction
+        radius = self.radius + 0.05*np.sin(0.3*i + self.theta)
+        x = 0.3 + 1.7*radius*np.cos(theta)
+        y = -1.3 + 1.2*radius*np.sin(theta)
+        yaw = theta + self.direction*math.pi/2 + 0.2*np.sin(0.5*i + self.theta)
+        return x, y, yaw, self.vel
+
+
+    def compare(self, sum_max = None, samples = 60):
+        """Runs the fleet controller and one FrenetPID per truck on the same
+        positions and checks that the control inputs match. """
+        fleet = fleetpid.FleetFrenetPID(self.pt, self.N, sum_max = sum_max)
+        frenets = []
+        for i, (k_p, k_i, k_d) in enumerate(self.gains):
+            fleet.set_pid(i, k_p, k_i, k_d)
+            frenets.append(frenetpid.FrenetPID(self.pt, k_p, k_i, k_d,
+                                               sum_max = sum_max))
+
+        for i in range(samples):
+            x, y, yaw, vel = self.positions(i)
+            omega = fleet.get_omega(x, y, yaw, vel)
+            alpha = fleet.get_alpha(x, y, yaw, vel)
+
+            for j, frenet in enumerate(frenets):
+                self.assertAlmostEqual(omega[j],
+                    frenet.get_omega(x[j], y[j], yaw[j], vel[j]), 9)
+                self.assertAlmostEqual(alpha[j],
+                    frenet.get_alpha(x[j], y[j], yaw[j], vel[j]), 9)
+                self.assertAlmostEqual(fleet.get_y_error()[j],
+                                       frenet.get_y_error(), 9)
+
+        return fleet
+
+
+    def test_matches_frenet_pid(self):
+        """The fleet gives the control inputs of N FrenetPID controllers. """
+        self.compare()
+
+
+    def test_matches_frenet_pid_limited(self):
+        """The fleet limits the accumulated errors like FrenetPID. """
+        fleet = self.compare(sum_max = 0.5)
+        self.assertTrue(np.any(np.abs(fleet._sumy) == 0.5))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+# Unit tests of the Frenet path following controller.
+
+import os
+import sys
+import math
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import path
+import pathfield
+import frenetpid
+
+
+def _ellipse(radius, points = 400):
+    """Returns a frozen elliptical path centered at (0.3, -1.3). """
+    pt = path.ArrayPath()
+    pt.gen_circle_path(radius, points, [0.3, -1.3])
+    return pt
+
+
+def _samples(count = 40, freq = 20.):
+    """Returns positions, yaws, speeds and timestamps of a truck driving
+    around the center (0.3, -1.3) slightly outside of the test paths. """
+    samples = []
+    for i in range(count):
+        t = i/freq
+        theta = 0.05*i
+        samples.append((0.3 + 1.85*math.cos(theta),
+                        -1.3 + 1.25*math.sin(theta),
+                        theta + math.pi/2 + 0.1*math.sin(i), 0.9,
+                        t + 0.004*math.sin(3*i)))
+    return samples
+
+
+class FrenetPIDWithPathTest(unittest.TestCase):
+    """Tests of changing the reference path of a controller. """
+    def setUp(self):
+        self.pt = _ellipse([1.7, 1.2])
+        self.frenet = frenetpid.FrenetPID(self.pt, 0.5, 0.1, 2.0, freq = 10,
+                                          continuous = True, sum_max = 4.)
+        self.frenet._alpha_max = 0.4
+        self.frenet._alpha_min = -0.3
+        self.frenet._l = 0.3
+        self.frenet._periods_max = 2
+
+        for x, y, yaw, vel, t in _samples(20):
+            self.frenet.get_control(x, y, yaw, vel, t)
+
+
+    def test_settings_kept(self):
+        """The new controller has the gains and settings of the old one and
+        uses the new path. """
+        new_pt = _ellipse([1.5, 1.1])
+        new = self.frenet.with_path(new_pt)
+
+        self.assertIs(new.get_path(), new_pt)
+        self.assertIs(self.frenet.get_path(), self.pt)
+        self.assertEqual(new.get_pid(), self.frenet.get_pid())
+        for name in ['_freq', 'continuous', 'sum_max', '_alpha_max',
+                     '_alpha_min', '_l', '_periods_max']:
+            self.assertEqual(getattr(new, name), getattr(self.frenet, name),
+                             name)
+        self.assertEqual(new._tracker.window, self.frenet._tracker.window)
+        self.assertIsNone(new.get_index())
+        self.assertIsNone(new._projector)
+
+        state = new.get_state()
+        old_state = self.frenet.get_state()
+        old_state.index = None
+        self.assertEqual(state.__getstate__(), old_state.__getstate__())
+
+
+    def test_continues_on_same_path(self):
+        """Switching to the same path does not change the control outputs. """
+        new = self.frenet.with_path(self.pt)
+
+        for x, y, yaw, vel, t in _samples(40)[20:]:
+            self.assertEqual(new.get_control(x, y, yaw, vel, t),
+                             self.frenet.get_control(x, y, yaw, vel, t))
+
+
+    def test_projector_rebuilt(self):
+        """A projector is replaced by one for the new path with the same
+        raster settings, and kept when the path does not change. """
+        field = pathfield.PathField(self.pt, 5, 4, 0.1, [0.3, -1.3])
+        self.frenet.set_projector(field)
+
+        self.assertIs(self.frenet.with_path(self.pt)._projector, field)
+
+        new_pt = _ellipse([1.5, 1.1])
+        new_field = self.frenet.with_path(new_pt)._projector
+        self.assertIs(new_field.pt, new_pt)
+        for name in ['width', 'height', 'resolution', 'xmin', 'ymin', 'nx',
+                     'ny']:
+            self.assertEqual(getattr(new_field, name), getattr(field, name),
+                             name)
+
+
+class FrenetPIDControlTest(unittest.TestCase):
+    """Tests of calculating both control inputs at once. """
+    def test_control_matches_omega_alpha(self):
+        """get_control() gives the values of get_omega() and then
+        get_alpha(), with and without timestamps and limits. """
+        pt = _ellipse([1.7, 1.2])
+        for continuous in [False, True]:
+            for sum_max in [None, 0.2]:
+                frenet = frenetpid.FrenetPID(pt, 0.5, 0.3, 2.0,
+                    continuous = continuous, sum_max = sum_max)
+                separate = frenetpid.FrenetPID(pt, 0.5, 0.3, 2.0,
+                    continuous = continuous, sum_max = sum_max)
+
+                for i, (x, y, yaw, vel, t) in enumerate(_samples()):
+                    if i % 2:
+                        t = None
+                    output = frenet.get_control(x, y, yaw, vel, t)
+                    omega = separate.get_omega(x, y, yaw, vel, t)
+                    alpha = separate.get_alpha(x, y, yaw, vel, t)
+
+                    self.assertAlmostEqual(output.omega, omega, 12)
+                    self.assertAlmostEqual(output.alpha, alpha, 12)
+                    self.assertAlmostEqual(output.ey,
+                                           separate.get_y_error(), 12)
+                    self.assertEqual(output.index, separate.get_index())
+
+
+class FrenetPIDStepTest(unittest.TestCase):
+    """Tests of stepping a controller state outside of the controller. """
+    def setUp(self):
+        self.pt = _ellipse([1.7, 1.2])
+        self.frenet = frenetpid.FrenetPID(self.pt, 0.5, 0.1, 2.0)
+
+
+    def test_step_matches_get_control(self):
+        """Stepping a state by the time between the samples gives the outputs
+        and state of get_control() with the sample timestamps, and leaves the
+        controller unchanged. """
+        frenet = frenetpid.FrenetPID(self.pt, 0.5, 0.1, 2.0)
+        state = frenet.get_state()
+        last = None
+
+        for x, y, yaw, vel, t in _samples():
+            output = self.frenet.get_control(x, y, yaw, vel, t)
+
+            if last is None:
+                dt = 1./20              # The first sample is one period.
+            else:
+                dt = t - last
+            state, step_output = frenet.step(state, (x, y, yaw), vel, dt)
+            last = t
+
+            for value, step_value in zip(output, step_output):
+                self.assertAlmostEqual(value, step_value, 12)
+
+            new = self.frenet.get_state()
+            for name in ['ey', 'sumy', 'sumy_alpha', 'alpha', 'index']:
+                self.assertAlmostEqual(getattr(new, name),
+                                       getattr(state, name), 12, name)
+
+        self.assertIsNone(frenet.get_index())
+        self.assertEqual(frenet.get_state().__getstate__(),
+                         frenetpid.FrenetState().__getstate__())
+
+
+    def test_step_integrates_long_dt(self):
+        """step() integrates all of dt, also beyond the limit get_control()
+        puts on the time between samples. """
+        x, y, yaw, vel, t = _samples()[0]
+        state, output = self.frenet.step(frenetpid.FrenetState(),
+                                         (x, y, yaw), vel, 2.)
+        self.assertAlmostEqual(state.sumy, output.ey*2.*20, 12)
+        self.assertAlmostEqual(state.sumy_alpha, output.ey*2.*20, 12)
+
+
+    def test_step_rejects_non_positive_dt(self):
+        """step() raises a ValueError for a dt that is not positive. """
+        x, y, yaw, vel, t = _samples()[0]
+        for dt in [0, -0.05]:
+            self.assertRaises(ValueError, self.frenet.step,
+                              frenetpid.FrenetState(), (x, y, yaw), vel, dt)
+
+
+class ParseSumMaxTest(unittest.TestCase):
+    """Tests of reading a limit of the accumulated errors from text. """
+    def test_parse(self):
+        """Numbers are limits and empty values or None mean no limit. """
+        self.assertEqual(frenetpid.parse_sum_max('2.5'), 2.5)
+        self.assertEqual(frenetpid.parse_sum_max(0), 0)
+        for value in [None, 'None', '', ' ']:
+            self.assertIsNone(frenetpid.parse_sum_max(value))
+        for value in ['-1', 'x']:
+            self.assertRaises(ValueError, frenetpid.parse_sum_max, value)
+
+
+if __name__ == '__main__':
+    unittest.main()
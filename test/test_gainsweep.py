@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+# Unit tests of the gain sweep.
+
+import os
+import sys
+import math
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import gainsweep
+
+
+class GainSweepTest(unittest.TestCase):
+    """Tests of simulating and caching gains. """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache_file = os.path.join(self.directory, 'cache.json')
+        self.scenario = {'duration': 5}
+
+        self.simulate = gainsweep._simulate
+        self.velocitypid = gainsweep.velocitypid
+        self.calls = []
+
+
+    def tearDown(self):
+        gainsweep._simulate = self.simulate
+        gainsweep.velocitypid = self.velocitypid
+        shutil.rmtree(self.directory)
+
+
+    def sweep(self):
+        """Returns a sweep in this process with the cache file. """
+        return gainsweep.GainSweep(self.scenario, processes = 1,
+                                   cache_file = self.cache_file)
+
+
+    def failing(self, args):
+        """Simulates as _simulate() but fails for negative k_pv. """
+        self.calls.append(args[0])
+        if args[0].get('k_pv', 0) < 0:
+            return float('inf'), float('inf')
+        return self.simulate(args)
+
+
+    def test_simulate_headless(self):
+        """The sweep simulates without ROS and caches the results in the
+        cache file. """
+        results = self.sweep().grid({'k_pv': [5, 10]})
+        self.assertEqual(len(results), 2)
+        for r in results:
+            self.assertFalse(math.isinf(r.score))
+            self.assertAlmostEqual(r.score, r.lateral + 0.1*r.gap, 12)
+
+        self.assertEqual(self.sweep().ranked(), results)
+
+
+    def test_failures_not_cached(self):
+        """Failed simulations are returned with an infinite score, but are
+        neither cached nor saved, so they are simulated again. """
+        gainsweep._simulate = self.failing
+
+        results = self.sweep().evaluate([{'k_pv': -1}, {'k_pv': 10}])
+        self.assertEqual(results[0].params, {'k_pv': 10})
+        self.assertEqual(results[1].params, {'k_pv': -1})
+        self.assertTrue(math.isinf(results[1].score))
+
+        sweep = self.sweep()
+        self.assertEqual(sweep.ranked(), results[:1])
+
+        self.calls = []
+        results = sweep.evaluate([{'k_pv': -1}, {'k_pv': 10}])
+        self.assertEqual(self.calls, [{'k_pv': -1}])
+        self.assertTrue(math.isinf(results[1].score))
+
+
+    def test_import_error_raised(self):
+        """A missing module stops the sweep instead of failing each set of
+        gains. """
+        class Missing:
+            def __getattr__(self, name):
+                raise ImportError('No module named velocitypid')
+
+        gainsweep.velocitypid = Missing()
+
+        self.assertRaises(ImportError, self.sweep().evaluate, [{}])
+        self.assertFalse(os.path.exists(self.cache_file))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+
+# Unit tests of the path classes.
+
+import os
+import sys
+import math
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import path
+
+
+def _wavy_points(points = 500):
+    """Returns a list of the points of a closed path with varying curvature,
+    so that the values of neighbouring points differ. """
+    t = 2*math.pi*np.arange(points)/points
+    r = 1.5 + 0.3*np.sin(3*t)
+    return np.column_stack((0.2 + r*np.cos(t), -1 + 1.2*r*np.sin(t))).tolist()
+
+
+def _load_points(pt, points):
+    """Loads the points into the path pt through a text file. """
+    directory = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(directory, 'path.txt')
+        with open(filename, 'w') as f:
+            for xy in points:
+                f.write('{!r},{!r}\n'.format(xy[0], xy[1]))
+        pt.load(filename)
+    finally:
+        shutil.rmtree(directory)
+
+    return pt
+
+
+def _ellipse(radius, center = [0.3, -1.3], points = 400):
+    """Returns a generated EllipsePath. """
+    pt = path.EllipsePath()
+    pt.gen_circle_path(radius, points, center)
+    return pt
+
+
+def _brute_force_distance(pt, xy):
+    """Returns the distance from xy to the closest point on the ellipse pt,
+    found by sampling the ellipse densely and refining the samples around
+    each local minimum of the distance twice. """
+    def distance(theta):
+        return np.hypot(pt.xc + pt.xr*np.cos(theta) - xy[0],
+                        pt.yc + pt.yr*np.sin(theta) - xy[1])
+
+    step = 2*math.pi/20000
+    theta = np.arange(20000)*step
+    d = distance(theta)
+    minima = (d <= np.roll(d, 1)) & (d <= np.roll(d, -1))
+
+    # An ellipse has at most four local minima, but ties of the sampled
+    # distances can give more.
+    best = np.min(d)
+    for t in theta[minima][np.argsort(d[minima])[:8]]:
+        width = 2*step
+        for i in range(2):
+            fine = t + np.linspace(- width, width, 4001)
+            d = distance(fine)
+            t = fine[np.argmin(d)]
+            best = min(best, np.min(d))
+            width = width/1000
+
+    return best
+
+
+class PathTest(unittest.TestCase):
+    """Tests of the queries of Path and ArrayPath against direct
+    calculations. """
+    def setUp(self):
+        rand = np.random.RandomState(0)
+        self.points = _wavy_points()
+        self.xy = np.column_stack((rand.uniform(-3, 3, 300),
+                                   rand.uniform(-4, 2, 300)))
+
+
+    def test_closest_matches_linear_search(self):
+        """The spatial index gives a point at the same distance as a search
+        over all points, also for points far from the path. """
+        xy = np.vstack((self.xy, [[40, 3], [-25, -60]]))
+        points = np.array(self.points)
+
+        for cls in [path.Path, path.ArrayPath]:
+            pt = _load_points(cls(), self.points)
+            self.assertIsNotNone(pt._index)
+
+            for p in xy:
+                index, closest = pt.get_closest(p)
+                d = np.hypot(points[:, 0] - p[0], points[:, 1] - p[1])
+                self.assertEqual(math.hypot(closest[0] - p[0],
+                                            closest[1] - p[1]), np.min(d))
+                self.assertEqual(list(closest), self.points[index])
+
+
+    def test_array_path_matches_path(self):
+        """ArrayPath calculates the same values as Path to rounding when
+        loading, generating, reversing and interpolating paths. """
+        loaded = [_load_points(cls(), self.points)
+                  for cls in [path.Path, path.ArrayPath]]
+        generated = [cls() for cls in [path.Path, path.ArrayPath]]
+        for pt in generated:
+            pt.gen_circle_path([1.7, 1.2], 400, [0.3, -1.3])
+
+        for pt, array_pt in [loaded, generated]:
+            for change in [None, 'reverse', 'interpolate']:
+                if change is not None:
+                    getattr(pt, change)()
+                    getattr(array_pt, change)()
+
+                for name in ['path', 'gamma', 'gammap', 'gammapp',
+                             'arclength']:
+                    np.testing.assert_allclose(getattr(array_pt, name),
+                        np.array(getattr(pt, name), dtype = float),
+                        rtol = 1e-9, atol = 1e-10, err_msg = name)
+                self.assertAlmostEqual(array_pt.length, pt.length, 12)
+
+
+    def test_distance_matches_walk(self):
+        """The distance from the arc lengths is the same as summing the
+        segments from i1 back along the path to i2, including the segment
+        leading up to i2. """
+        for cls in [path.Path, path.ArrayPath]:
+            pt = _load_points(cls(), self.points)
+            N = len(self.points)
+
+            for i1, i2 in [(10, 3), (3, 10), (0, 0), (7, 7), (0, N - 1),
+                           (N - 1, 0), (N + 5, -2)]:
+                # The walk of the previous implementation.
+                walk = 0
+                i = i1 % N
+                i_lower = i2 % N if i2 % N < i % N else i2 % N - N
+                while i >= i_lower:
+                    walk += pt._distance((i - 1) % N, i % N)
+                    i -= 1
+
+                self.assertAlmostEqual(pt.get_distance_from_indices(i1, i2),
+                                       walk, 10)
+
+            i1 = np.arange(-N, 2*N, 7)
+            i2 = i1[::-1]
+            np.testing.assert_allclose(
+                pt.get_distance_from_indices_batch(i1, i2),
+                [pt.get_distance_from_indices(a, b) for a, b in zip(i1, i2)],
+                rtol = 0, atol = 1e-12)
+
+
+    def test_project_batch_matches_project(self):
+        """project_batch() and get_closest_batch() give the values of
+        project() and get_closest() for each point, on list and array backed
+        paths and on analytic and loaded ellipses. """
+        ellipse = _ellipse([1.7, 1.2])
+        loaded = _load_points(path.EllipsePath(), ellipse.path.tolist())
+        paths = [_load_points(path.Path(), self.points),
+                 _load_points(path.ArrayPath(), self.points), ellipse, loaded]
+
+        for pt in paths:
+            batch = pt.project_batch(self.xy)
+            indices, closest = pt.get_closest_batch(self.xy)
+            np.testing.assert_array_equal(indices, batch.index)
+            np.testing.assert_array_equal(closest, batch.closest)
+
+            for i, p in enumerate(self.xy):
+                proj = pt.project(p)
+                self.assertEqual(batch.index[i], proj.index)
+                self.assertEqual(batch.left[i], proj.left)
+                self.assertEqual(pt.get_closest(p)[0], proj.index)
+                for name in ['closest', 'ey', 'gamma', 'gammap', 'gammapp']:
+                    np.testing.assert_allclose(getattr(batch, name)[i],
+                        getattr(proj, name), rtol = 0, atol = 1e-9,
+                        err_msg = name)
+
+            np.testing.assert_array_equal(pt.get_ey_batch(self.xy),
+                                          batch.ey)
+
+
+    def test_frenet_transform_matches_project_segment(self):
+        """frenet_transform() gives the index, arc length, y error and heading
+        error of project_segment() for each sample, with the arc length
+        unwrapped over several laps. """
+        rand = np.random.RandomState(1)
+        points = np.array(self.points)
+        samples = np.arange(0, 3*len(points), 7) % len(points)
+        xy = points[samples] + rand.normal(0, 0.01, (len(samples), 2))
+        yaw = rand.uniform(-math.pi, math.pi, len(samples))
+
+        for cls in [path.Path, path.ArrayPath]:
+            pt = _load_points(cls(), self.points)
+            frenet = pt.frenet_transform(np.column_stack((xy, yaw)))
+
+            self.assertTrue(np.all(np.diff(frenet.s) > 0))
+            self.assertAlmostEqual(frenet.s[-1] - frenet.s[0],
+                                   3*pt.length, delta = pt.length/10)
+
+            for i, p in enumerate(xy):
+                proj = pt.project_segment(p)
+                self.assertEqual(frenet.index[i], proj.index)
+                self.assertAlmostEqual(frenet.s[i] % pt.length,
+                                       proj.s % pt.length, 9)
+                self.assertAlmostEqual(frenet.ey[i], proj.ey, 9)
+
+                heading = (yaw[i] - proj.gamma + math.pi) % (2*math.pi) - \
+                    math.pi
+                self.assertAlmostEqual(frenet.heading[i], heading, 9)
+
+
+class PathEditTest(unittest.TestCase):
+    """Tests of editing the points of paths. """
+    def test_edit_down_and_freeze(self):
+        """A path edited down to a few points keeps the type of its values
+        and can be frozen. """
+        for cls in [path.Path, path.ArrayPath, path.EllipsePath]:
+            for points in [5, 2, 1, 0]:
+                pt = cls()
+                pt.gen_circle_path([1, 1], 100)
+                for i in range(100 - points):
+                    pt.delete_point(0)
+
+                self.assertEqual(len(pt.path), points)
+                for name in ['gamma', 'gammap', 'gammapp', 'arclength']:
+                    self.assertEqual(len(getattr(pt, name)), points)
+                    if cls is not path.Path:
+                        self.assertIsInstance(getattr(pt, name), np.ndarray)
+
+                pt.freeze()
+                self.assertTrue(pt.frozen)
+                self.assertRaises(RuntimeError, pt.append_point, [0, 0])
+
+
+    def test_build_up_from_nothing(self):
+        """Appending points one at a time to an empty path gives the values
+        of loading all of them at once. """
+        points = _wavy_points(20)
+        for cls in [path.Path, path.ArrayPath]:
+            pt = cls()
+            for xy in points:
+                pt.append_point(xy)
+
+            self.assert_same_values(pt, _load_points(cls(), points))
+
+
+    def test_edits_match_full_calculation(self):
+        """Inserting, moving and deleting points gives the same values and
+        closest points as calculating the edited path from scratch. """
+        rand = np.random.RandomState(0)
+        for cls in [path.Path, path.ArrayPath]:
+            points = _wavy_points(200)
+            pt = _load_points(cls(), points)
+
+            for i in range(30):
+                index = rand.randint(len(points))
+                xy = list(rand.uniform(-2, 2, 2))
+                edit = i % 4
+                if edit == 0:
+                    pt.insert_point(index, xy)
+                    points.insert(index, xy)
+                elif edit == 1:
+                    pt.move_point(index, xy)
+                    points[index] = xy
+                elif edit == 2:
+                    pt.delete_point(index)
+                    del points[index]
+                else:
+                    pt.append_point(xy)
+                    points.append(xy)
+
+                self.assert_same_values(pt, _load_points(cls(), points))
+
+            for p in np.column_stack((rand.uniform(-3, 3, 100),
+                                      rand.uniform(-4, 2, 100))):
+                index, closest = pt.get_closest(p)
+                d = [math.hypot(q[0] - p[0], q[1] - p[1]) for q in points]
+                self.assertEqual(math.hypot(closest[0] - p[0],
+                                            closest[1] - p[1]), min(d))
+
+
+    def assert_same_values(self, pt, expected):
+        """Checks that the points and values of pt are those of expected. """
+        for name in ['path', 'gamma', 'gammap', 'gammapp', 'arclength']:
+            np.testing.assert_allclose(
+                np.array(getattr(pt, name), dtype = float),
+                np.array(getattr(expected, name), dtype = float),
+                rtol = 0, atol = 1e-9, err_msg = name)
+        self.assertAlmostEqual(pt.length, expected.length, 9)
+
+
+class BinaryPathTest(unittest.TestCase):
+    """Tests of saving and loading paths in the binary format. """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'path.bin')
+
+        rand = np.random.RandomState(0)
+        self.xy = np.column_stack((rand.uniform(-3, 3, 200),
+                                   rand.uniform(-4, 2, 200)))
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def assert_same_path(self, loaded, pt):
+        """Checks that the loaded path has the values of pt and answers the
+        queries the same. """
+        for name in ['path', 'gamma', 'gammap', 'gammapp', 'arclength']:
+            np.testing.assert_array_equal(getattr(loaded, name),
+                np.array(getattr(pt, name), dtype = float), err_msg = name)
+        self.assertEqual(loaded.length, pt.length)
+        self.assertEqual([loaded.xr, loaded.yr, loaded.xc, loaded.yc],
+                         [pt.xr, pt.yr, pt.xc, pt.yc])
+
+        for p in self.xy:
+            self.assertEqual(loaded.get_closest(p)[0], pt.get_closest(p)[0])
+            self.assertEqual(loaded.project(p).ey, pt.project(p).ey)
+
+
+    def test_round_trip(self):
+        """A path saved with save_binary() loads with the same values and
+        the stored spatial index, for paths with and without an index. """
+        for use_index in [True, False]:
+            pt = _load_points(path.Path(use_index), _wavy_points())
+            pt.save_binary(self.filename)
+            self.assertTrue(path.is_binary_path_file(self.filename))
+
+            loaded = path.ArrayPath()
+            loaded.load_binary(self.filename)
+            self.assert_same_path(loaded, pt)
+            self.assertIsNotNone(loaded._index)
+            self.assertFalse(loaded.path.flags.writeable)
+
+
+    def test_ellipse_round_trip(self):
+        """A generated ellipse loads as an analytic ellipse, also when it has
+        been reversed. """
+        for reverse in [False, True]:
+            pt = _ellipse([1.7, 1.2])
+            if reverse:
+                pt.reverse()
+            pt.save_binary(self.filename)
+
+            loaded = path.EllipsePath()
+            loaded.load_binary(self.filename)
+            self.assertTrue(loaded._analytic)
+            self.assert_same_path(loaded, pt)
+
+
+    def test_corrupt_file(self):
+        """A file with a wrong checksum or that is not a binary path file is
+        not loaded and leaves the path unchanged. """
+        pt = _load_points(path.Path(), _wavy_points())
+        pt.save_binary(self.filename)
+        with open(self.filename, 'r+b') as f:
+            f.seek(-3, os.SEEK_END)
+            f.write('xyz')
+
+        loaded = path.ArrayPath()
+        loaded.gen_circle_path([1, 1], 10)
+        loaded.load_binary(self.filename)
+        self.assertEqual(len(loaded.path), 10)
+
+        text = os.path.join(self.directory, 'path.txt')
+        pt.save(text)
+        self.assertFalse(path.is_binary_path_file(text))
+        loaded.load_binary(text)
+        self.assertEqual(len(loaded.path), 10)
+
+
+class EllipsePathTest(unittest.TestCase):
+    """Tests of the analytic closest point of EllipsePath. """
+    def setUp(self):
+        self.pt = _ellipse([1.7, 1.2])
+
+        rand = np.random.RandomState(0)
+        self.xy = np.column_stack((rand.uniform(-3, 3, 2000),
+                                   rand.uniform(-4, 2, 2000)))
+
+
+    def test_batch_matches_scalar(self):
+        """The batched solver stops on a converged Newton step, not on a
+        bisection step, and gives the same angles as the scalar one. """
+        batch = self.pt._closest_theta_batch(self.xy)
+        scalar = np.array([self.pt._closest_theta(p) for p in self.xy])
+
+        diff = np.mod(batch - scalar + math.pi, 2*math.pi) - math.pi
+        self.assertLess(np.max(np.abs(diff)), 1e-10)
+
+
+    def test_closest_brute_force(self):
+        """The closest point is as close as the closest of a dense sampling
+        of the ellipse, for random points, points on the axes inside and
+        outside the evolute and the center, with the major axis along x or y
+        and for a circle. """
+        rand = np.random.RandomState(1)
+        for radius in [[1.7, 1.2], [1.2, 1.7], [1.5, 1.5]]:
+            pt = _ellipse(radius)
+            a, b = radius
+
+            offsets = [[0, 0]]
+            for r in [0.01, 0.3, 0.6, 1, 1.5, 2.5]:
+                offsets += [[r, 0], [- r, 0], [0, r], [0, - r]]
+            offsets += list(np.column_stack((rand.uniform(-3, 3, 50),
+                                             rand.uniform(-3, 3, 50))))
+            offsets += [[a*math.cos(t), b*math.sin(t)]
+                        for t in rand.uniform(- math.pi, math.pi, 10)]
+            xy = np.array(offsets) + [pt.xc, pt.yc]
+
+            batch = pt._closest_theta_batch(xy)
+            for p, theta_batch in zip(xy, batch):
+                best = _brute_force_distance(pt, p)
+                for theta in [pt._closest_theta(p), theta_batch]:
+                    closest = pt._theta_point(theta)
+                    distance = math.hypot(closest[0] - p[0],
+                                          closest[1] - p[1])
+                    self.assertLess(distance - best, 1e-8,
+                                    msg = '{} {}'.format(radius, p))
+
+
+if __name__ == '__main__':
+    unittest.main()
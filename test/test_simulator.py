@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+
+# Unit tests of the headless simulator.
+
+import os
+import sys
+import math
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import pathcache
+import frenetpid
+import simulator
+import velocitypid
+
+try:
+    import controller_platooning
+except ImportError:
+    controller_platooning = None
+
+
+def _trucks():
+    """Returns a leader and a follower truck starting near the path. """
+    return [simulator.SimulatedTruck(2.0, -1.3, math.pi/2),
+            simulator.SimulatedTruck(1.9, -2.1, math.pi/2)]
+
+
+class SimulatorTest(unittest.TestCase):
+    """Tests of the platoon simulation without ROS. """
+    def run_pid(self, sum_max = None, duration = 30):
+        """Returns the history of a platoon driven by run_platoon_pid(). """
+        sim = simulator.Simulator(_trucks(), 0.05)
+        pt = pathcache.PathCache().get_ellipse([1.7, 1.2], 400, [0.3, -1.3])
+        frenets = [frenetpid.FrenetPID(pt, 0.5, -0.02, 3, sum_max = sum_max)
+                   for i in range(2)]
+        velocity = velocitypid.VelocityPID(10, 1, 5, 0.5, sum_max = sum_max)
+        sim.run_platoon_pid(frenets, velocity, 0.89, duration)
+        return sim.get_history()
+
+
+    def test_platoon_follows(self):
+        """The follower keeps driving behind the leader. """
+        history = self.run_pid()
+        self.assertEqual(history.shape, (600, 9))
+        self.assertTrue(np.all(history[-100:, 8] > 0))
+
+
+    @unittest.skipIf(controller_platooning is None, 'needs ROS')
+    def test_matches_controller(self):
+        """run_platoon_pid() drives the trucks as the platooning
+        controller. """
+        for sum_max in [None, 3.]:
+            sim = simulator.Simulator(_trucks(), 0.05)
+            controller = controller_platooning.Controller(
+                None, None, None, None, None,
+                v = 0.89, k_p1 = 0.5, k_i1 = -0.02, k_d1 = 3,
+                k_p2 = 0.5, k_i2 = -0.02, k_d2 = 3,
+                k_pv = 10, k_iv = 1, k_dv = 5, e_ref = 0.5,
+                sum_max = sum_max, publisher = sim, verbose = False)
+            controller.set_reference_path([1.7, 1.2], [0.3, -1.3])
+            sim.run_platoon(controller, 30)
+
+            np.testing.assert_array_equal(sim.get_history(),
+                                          self.run_pid(sum_max))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Unit tests of the spline path.
+
+import os
+import sys
+import math
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'src'))
+
+import path
+import splinepath
+
+
+def _knots(points = 40):
+    """Returns the points of a hand drawn like closed path. """
+    t = 2*math.pi*np.arange(points)/points
+    return np.column_stack((0.3 + 1.5*np.cos(t) + 0.05*np.sin(7*t),
+                            -1.3 + np.sin(t)))
+
+
+class SplinePathBinaryTest(unittest.TestCase):
+    """Tests of saving and loading spline paths in the binary format. """
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'path.bin')
+
+        self.pt = splinepath.SplinePath()
+        self.pt.fit(_knots(), 200)
+
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+
+    def load(self):
+        """Returns the path loaded from the file as a SplinePath. """
+        loaded = splinepath.SplinePath()
+        loaded.load_binary(self.filename)
+        return loaded
+
+
+    def test_round_trip_keeps_spline(self):
+        """A loaded spline path has the knots of the saved one, and
+        recalculating the path gives the same values as for the saved path
+        instead of fitting a new spline through the sampled points. """
+        self.pt.save_binary(self.filename)
+        loaded = self.load()
+
+        np.testing.assert_array_equal(loaded.knots, self.pt.knots)
+        self.assertEqual(loaded.spline_length, self.pt.spline_length)
+        np.testing.assert_array_equal(loaded.path, self.pt.path)
+
+        for change in ['reverse', 'reverse', 'reverse', 'interpolate',
+                       'resample']:
+            getattr(loaded, change)()
+            getattr(self.pt, change)()
+
+            for name in ['path', 'gamma', 'gammap', 'gammapp']:
+                np.testing.assert_array_equal(getattr(loaded, name),
+                    getattr(self.pt, name), err_msg = change + ' ' + name)
+
+
+    def test_edited_spline_saves_no_knots(self):
+        """After editing the points the spline is dropped, so the old knots
+        are not saved with the edited points. """
+        self.pt.move_point(5, [0, 0])
+        self.pt.save_binary(self.filename)
+
+        loaded = self.load()
+        self.assertEqual(len(loaded.knots), 0)
+        self.assertIsNone(loaded._coeffs)
+        np.testing.assert_array_equal(loaded.path, self.pt.path)
+
+
+    def test_path_without_knots(self):
+        """A file saved from another path loads in a SplinePath without a
+        spline, and a spline path file loads in an ArrayPath. """
+        pt = path.ArrayPath()
+        pt.gen_circle_path([1.7, 1.2], 100, [0.3, -1.3])
+        pt.save_binary(self.filename)
+
+        loaded = self.load()
+        self.assertIsNone(loaded._coeffs)
+        np.testing.assert_array_equal(loaded.path, pt.path)
+
+        self.pt.save_binary(self.filename)
+        array_pt = path.ArrayPath()
+        array_pt.load_binary(self.filename)
+        np.testing.assert_array_equal(array_pt.path, self.pt.path)
+        np.testing.assert_array_equal(array_pt.gammap, self.pt.gammap)
+
+
+if __name__ == '__main__':
+    unittest.main()